@@ -1,9 +1,15 @@
 from flask import Flask, render_template, jsonify, request
-import MetaTrader5 as mt5
-import pandas as pd
 from datetime import datetime
-import pytz
 import logging
+import os
+import threading
+import time
+
+from data_collector.bars import rates_to_rows
+from data_collector.gateway import load_gateway
+
+# MT5网关：默认连接MetaTrader5终端，MT5_GATEWAY=synthetic 时使用模拟行情
+mt5 = load_gateway(os.getenv('MT5_GATEWAY', 'mt5'))
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -16,6 +22,18 @@ TIMEFRAMES = {
     "H1": mt5.TIMEFRAME_H1
 }
 
+# 交易品种列表的刷新间隔（秒）
+SYMBOL_TTL = 300
+
+# 后台轮询的间隔（秒），以及订阅多久未被请求后过期
+POLL_INTERVAL = 1.0
+SUBSCRIPTION_IDLE = 120
+# 首次请求某个图表时等待后台读取的最长时间（秒）
+FIRST_FETCH_TIMEOUT = 10.0
+
+# MT5终端连接不是线程安全的，所有调用都在此锁内进行
+mt5_lock = threading.RLock()
+
 def initialize_mt5():
     if not mt5.initialize():
         logging.error("MT5初始化失败，请确保MetaTrader5已经启动并登录")
@@ -29,109 +47,205 @@ def initialize_mt5():
     logging.info("MT5初始化成功")
     return True
 
-def get_available_symbols():
-    if not mt5.initialize():
-        logging.error("MT5初始化失败")
-        return []
-    
-    try:
-        # 获取终端信息
-        terminal_info = mt5.terminal_info()
-        if terminal_info is None:
-            logging.error("无法获取终端信息")
-            return []
-        logging.info(f"MT5终端连接状态: {terminal_info.connected}")
-            
-        # 获取所有可用的交易品种
-        symbols = mt5.symbols_get()
+class SymbolRegistry:
+    """交易品种缓存
+
+    启动时通过一次 symbols_get() 读取全部品种及其报价精度，之后按TTL在后台线程刷新，
+    刷新期间继续使用旧数据。品种只在第一次请求其数据时才在市场报价中选择。
+    """
+
+    def __init__(self, ttl=SYMBOL_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.names = frozenset()
+        self.info = {}
+        self.active = []
+        self.selected = set()
+        self.loaded_at = 0.0
+        self.refreshing = False
+
+    def load(self):
+        """读取全部交易品种，失败时保留上一次的结果"""
+        with mt5_lock:
+            if not mt5.initialize():
+                logging.error("MT5初始化失败")
+                return False
+            symbols = mt5.symbols_get()
         if symbols is None:
             logging.error("无法获取交易品种列表")
-            return []
-            
-        # 获取所有已选择的交易品种（在市场报价中可见的）
-        active_symbols = []
-        for symbol in symbols:
-            # 检查该品种是否在市场报价中可见
-            if mt5.symbol_select(symbol.name, True):
-                symbol_info = mt5.symbol_info(symbol.name)
-                if symbol_info and symbol_info.visible:
-                    active_symbols.append(symbol.name)
-                    logging.info(f"找到活跃品种: {symbol.name}")
-        
-        if active_symbols:
-            logging.info(f"找到以下活跃的交易品种: {active_symbols}")
-            return sorted(active_symbols)  # 按字母顺序排序
+            return False
+
+        info = {
+            symbol.name: {'digits': symbol.digits, 'point': symbol.point, 'description': symbol.description}
+            for symbol in symbols
+        }
+        # 在市场报价中可见的品种
+        active = sorted(symbol.name for symbol in symbols if symbol.visible)
+        if active:
+            logging.info(f"找到以下活跃的交易品种: {active}")
         else:
-            logging.warning("未找到活跃的交易品种，尝试获取所有可用的主要货币对")
-            # 如果没有找到活跃的品种，获取所有可用的主要货币对
-            major_symbols = []
-            for symbol in symbols:
-                if (('USD' in symbol.name or 'EUR' in symbol.name or 
-                     'GBP' in symbol.name or 'JPY' in symbol.name) and
-                    mt5.symbol_select(symbol.name, True)):
-                    major_symbols.append(symbol.name)
-            
-            if major_symbols:
-                logging.info(f"找到以下主要货币对: {major_symbols}")
-                return sorted(major_symbols)
-            return []
-        
-    except Exception as e:
-        logging.error(f"获取交易品种信息时出错: {str(e)}")
-        import traceback
-        logging.error(traceback.format_exc())
-        return []
+            logging.warning("未找到活跃的交易品种，使用所有主要货币对")
+            active = sorted(
+                name for name in info
+                if 'USD' in name or 'EUR' in name or 'GBP' in name or 'JPY' in name
+            )
+
+        with self.lock:
+            self.info = info
+            self.names = frozenset(info)
+            self.active = active
+            self.loaded_at = time.time()
+        logging.info(f"交易品种已加载: 共{len(info)}个，活跃{len(active)}个")
+        return True
+
+    def _refresh(self):
+        try:
+            self.load()
+        except Exception as e:
+            logging.error(f"刷新交易品种时出错: {str(e)}")
+        finally:
+            self.refreshing = False
+
+    def ensure_fresh(self):
+        """首次使用时同步加载，过期后在后台刷新"""
+        if not self.loaded_at:
+            self.load()
+            return
+        if time.time() - self.loaded_at < self.ttl:
+            return
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def symbols(self):
+        self.ensure_fresh()
+        return self.active
+
+    def __contains__(self, symbol):
+        self.ensure_fresh()
+        return symbol in self.names
+
+    def digits(self, symbol, default=5):
+        return self.info.get(symbol, {}).get('digits', default)
+
+    def select(self, symbol):
+        """确保品种已在市场报价中选择，每个品种只调用一次 symbol_select"""
+        if symbol in self.selected:
+            return True
+        with mt5_lock:
+            if not mt5.symbol_select(symbol, True):
+                logging.error(f"无法选择交易品种 {symbol}")
+                return False
+        self.selected.add(symbol)
+        return True
+
+
+registry = SymbolRegistry()
 
 def get_candlestick_data(symbol="EURUSD", timeframe=mt5.TIMEFRAME_M1, count=300):
-    if not mt5.initialize():
-        logging.error("MT5连接失败")
-        return None
-    
     # 检查交易品种是否可用
-    symbols = mt5.symbols_get()
-    if symbols is None:
-        logging.error("无法获取交易品种列表")
-        return None
-    
-    symbol_names = [sym.name for sym in symbols]
-    if symbol not in symbol_names:
+    if symbol not in registry:
         logging.error(f"交易品种 {symbol} 不可用")
         return None
-    
-    # 获取UTC时间的数据
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, count)
+    if not registry.select(symbol):
+        return None
+
+    with mt5_lock:
+        # 获取UTC时间的数据
+        rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, count)
     if rates is None:
         logging.error(f"无法获取 {symbol} 的行情数据")
         return None
     
-    logging.info(f"成功获取 {symbol} 的 {count} 根K线数据")
-    
-    # 转换为pandas DataFrame
-    df = pd.DataFrame(rates)
-    
-    # 将时间戳转换为datetime，并设置为UTC时区
-    df['time'] = pd.to_datetime(df['time'], unit='s', utc=True)
-    
-    # 转换为北京时间 (UTC+8)
-    beijing_tz = pytz.timezone('Asia/Shanghai')
-    df['time'] = df['time'].dt.tz_convert(beijing_tz)
-    
-    data = []
-    for _, row in df.iterrows():
-        data.append([
-            row['time'].strftime('%Y-%m-%d %H:%M:%S'),
-            float(row['open']),
-            float(row['close']),
-            float(row['low']),
-            float(row['high']),
-            float(row['tick_volume'])
-        ])
-    
-    return data
+    # 转换为北京时间 (UTC+8) 的 [time, open, close, low, high, volume] 列表
+    return rates_to_rows(rates)
+
+class ChartPoller:
+    """后台轮询浏览器订阅的图表
+
+    唯一的后台线程持有MT5连接，按 POLL_INTERVAL 读取被订阅的 品种/周期 并写入共享缓存，
+    /get_data 只读缓存。超过 SUBSCRIPTION_IDLE 秒没有被请求的订阅不再读取，
+    MT5的负载只取决于被查看的不同图表数量，与打开的页面数无关。
+    """
+
+    def __init__(self, interval=POLL_INTERVAL, idle_timeout=SUBSCRIPTION_IDLE, count=300):
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.count = count
+        self.condition = threading.Condition()
+        # (symbol, timeframe) -> 最近一次被请求的时间
+        self.subscriptions = {}
+        # (symbol, timeframe) -> {'data': rows 或 None, 'updated_at': 时间}
+        self.cache = {}
+        self.wake = threading.Event()
+        self.thread = None
+        self.fetches = 0
+
+    def start(self):
+        with self.condition:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='chart-poller', daemon=True)
+        self.thread.start()
+
+    def get(self, symbol, timeframe):
+        """登记订阅并返回缓存的K线，首次请求时等待后台读取完成"""
+        self.start()
+        key = (symbol, timeframe)
+        with self.condition:
+            self.subscriptions[key] = time.time()
+            if key not in self.cache:
+                self.wake.set()
+                self.condition.wait_for(lambda: key in self.cache, FIRST_FETCH_TIMEOUT)
+            return self.cache.get(key)
+
+    def expire(self, now):
+        """移除空闲的订阅及其缓存"""
+        with self.condition:
+            for key, requested in list(self.subscriptions.items()):
+                if now - requested > self.idle_timeout:
+                    del self.subscriptions[key]
+                    self.cache.pop(key, None)
+                    logging.info(f"订阅已过期: {key[0]} {key[1]}")
+            return list(self.subscriptions)
+
+    def poll(self):
+        for symbol, timeframe in self.expire(time.time()):
+            data = get_candlestick_data(symbol=symbol, timeframe=TIMEFRAMES[timeframe], count=self.count)
+            self.fetches += 1
+            with self.condition:
+                key = (symbol, timeframe)
+                if key not in self.subscriptions:
+                    # 读取期间已过期
+                    continue
+                if data is not None:
+                    self.cache[key] = {'data': data, 'updated_at': time.time()}
+                elif key not in self.cache:
+                    # 首次读取失败也要唤醒等待的请求
+                    self.cache[key] = {'data': None, 'updated_at': None}
+                self.condition.notify_all()
+
+    def run(self):
+        with mt5_lock:
+            initialize_mt5()
+        while True:
+            self.wake.clear()
+            try:
+                self.poll()
+            except Exception as e:
+                logging.error(f"轮询图表数据时出错: {str(e)}")
+                with mt5_lock:
+                    initialize_mt5()
+            self.wake.wait(self.interval)
+
+
+poller = ChartPoller()
 
 @app.route('/')
 def index():
-    symbols = get_available_symbols()
+    symbols = registry.symbols()
     if not symbols:  # 如果没有找到打开的图表
         return "请先在MT5中打开至少一个图表", 400
     return render_template('index.html', symbols=symbols, timeframes=list(TIMEFRAMES.keys()))
@@ -146,10 +260,13 @@ def get_data():
     if timeframe not in TIMEFRAMES:
         return jsonify({'error': '无效的时间周期'})
     
-    data = get_candlestick_data(symbol=symbol, timeframe=TIMEFRAMES[timeframe])
-    if data is None:
+    if symbol not in registry:
+        return jsonify({'error': f'交易品种 {symbol} 不可用'})
+    
+    entry = poller.get(symbol, timeframe)
+    if entry is None or entry['data'] is None:
         return jsonify({'error': '获取数据失败，请检查MT5连接'})
-    return jsonify({'data': data})
+    return jsonify({'data': entry['data'], 'digits': registry.digits(symbol), 'updated_at': entry['updated_at']})
 
 if __name__ == '__main__':
     if initialize_mt5():
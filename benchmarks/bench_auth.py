@@ -0,0 +1,46 @@
+"""每个请求的认证开销：完整JWT校验与已验证令牌缓存命中的对比
+
+用法（在项目根目录执行）：
+    python benchmarks/bench_auth.py
+"""
+import os
+import sys
+import timeit
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server')
+sys.path.insert(0, SERVER_DIR)
+os.chdir(SERVER_DIR)
+
+import app  # noqa: E402
+from token_cache import TokenCache  # noqa: E402
+
+# 模拟少量客户端令牌承担全部请求
+CLIENTS = ('web_client', 'collector', 'tv_box_1', 'tv_box_2')
+
+
+def run(tokens, number: int) -> float:
+    """返回每次校验的平均耗时（秒）"""
+    def verify():
+        for token in tokens:
+            app.decode_token(token)
+    return min(timeit.repeat(verify, number=number, repeat=5)) / (number * len(tokens))
+
+
+def main():
+    tokens = [app.create_access_token(client) for client in CLIENTS]
+    number = 5000
+
+    app.token_cache = TokenCache(max_size=0)
+    uncached = run(tokens, number)
+
+    app.token_cache = TokenCache(max_size=1024, ttl=300)
+    cached = run(tokens, number)
+
+    print(f"{'mode':>10} {'per request(us)':>16}")
+    print(f"{'jwt.decode':>10} {uncached * 1e6:>16.2f}")
+    print(f"{'cached':>10} {cached * 1e6:>16.2f}")
+    print(f"speedup: {uncached / cached:.1f}x, cache stats: {app.token_cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""端到端压测：模拟行情 → 采集端 → FastAPI服务端 → 读取客户端
+
+在本机子进程中启动服务端（使用 server/config.ini 的存储配置，Redis不可用时为内存存储），
+采集端使用 synthetic 网关生成N个品种的行情，多个读取客户端并发查询K线。输出：
+- 写入吞吐：按批量接口上传完整窗口时每秒写入的K线数
+- 读取延迟：采集端运行期间K线查询的 p50/p99
+- 端到端延迟：一笔报价产生到读取客户端第一次看到包含它的K线的时间 p50/p99
+- 服务端统计的数据新鲜度（/api/v1/freshness）：收盘→读取→入库→被查询各环节的延迟
+
+采集端和读取客户端在同一进程中运行，延迟中包含两者争用GIL的部分；用于对比不同版本，
+不代表生产环境的绝对值。
+
+用法（在项目根目录执行，不需要MT5终端）：
+    python benchmarks/bench_pipeline.py --symbols 20 --readers 20 --duration 30
+    python benchmarks/bench_pipeline.py --ticks --json result.json
+
+依赖服务端和采集端的依赖，以及 httpx（见 benchmarks/requirements.txt）。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import httpx
+import pandas as pd
+
+from load_test import percentile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SERVER_DIR = os.path.join(ROOT, 'server')
+sys.path.insert(0, os.path.join(ROOT, 'data_collector'))
+
+from bars import DEFAULT_TIMEZONE  # noqa: E402
+from collector import MT5DataCollector  # noqa: E402
+
+COLLECTOR_CONFIG = """\
+[server]
+url = {url}/api/v1
+api_key = {token}
+
+[mt5]
+symbols = {symbols}
+timeframes = ["M1"]
+
+[gateway]
+backend = synthetic
+seed = 0
+history_bars = {history_bars}
+tick_rate = {tick_rate}
+
+[upload]
+workers = 4
+
+[schedule]
+close_delay = 0.5
+forming_interval = {forming_interval}
+
+[ticks]
+enabled = {ticks}
+interval_ms = 250
+"""
+
+
+def start_server(port: int) -> subprocess.Popen:
+    """在子进程中启动服务端并等待其可用"""
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app:app', '--port', str(port), '--log-level', 'warning'],
+        cwd=SERVER_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.post(f'http://127.0.0.1:{port}/api/v1/token', params={'client_id': 'bench'}, timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('服务端启动超时')
+
+
+def summarize(values: List[float]) -> Dict:
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'p50_ms': round(statistics.median(values) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(max(values) * 1000, 2),
+    }
+
+
+def measure_ingest(collector: MT5DataCollector, bars: int, rounds: int) -> Dict:
+    """把每个品种的完整窗口按批量接口重复上传，返回写入吞吐"""
+    series = [
+        {'symbol': symbol, 'timeframe': 'M1', 'data': collector.get_candlestick_data(symbol, 'M1', bars),
+         'mode': 'replace'}
+        for symbol in collector.symbols
+    ]
+    chunks = [series[i:i + collector.batch_size] for i in range(0, len(series), collector.batch_size)]
+    durations = []
+
+    def send(chunk):
+        start = time.perf_counter()
+        ok = collector.send_batch_to_server(chunk, verbose=False)
+        durations.append(time.perf_counter() - start)
+        return ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(collector.upload_workers) as pool:
+        results = list(pool.map(send, chunks * rounds))
+    elapsed = time.perf_counter() - start
+    total = sum(len(item['data']) for item in series) * rounds
+    return {
+        'bars': total,
+        'requests': len(results),
+        'errors': results.count(False),
+        'bars_per_s': round(total / elapsed),
+        'request': summarize(durations),
+    }
+
+
+class Readers:
+    """并发读取K线，记录查询延迟和每根K线第一次被看到时的端到端延迟"""
+
+    def __init__(self, url: str, token: str, symbols: List[str], gateway, limit: int, interval: float):
+        self.url = url
+        self.token = token
+        self.symbols = symbols
+        self.gateway = gateway
+        self.limit = limit
+        self.interval = interval
+        self.latencies: List[float] = []
+        self.e2e: List[float] = []
+        self.errors = 0
+        self.seen = set()
+        self.epochs: Dict[str, int] = {}
+
+    def bar_epoch(self, text: str) -> int:
+        """北京时间的K线时间字符串转换为UTC秒"""
+        epoch = self.epochs.get(text)
+        if epoch is None:
+            epoch = self.epochs[text] = int(pd.Timestamp(text).tz_localize(DEFAULT_TIMEZONE).timestamp())
+        return epoch
+
+    def observe(self, symbol: str, bar: Dict, seen_at: float):
+        key = (symbol, bar['time'], bar['volume'])
+        if key in self.seen:
+            return
+        self.seen.add(key)
+        tick_msc = self.gateway.tick_time(symbol, self.bar_epoch(bar['time']), int(bar['volume']))
+        if tick_msc is not None:
+            self.e2e.append(max(0.0, seen_at - tick_msc / 1000))
+
+    async def reader(self, client: httpx.AsyncClient, index: int, deadline: float):
+        n = index
+        while time.time() < deadline:
+            symbol = self.symbols[n % len(self.symbols)]
+            n += 1
+            start = time.perf_counter()
+            try:
+                response = await client.get(f'/api/v1/kline/{symbol}/M1', params={'limit': self.limit})
+                response.raise_for_status()
+            except httpx.HTTPError:
+                self.errors += 1
+                continue
+            self.latencies.append(time.perf_counter() - start)
+            data = response.json().get('data') or []
+            if data:
+                self.observe(symbol, data[-1], time.time())
+            await asyncio.sleep(self.interval)
+
+    async def run(self, readers: int, duration: float):
+        limits = httpx.Limits(max_connections=readers, max_keepalive_connections=readers)
+        headers = {'Authorization': f'Bearer {self.token}'}
+        async with httpx.AsyncClient(base_url=self.url, headers=headers, limits=limits, timeout=30) as client:
+            deadline = time.time() + duration
+            await asyncio.gather(*(self.reader(client, i, deadline) for i in range(readers)))
+
+
+def main(args):
+    symbols = [f'SYN{i:03d}' for i in range(args.symbols)]
+    server = None if args.url else start_server(args.port)
+    url = args.url or f'http://127.0.0.1:{args.port}'
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    # 采集端的日志、状态和缓冲文件写入临时目录
+    os.chdir(workdir)
+    try:
+        token = httpx.post(f'{url}/api/v1/token', params={'client_id': 'bench_pipeline'}).json()['access_token']
+        config_path = os.path.join(workdir, 'config.ini')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            f.write(COLLECTOR_CONFIG.format(
+                url=url, token=token, symbols=json.dumps(symbols), history_bars=args.history_bars,
+                tick_rate=args.tick_rate, forming_interval=args.forming_interval,
+                ticks='true' if args.ticks else 'false'
+            ))
+        collector = MT5DataCollector(config_path)
+        logging.getLogger().setLevel(logging.WARNING)
+        collector.mt5.initialize()
+
+        ingest = measure_ingest(collector, args.bars, args.ingest_rounds)
+
+        thread = threading.Thread(target=collector.run, name='collector', daemon=True)
+        thread.start()
+        readers = Readers(url, token, symbols, collector.mt5, args.bars, args.read_interval)
+        asyncio.run(readers.run(args.readers, args.duration))
+        collector.running = False
+        thread.join(timeout=30)
+        freshness = httpx.get(
+            f'{url}/api/v1/freshness', headers={'Authorization': f'Bearer {token}'}
+        ).json()['lags']
+
+        result = {
+            'symbols': args.symbols,
+            'readers': args.readers,
+            'duration_s': args.duration,
+            'mode': 'ticks' if args.ticks else 'schedule',
+            'ingest': ingest,
+            'read': {**summarize(readers.latencies), 'errors': readers.errors,
+                     'rps': round(len(readers.latencies) / args.duration)},
+            'e2e': summarize(readers.e2e),
+            'freshness': freshness,
+        }
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+
+    read, e2e = result['read'], result['e2e']
+    print(f"symbols={args.symbols} readers={args.readers} duration={args.duration}s mode={result['mode']}")
+    print(f"ingest: {ingest['bars']} bars in {ingest['requests']} requests, {ingest['bars_per_s']} bars/s, "
+          f"request p50 {ingest['request'].get('p50_ms')}ms p99 {ingest['request'].get('p99_ms')}ms, "
+          f"errors {ingest['errors']}")
+    print(f"read:   {read['count']} requests, {read['rps']} rps, p50 {read.get('p50_ms')}ms "
+          f"p99 {read.get('p99_ms')}ms, errors {read['errors']}")
+    print(f"e2e:    {e2e['count']} bars, p50 {e2e.get('p50_ms')}ms p99 {e2e.get('p99_ms')}ms "
+          f"max {e2e.get('max_ms')}ms")
+    for stage, lag in freshness.items():
+        print(f"{stage + ':':7} {lag['count']} samples, p50 {lag.get('p50')}s p99 {lag.get('p99')}s")
+    if args.json:
+        with open(os.path.join(ROOT, args.json) if not os.path.isabs(args.json) else args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='使用已启动的服务端，不指定时在本机启动')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--symbols', type=int, default=20, help='模拟品种数')
+    parser.add_argument('--readers', type=int, default=20, help='并发读取客户端数')
+    parser.add_argument('--duration', type=float, default=30, help='采集和读取阶段的时长（秒）')
+    parser.add_argument('--bars', type=int, default=300, help='每次上传和读取的K线数')
+    parser.add_argument('--ingest-rounds', type=int, default=5, help='写入阶段重复上传的轮数')
+    parser.add_argument('--history-bars', type=int, default=2000, help='每个模拟品种的历史M1 K线数')
+    parser.add_argument('--tick-rate', type=float, default=5, help='每个模拟品种每秒的报价笔数')
+    parser.add_argument('--forming-interval', type=float, default=1, help='轮询正在形成的K线的间隔（秒）')
+    parser.add_argument('--ticks', action='store_true', help='采集端使用逐笔模式')
+    parser.add_argument('--read-interval', type=float, default=0.05, help='每个读取客户端两次查询之间的间隔（秒）')
+    parser.add_argument('--json', help='把结果写入JSON文件，便于对比不同版本')
+    main(parser.parse_args())
@@ -0,0 +1,74 @@
+"""K线序列化性能对比：DataFrame.iterrows 与按列批量序列化
+
+用法（在项目根目录执行）：
+    python benchmarks/bench_serializer.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_collector'))
+
+from bars import rates_to_records  # noqa: E402
+
+# 与 MetaTrader5.copy_rates_from_pos 返回的结构化数组一致
+RATES_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'),
+    ('close', '<f8'), ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8'),
+])
+
+
+def make_rates(count: int, start: int = 1700000000) -> np.ndarray:
+    """生成count根M1随机游走K线"""
+    rng = np.random.default_rng(42)
+    close = 100 + np.cumsum(rng.normal(0, 0.1, count))
+    open_ = np.concatenate(([100.0], close[:-1]))
+    rates = np.zeros(count, dtype=RATES_DTYPE)
+    rates['time'] = start + np.arange(count) * 60
+    rates['open'] = open_
+    rates['close'] = close
+    rates['high'] = np.maximum(open_, close) + rng.random(count) * 0.05
+    rates['low'] = np.minimum(open_, close) - rng.random(count) * 0.05
+    rates['tick_volume'] = rng.integers(1, 500, count)
+    return rates
+
+
+def legacy_records(rates: np.ndarray):
+    """原 MT5DataCollector.get_candlestick_data 的实现"""
+    df = pd.DataFrame(rates)
+    df['time'] = pd.to_datetime(df['time'], unit='s', utc=True)
+    beijing_tz = pytz.timezone('Asia/Shanghai')
+    df['time'] = df['time'].dt.tz_convert(beijing_tz)
+    data = []
+    for _, row in df.iterrows():
+        data.append({
+            'time': row['time'].strftime('%Y-%m-%d %H:%M:%S'),
+            'open': float(row['open']),
+            'close': float(row['close']),
+            'high': float(row['high']),
+            'low': float(row['low']),
+            'volume': float(row['tick_volume'])
+        })
+    return data
+
+
+def best_of(func, rates, repeat: int) -> float:
+    return min(timeit.repeat(lambda: func(rates), number=1, repeat=repeat))
+
+
+def main():
+    print(f"{'bars':>8} {'iterrows(ms)':>14} {'vectorized(ms)':>16} {'speedup':>9}")
+    for count, repeat in ((300, 20), (10_000, 5), (100_000, 2)):
+        rates = make_rates(count)
+        assert legacy_records(rates) == rates_to_records(rates)
+        legacy = best_of(legacy_records, rates, repeat)
+        vectorized = best_of(rates_to_records, rates, repeat)
+        print(f"{count:>8} {legacy * 1000:>14.2f} {vectorized * 1000:>16.2f} {legacy / vectorized:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
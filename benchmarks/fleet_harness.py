@@ -0,0 +1,234 @@
+"""采集端集群测试：N个 synthetic 采集端 → FastAPI服务端，停掉其中一个后检查重新分配和交接去重
+
+在同一进程中运行N个启用 [fleet] 的采集端（各自的ID、缓冲文件和状态文件），依次检查：
+- 注册后品种全部分配，且每个采集端本地的品种与服务端分配表一致
+- 新采集端加入后，移走品种的原所有者在新所有者开始上传后被丢弃（去重）
+- 强制停掉一个采集端（不释放租约，模拟进程崩溃）后，租约到期时它的品种分给其余采集端并继续更新
+- 其余采集端正常退出时释放租约
+
+服务端的 [fleet] lease_ttl 决定等待时间（默认30秒，整个测试约1-2分钟）；可以用 --url 指定一个
+lease_ttl 较短的服务端。任一检查失败时以非零状态退出。
+
+用法（在项目根目录执行，不需要MT5终端）：
+    python benchmarks/fleet_harness.py --collectors 3 --symbols 8
+
+依赖服务端和采集端的依赖，以及 httpx（见 benchmarks/requirements.txt）。
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import httpx
+
+from bench_pipeline import start_server
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'data_collector'))
+
+from collector import MT5DataCollector  # noqa: E402
+
+COLLECTOR_CONFIG = """\
+[server]
+url = {url}/api/v1
+api_key = {token}
+
+[mt5]
+symbols = {symbols}
+timeframes = ["M1"]
+
+[gateway]
+backend = synthetic
+seed = {seed}
+history_bars = 500
+tick_rate = 5
+
+[upload]
+spool_path = spool-{{collector_id}}.jsonl
+state_path = collector_state-{{collector_id}}.json
+
+[schedule]
+close_delay = 0.5
+forming_interval = 1
+
+[metrics]
+port = 0
+
+[fleet]
+enabled = true
+collector_id = {collector_id}
+"""
+
+
+class Fleet:
+    """同一进程中运行的一组采集端"""
+
+    def __init__(self, url: str, token: str, symbols: List[str], workdir: str):
+        self.url = url
+        self.token = token
+        self.symbols = symbols
+        self.workdir = workdir
+        self.collectors: Dict[str, MT5DataCollector] = {}
+        self.threads: Dict[str, threading.Thread] = {}
+        self.client = httpx.Client(base_url=f'{url}/api/v1', headers={'Authorization': f'Bearer {token}'})
+
+    def start(self, collector_id: str, seed: int):
+        config_path = os.path.join(self.workdir, f'{collector_id}.ini')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            f.write(COLLECTOR_CONFIG.format(
+                url=self.url, token=self.token, symbols=json.dumps(self.symbols), seed=seed,
+                collector_id=collector_id
+            ))
+        collector = MT5DataCollector(config_path)
+        collector.logger.setLevel(logging.WARNING)
+        thread = threading.Thread(target=collector.run, name=collector_id, daemon=True)
+        self.collectors[collector_id] = collector
+        self.threads[collector_id] = thread
+        thread.start()
+
+    def kill(self, collector_id: str):
+        """停止采集端但不释放租约（模拟进程崩溃）"""
+        collector = self.collectors.pop(collector_id)
+        collector.fleet.release = lambda: None
+        collector.running = False
+        self.threads.pop(collector_id).join(timeout=30)
+
+    def stop(self, collector_id: str):
+        self.collectors.pop(collector_id).running = False
+        self.threads.pop(collector_id).join(timeout=30)
+
+    def state(self) -> Dict:
+        response = self.client.get('/fleet')
+        response.raise_for_status()
+        return response.json()
+
+    def wait(self, description: str, predicate, timeout: float) -> Dict:
+        """轮询服务端分配表直到predicate成立"""
+        deadline = time.time() + timeout
+        while True:
+            state = self.state()
+            if predicate(state):
+                return state
+            if time.time() > deadline:
+                raise AssertionError(f"{description}: {timeout:.0f}秒内未满足，当前分配 {assignment(state)}")
+            time.sleep(0.5)
+
+    def settled(self, state: Dict) -> bool:
+        """分配表只包含运行中的采集端、覆盖全部品种，且各采集端本地已切换到该分配"""
+        owners = assignment(state)
+        return set(owners) == set(self.collectors) and \
+            sorted(s for symbols in owners.values() for s in symbols) == sorted(self.symbols) and \
+            all(collector.symbols == owners[cid] for cid, collector in self.collectors.items())
+
+    def latest_update(self, symbol: str) -> float:
+        response = self.client.get(f'/kline/{symbol}/M1', params={'limit': 1})
+        response.raise_for_status()
+        return float(response.json().get('updated_at') or 0)
+
+    def upload_as(self, collector_id: str, symbol: str) -> Dict:
+        """以指定采集端的身份上传一根K线，返回响应"""
+        bar = {'time': '2000-01-03 00:00:00', 'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0, 'volume': 1}
+        response = self.client.post('/kline', json={
+            'symbol': symbol, 'timeframe': 'M1', 'data': [bar], 'timestamp': '', 'mode': 'merge',
+            'collector': collector_id
+        })
+        response.raise_for_status()
+        return response.json()
+
+
+def assignment(state: Dict) -> Dict[str, List[str]]:
+    return {cid: collector['symbols'] for cid, collector in state['collectors'].items()}
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        raise AssertionError(message)
+    print(f"ok: {message}")
+
+
+def main(args):
+    symbols = [f'SYN{i:03d}' for i in range(args.symbols)]
+    ids = [f'c{i}' for i in range(args.collectors)]
+    server = None if args.url else start_server(args.port)
+    url = args.url or f'http://127.0.0.1:{args.port}'
+    workdir = tempfile.mkdtemp(prefix='fleet_harness_')
+    # 采集端的日志、状态和缓冲文件写入临时目录
+    os.chdir(workdir)
+    fleet = None
+    try:
+        token = httpx.post(f'{url}/api/v1/token', params={'client_id': 'fleet_harness'}).json()['access_token']
+        fleet = Fleet(url, token, symbols, workdir)
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        lease_ttl = fleet.state()['lease_ttl']
+        # 心跳间隔为租约的1/3，分配变化在一次心跳内传到采集端
+        settle = lease_ttl / 3 + 10
+
+        # 1. 除最后一个外的采集端注册，品种全部分配
+        for seed, cid in enumerate(ids[:-1]):
+            fleet.start(cid, seed)
+        state = fleet.wait('初始分配', fleet.settled, settle)
+        print(f"ok: {len(ids) - 1}个采集端分配了全部{len(symbols)}个品种: {assignment(state)}")
+
+        # 2. 最后一个采集端加入，移走品种的原所有者在交接完成后被丢弃
+        before = assignment(state)
+        fleet.start(ids[-1], len(ids) - 1)
+        state = fleet.wait('加入后重新分配', fleet.settled, settle)
+        moved = {
+            symbol: next(cid for cid, owned in before.items() if symbol in owned)
+            for symbol in assignment(state)[ids[-1]]
+        }
+        check(bool(moved), f"{ids[-1]}加入后接手 {sorted(moved)}，其余品种不移动")
+        check(all(set(assignment(state)[cid]) <= set(before[cid]) for cid in before),
+              "原有采集端没有领到新的品种")
+        symbol, previous = sorted(moved.items())[0]
+        # 新所有者已开始上传（交接完成），原所有者的上传被丢弃
+        fleet.wait('交接完成', lambda s: symbol not in s['handovers'], settle)
+        result = fleet.upload_as(previous, symbol)
+        check(result['skipped'] == [symbol] and result['count'] == 0,
+              f"交接完成后原所有者{previous}上传的{symbol}被丢弃")
+        result = fleet.upload_as(ids[-1], symbol)
+        check(result['skipped'] == [] and result['count'] == 1, f"新所有者{ids[-1]}上传的{symbol}被接受")
+
+        # 3. 强制停掉一个采集端，租约到期后它的品种分给其余采集端并继续更新
+        victim = ids[0]
+        orphaned = assignment(state)[victim]
+        killed_at = time.time()
+        fleet.kill(victim)
+        state = fleet.wait('崩溃后重新分配', fleet.settled, lease_ttl + settle)
+        check(victim not in state['collectors'],
+              f"{victim}停止{time.time() - killed_at:.1f}秒后租约过期，{orphaned} 分给 {assignment(state)}")
+        time.sleep(args.update_wait)
+        stale = [s for s in orphaned if fleet.latest_update(s) <= killed_at]
+        check(not stale, f"{victim}的品种由其他采集端继续更新")
+
+        # 4. 正常退出时释放租约，品种立即重新分配
+        leaving = ids[1]
+        fleet.stop(leaving)
+        state = fleet.wait('释放后重新分配', fleet.settled, settle)
+        check(leaving not in state['collectors'], f"{leaving}释放租约后品种立即重新分配: {assignment(state)}")
+        print(f"服务端统计: accepted={state['accepted']} dropped={state['dropped']} expired={state['expired']}")
+    finally:
+        if fleet:
+            for cid in list(fleet.collectors):
+                fleet.stop(cid)
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='使用已启动的服务端，不指定时在本机启动')
+    parser.add_argument('--port', type=int, default=8791)
+    parser.add_argument('--collectors', type=int, default=3, help='采集端数量（至少3个）')
+    parser.add_argument('--symbols', type=int, default=8, help='模拟品种数')
+    parser.add_argument('--update-wait', type=float, default=5, help='重新分配后等待数据更新的时间（秒）')
+    args = parser.parse_args()
+    if args.collectors < 3:
+        parser.error('--collectors 至少为3')
+    main(args)
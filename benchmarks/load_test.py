@@ -0,0 +1,87 @@
+"""K线查询接口压测：并发数从1增加到500时的延迟分布
+
+先启动服务端（建议使用Redis模式），再执行：
+    python benchmarks/load_test.py --url http://127.0.0.1:8000
+
+依赖 httpx（见 benchmarks/requirements.txt）。
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import httpx
+
+CONCURRENCY_LEVELS = (1, 10, 50, 100, 200, 500)
+
+
+def make_bars(count: int) -> List[dict]:
+    start = 1700000000
+    bars = []
+    for i in range(count):
+        t = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start + i * 60))
+        bars.append({'time': t, 'open': 100.0, 'close': 100.5, 'high': 101.0, 'low': 99.5, 'volume': 10.0})
+    return bars
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_level(client: httpx.AsyncClient, path: str, concurrency: int, requests_per_worker: int):
+    """以指定并发数发送请求，返回 (成功请求的延迟列表, 失败数)"""
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for _ in range(requests_per_worker):
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=max(CONCURRENCY_LEVELS), max_keepalive_connections=max(CONCURRENCY_LEVELS))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        token = (await client.post('/api/v1/token', params={'client_id': 'load_test'})).json()['access_token']
+        client.headers['Authorization'] = f'Bearer {token}'
+        await client.post('/api/v1/kline', json={
+            'symbol': args.symbol, 'timeframe': 'M1', 'data': make_bars(args.bars),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'mode': 'merge'
+        })
+        path = f'/api/v1/kline/{args.symbol}/M1'
+
+        print(f"{'concurrency':>11} {'requests':>9} {'errors':>7} {'rps':>8} "
+              f"{'p50(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9}")
+        for concurrency in CONCURRENCY_LEVELS:
+            per_worker = max(1, args.requests // concurrency)
+            start = time.perf_counter()
+            latencies, errors = await run_level(client, path, concurrency, per_worker)
+            elapsed = time.perf_counter() - start
+            if not latencies:
+                print(f"{concurrency:>11} {0:>9} {errors:>7}")
+                continue
+            print(f"{concurrency:>11} {len(latencies):>9} {errors:>7} {len(latencies) / elapsed:>8.0f} "
+                  f"{statistics.median(latencies) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} "
+                  f"{max(latencies) * 1000:>9.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--symbol', default='LOADTEST')
+    parser.add_argument('--bars', type=int, default=300, help='预先写入的K线数量')
+    parser.add_argument('--requests', type=int, default=2000, help='每个并发级别的总请求数')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""从MT5分批读取长历史K线并写入服务端历史归档
+
+使用采集端的配置（服务端地址、API密钥、MT5网关），按 copy_rates_from_pos 从最新的
+已收盘K线向前分批读取，每批通过 /api/v1/archive/batch 上传。
+
+用法：
+    python backfill.py --symbols EURUSD,XAUUSD --timeframes M1,H1 --bars 200000
+"""
+import argparse
+import logging
+import time
+from datetime import datetime
+
+import requests
+
+from bars import rates_to_records
+from collector import MT5DataCollector
+
+
+def backfill(collector: MT5DataCollector, symbol: str, timeframe: str, bars: int, chunk: int) -> int:
+    """读取并上传最多bars根已收盘K线，返回上传的K线数"""
+    code = collector.supported_timeframes[timeframe]
+    # 位置0为正在形成的K线，从1开始
+    position = 1
+    sent = 0
+    while sent < bars:
+        count = min(chunk, bars - sent)
+        with collector.mt5_lock:
+            rates = collector.mt5.copy_rates_from_pos(symbol, code, position, count)
+        if rates is None or len(rates) == 0:
+            break
+        payload = {
+            'series': [{'symbol': symbol, 'timeframe': timeframe, 'data': rates_to_records(rates), 'mode': 'merge'}],
+            'timestamp': datetime.now().isoformat()
+        }
+        body, headers = collector.encode_batch(payload)
+        start = time.perf_counter()
+        try:
+            response = collector.session.post(
+                f"{collector.server_url}/archive/batch", data=body, headers=headers, timeout=collector.upload_timeout
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            collector.logger.error(f"上传{symbol} {timeframe}历史数据失败: {str(e)}")
+            break
+        position += len(rates)
+        sent += len(rates)
+        collector.logger.info(
+            f"{symbol} {timeframe}: 已上传{sent}根K线（最早 {rates_to_records(rates[:1])[0]['time']}，"
+            f"耗时{(time.perf_counter() - start) * 1000:.0f}ms）"
+        )
+        # 终端中的历史已全部读取
+        if len(rates) < count:
+            break
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--symbols', help='逗号分隔的品种，默认使用配置中的symbols')
+    parser.add_argument('--timeframes', default='M1,M5,M15,M30,H1,H4,D1', help='逗号分隔的周期')
+    parser.add_argument('--bars', type=int, default=100000, help='每个品种/周期最多补录的K线数')
+    parser.add_argument('--chunk', type=int, default=10000, help='每批读取和上传的K线数')
+    args = parser.parse_args()
+
+    collector = MT5DataCollector(args.config)
+    if not collector.initialize_mt5():
+        return
+    symbols = [s.strip() for s in args.symbols.split(',')] if args.symbols else collector.symbols
+    timeframes = [tf.strip() for tf in args.timeframes.split(',') if tf.strip() in collector.supported_timeframes]
+    try:
+        for symbol in symbols:
+            with collector.mt5_lock:
+                collector.mt5.symbol_select(symbol, True)
+            for timeframe in timeframes:
+                total = backfill(collector, symbol, timeframe, args.bars, args.chunk)
+                logging.info(f"{symbol} {timeframe} 补录完成，共{total}根K线")
+    finally:
+        collector.session.close()
+        collector.mt5.shutdown()
+
+
+if __name__ == '__main__':
+    main()
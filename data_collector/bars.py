@@ -0,0 +1,59 @@
+"""MT5 K线数据序列化
+
+直接处理 copy_rates_from_pos 返回的 NumPy 结构化数组，按列批量完成
+时区转换和格式化，避免逐行 DataFrame.iterrows + strftime。
+"""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+BAR_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_TIMEZONE = 'Asia/Shanghai'
+
+
+def format_bar_times(epochs: np.ndarray, tz: str = DEFAULT_TIMEZONE) -> List[str]:
+    """将UTC秒级时间戳批量转换为本地时间字符串（%Y-%m-%d %H:%M:%S）"""
+    if len(epochs) == 0:
+        return []
+    local = pd.to_datetime(np.asarray(epochs, dtype=np.int64), unit='s', utc=True)
+    local = local.tz_convert(tz).tz_localize(None)
+    seconds = local.values.astype('datetime64[s]').astype(np.int64)
+
+    # K线时间只会落在少量日期和一天内的固定时刻上，分别对去重后的值格式化再拼接
+    days, time_of_day = np.divmod(seconds, 86400)
+    unique_days, day_index = np.unique(days, return_inverse=True)
+    unique_times, time_index = np.unique(time_of_day, return_inverse=True)
+    day_strings = np.datetime_as_string(unique_days.astype('datetime64[D]')).tolist()
+    time_strings = [f"{t // 3600:02d}:{t // 60 % 60:02d}:{t % 60:02d}" for t in unique_times.tolist()]
+    return [day_strings[d] + ' ' + time_strings[t]
+            for d, t in zip(day_index.ravel().tolist(), time_index.ravel().tolist())]
+
+
+def rates_to_records(rates: np.ndarray, tz: str = DEFAULT_TIMEZONE) -> List[Dict]:
+    """转换为字典列表，用于上传到服务端"""
+    columns = zip(
+        format_bar_times(rates['time'], tz),
+        rates['open'].tolist(),
+        rates['close'].tolist(),
+        rates['high'].tolist(),
+        rates['low'].tolist(),
+        rates['tick_volume'].astype(np.float64).tolist(),
+    )
+    return [
+        {'time': t, 'open': o, 'close': c, 'high': h, 'low': l, 'volume': v}
+        for t, o, c, h, l, v in columns
+    ]
+
+
+def rates_to_rows(rates: np.ndarray, tz: str = DEFAULT_TIMEZONE) -> List[List]:
+    """转换为ECharts K线所需的 [time, open, close, low, high, volume] 列表"""
+    columns = zip(
+        format_bar_times(rates['time'], tz),
+        rates['open'].tolist(),
+        rates['close'].tolist(),
+        rates['low'].tolist(),
+        rates['high'].tolist(),
+        rates['tick_volume'].astype(np.float64).tolist(),
+    )
+    return [list(row) for row in columns]
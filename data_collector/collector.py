@@ -1,8 +1,9 @@
-import MetaTrader5 as mt5
-import pandas as pd
 from datetime import datetime, timedelta
-import pytz
 import requests
+from requests.adapters import HTTPAdapter
+import msgpack
+import gzip
+import queue
 import json
 import time
 import logging
@@ -13,6 +14,16 @@ import sys
 from logging.handlers import RotatingFileHandler
 import threading
 import signal
+import socket
+import uuid
+
+from bars import rates_to_records
+from gateway import load_gateway
+from spool import UploadSpool
+from scheduler import BarScheduler, TIMEFRAME_SECONDS
+from ticks import TickStreamer
+from fleet import FleetMember
+import metrics
 
 # 配置日志
 def setup_logger(log_path: str = 'logs'):
@@ -34,11 +45,33 @@ def setup_logger(log_path: str = 'logs'):
     
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
+    # 同一进程中运行多个采集端时只添加一次
+    if any(getattr(handler, 'baseFilename', None) == file_handler.baseFilename for handler in logger.handlers):
+        file_handler.close()
+        return logger
     logger.addHandler(file_handler)
     logger.addHandler(console_handler)
     
     return logger
 
+# 重试也不会成功的4xx之外的状态：401/403为令牌问题（修正配置后重放），408/429为暂时性错误
+RETRYABLE_CLIENT_ERRORS = {401, 403, 408, 429}
+
+class RejectedUpload(Exception):
+    """服务端拒绝了上传（如400/413/415/422），重发同样的数据也不会成功"""
+
+def rejection_of(error: requests.exceptions.RequestException) -> Optional[RejectedUpload]:
+    """连接错误、超时和5xx可以重试，其余4xx返回RejectedUpload"""
+    response = getattr(error, 'response', None)
+    if response is None or not 400 <= response.status_code < 500 or \
+            response.status_code in RETRYABLE_CLIENT_ERRORS:
+        return None
+    return RejectedUpload(f"HTTP {response.status_code}: {response.text[:200]}")
+
+def stamps_of(item: Dict) -> Dict:
+    """上传序列中的读取时间戳字段"""
+    return {key: item[key] for key in ('fetched_at', 'bar_close') if key in item}
+
 class MT5DataCollector:
     def __init__(self, config_path: str = 'config.ini'):
         self.logger = setup_logger()
@@ -46,12 +79,29 @@ class MT5DataCollector:
         self.server_url = self.config['server']['url']
         self.api_key = self.config['server']['api_key']
         self.symbols = json.loads(self.config['mt5']['symbols'])
+        # 集群模式：品种由服务端按租约分配，[mt5] symbols 为本终端可采集的品种（为空时不限）
+        self.fleet_mode = self.config.getboolean('fleet', 'enabled', fallback=False)
+        self.collector_id = self.config.get('fleet', 'collector_id', fallback='') or \
+            f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+        # 本地状态文件，同一目录运行多个采集端时用 {collector_id} 区分
+        self.state_path = self._local_path('state_path', 'collector_state.json')
+        # 心跳线程收到的新分配，由主循环在下一次调度前应用
+        self.assigned = None
+        self.mt5 = self._create_gateway()
+        self.supported_timeframes = {
+            'M1': self.mt5.TIMEFRAME_M1,
+            'M5': self.mt5.TIMEFRAME_M5,
+            'M15': self.mt5.TIMEFRAME_M15,
+            'M30': self.mt5.TIMEFRAME_M30,
+            'H1': self.mt5.TIMEFRAME_H1,
+            'H4': self.mt5.TIMEFRAME_H4,
+            'D1': self.mt5.TIMEFRAME_D1
+        }
+        # 服务端会由M1合成更高周期，默认只采集M1
         self.timeframes = {
-            'M1': mt5.TIMEFRAME_M1,
-            'M5': mt5.TIMEFRAME_M5,
-            'M15': mt5.TIMEFRAME_M15,
-            'M30': mt5.TIMEFRAME_M30,
-            'H1': mt5.TIMEFRAME_H1
+            tf: self.supported_timeframes[tf]
+            for tf in json.loads(self.config.get('mt5', 'timeframes', fallback='["M1"]'))
+            if tf in self.supported_timeframes
         }
         self.last_connection_time = None
         self.connection_attempts = 0
@@ -60,11 +110,111 @@ class MT5DataCollector:
         self.health_check_interval = 30  # 30秒检查一次健康状态
         self.reconnect_delay = 60  # 重连等待时间（秒）
         self.last_data_time = {}  # 记录每个品种最后一次成功获取数据的时间
+        self.last_sent_bars = {}  # 记录每个品种/周期最后一次成功发送的K线
+        # 每个品种/周期最近一次读取的时间戳（UTC秒）：fetched_at为读取完成时间，bar_close为最新已收盘K线的收盘时间
+        self.fetch_stamps = {}
+        # MT5 K线时间为服务器时间，换算为UTC时减去该偏移
+        self.server_utc_offset = int(self.config.getfloat('schedule', 'server_utc_offset', fallback=0) * 3600)
+        # 增量上传：只发送新增或被修订的K线，服务端按时间合并
+        self.incremental = self.config.getboolean('upload', 'incremental', fallback=True)
+        # 每隔多少个周期发送一次完整窗口，用于服务端重启后补齐数据；0为只在启动后第一次发送
+        self.full_sync_interval = self.config.getint('upload', 'full_sync_interval', fallback=60)
+        if self.full_sync_interval < 0:
+            self.logger.warning(f"full_sync_interval={self.full_sync_interval}无效，按0处理（不定期发送完整窗口）")
+            self.full_sync_interval = 0
+        self.cycle_count = 0
+        self.update_interval = 60  # 采集周期（秒）
+        # 每次读取的K线窗口大小
+        self.window = 300
+        if self.fleet_mode:
+            self.offered_symbols, self.symbols = self.symbols, []
+        series = [(symbol, tf) for symbol in self.symbols for tf in self.timeframes]
+        # 逐笔模式：由报价实时更新正在形成的K线，收盘K线仍由主循环读取校正
+        self.tick_mode = self.config.getboolean('ticks', 'enabled', fallback=False)
+        self.tick_interval = self.config.getint('ticks', 'interval_ms', fallback=250) / 1000
+        # 按K线收盘时间调度，关闭时退回固定间隔采集
+        self.scheduler = None
+        if self.config.getboolean('schedule', 'enabled', fallback=True):
+            self.scheduler = BarScheduler(
+                series,
+                close_delay=self.config.getfloat('schedule', 'close_delay', fallback=1.0),
+                # 逐笔模式下正在形成的K线由报价更新，无需轮询
+                forming_interval=0 if self.tick_mode else
+                self.config.getfloat('schedule', 'forming_interval', fallback=10.0),
+                utc_offset_hours=self.config.getfloat('schedule', 'server_utc_offset', fallback=0)
+            )
+
+        # MT5接口不是线程安全的：K线读取只在主循环线程进行，健康检查通过锁与其互斥
+        self.mt5_lock = threading.RLock()
+        # 上传流水线：主循环读取MT5数据放入有界队列，多个上传线程共享连接池发送
+        self.upload_workers = self.config.getint('upload', 'workers', fallback=4)
+        self.upload_timeout = self.config.getint('upload', 'timeout', fallback=10)
+        self.upload_queue = queue.Queue(maxsize=self.config.getint('upload', 'queue_size', fallback=100))
+        # 批量上传：一次请求发送多个品种/周期，默认msgpack编码并gzip压缩
+        self.batch_upload = self.config.getboolean('upload', 'batch', fallback=True)
+        self.batch_size = self.config.getint('upload', 'batch_size', fallback=50)
+        self.batch_format = self.config.get('upload', 'format', fallback='msgpack')
+        self.batch_compress = self.config.getboolean('upload', 'compress', fallback=True)
+        # 发送失败的数据写入本地缓冲文件，服务端恢复后按顺序重放
+        self.spool = None
+        if self.config.getboolean('upload', 'spool', fallback=True):
+            self.spool = UploadSpool(
+                path=self._local_path('spool_path', 'spool.jsonl'),
+                max_bytes=self.config.getint('upload', 'spool_max_bytes', fallback=64 * 1024 * 1024)
+            )
+        # 重放时单个请求的记录字节数上限（未压缩），需小于服务端和Nginx的请求体上限
+        self.replay_max_bytes = self.config.getint('upload', 'replay_max_bytes', fallback=4 * 1024 * 1024)
+        # 本地指标端口（Prometheus格式），0为不启用
+        self.metrics_port = self.config.getint('metrics', 'port', fallback=9101)
+        self.metrics_host = self.config.get('metrics', 'host', fallback='127.0.0.1')
+        self.state_lock = threading.Lock()
+        self.stage_times = {'fetch': 0.0, 'upload': 0.0}
+        self.session = self._create_session()
+        self.fleet = None
+        if self.fleet_mode:
+            self.fleet = FleetMember(
+                self.session, self.server_url, self.collector_id, symbols=self.offered_symbols,
+                capacity=self.config.getint('fleet', 'capacity', fallback=0),
+                timeout=self.upload_timeout, logger=self.logger
+            )
+        self.tick_streamer = None
+        if self.tick_mode:
+            self.tick_streamer = TickStreamer(
+                self.mt5, series, self.supported_timeframes, send=self.send_live,
+                interval=self.tick_interval, lock=self.mt5_lock, logger=self.logger,
+                server_utc_offset=self.server_utc_offset
+            )
         
         # 注册信号处理
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
 
+    def _create_gateway(self):
+        """创建MT5网关：默认连接MetaTrader5终端，synthetic 为不依赖终端的模拟行情"""
+        backend = self.config.get('gateway', 'backend', fallback='mt5')
+        if backend != 'synthetic':
+            return load_gateway(backend)
+        return load_gateway(
+            backend,
+            symbols=self.symbols,
+            seed=self.config.getint('gateway', 'seed', fallback=0),
+            history_bars=self.config.getint('gateway', 'history_bars', fallback=20000),
+            tick_rate=self.config.getfloat('gateway', 'tick_rate', fallback=2.0),
+            replay_dir=self.config.get('gateway', 'replay_dir', fallback='') or None
+        )
+
+    def _create_session(self) -> requests.Session:
+        """创建复用长连接的HTTP会话，避免每次上传都重新进行TLS握手"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.upload_workers + 1)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        })
+        return session
+
     def _signal_handler(self, signum, frame):
         """处理进程信号"""
         self.logger.info(f"收到信号 {signum}，准备安全退出...")
@@ -86,25 +236,75 @@ class MT5DataCollector:
         }
         config['mt5'] = {
             'symbols': '["EURUSD", "GBPUSD", "USDJPY"]',
+            'timeframes': '["M1"]',
             'reconnect_delay': '60',
             'health_check_interval': '30'
         }
+        config['gateway'] = {
+            'backend': 'mt5'
+        }
+        config['upload'] = {
+            'incremental': 'true',
+            'full_sync_interval': '60',
+            'workers': '4',
+            'queue_size': '100',
+            'timeout': '10',
+            'batch': 'true',
+            'batch_size': '50',
+            'format': 'msgpack',
+            'compress': 'true',
+            'spool': 'true',
+            'spool_path': 'spool.jsonl',
+            'state_path': 'collector_state.json',
+            'spool_max_bytes': '67108864',
+            'replay_max_bytes': '4194304'
+        }
+        config['schedule'] = {
+            'enabled': 'true',
+            'close_delay': '1.0',
+            'forming_interval': '10',
+            'server_utc_offset': '0'
+        }
+        config['ticks'] = {
+            'enabled': 'false',
+            'interval_ms': '250'
+        }
+        config['metrics'] = {
+            'port': '9101',
+            'host': '127.0.0.1'
+        }
+        config['fleet'] = {
+            'enabled': 'false',
+            'collector_id': '',
+            'capacity': '0'
+        }
         
         with open(config_path, 'w', encoding='utf-8') as f:
             config.write(f)
         
         self.logger.info(f"创建默认配置文件：{config_path}")
 
+    def _local_path(self, key: str, default: str) -> str:
+        """[upload] 中的本地文件路径，{collector_id} 替换为采集端ID"""
+        return self.config.get('upload', key, fallback=default).replace('{collector_id}', self.collector_id)
+
     def _save_state(self):
         """保存当前状态"""
+        with self.state_lock:
+            last_sent_bars = dict(self.last_sent_bars)
         state = {
             'last_data_time': self.last_data_time,
+            'last_sent_bars': last_sent_bars,
             'connection_attempts': self.connection_attempts,
-            'last_connection_time': self.last_connection_time.isoformat() if self.last_connection_time else None
+            'last_connection_time': self.last_connection_time.isoformat() if self.last_connection_time else None,
+            'spool': self.spool.stats() if self.spool else None,
+            'schedule': self.scheduler.stats() if self.scheduler else None,
+            'ticks': self.tick_streamer.stats() if self.tick_streamer else None,
+            'fleet': self.fleet.stats() if self.fleet else None
         }
         
         try:
-            with open('collector_state.json', 'w', encoding='utf-8') as f:
+            with open(self.state_path, 'w', encoding='utf-8') as f:
                 json.dump(state, f, ensure_ascii=False, indent=2)
         except Exception as e:
             self.logger.error(f"保存状态失败: {str(e)}")
@@ -112,10 +312,11 @@ class MT5DataCollector:
     def _load_state(self):
         """加载上次的状态"""
         try:
-            if os.path.exists('collector_state.json'):
-                with open('collector_state.json', 'r', encoding='utf-8') as f:
+            if os.path.exists(self.state_path):
+                with open(self.state_path, 'r', encoding='utf-8') as f:
                     state = json.load(f)
                 self.last_data_time = state.get('last_data_time', {})
+                self.last_sent_bars = state.get('last_sent_bars', {})
                 self.connection_attempts = state.get('connection_attempts', 0)
                 last_connection_time = state.get('last_connection_time')
                 if last_connection_time:
@@ -126,8 +327,10 @@ class MT5DataCollector:
     def initialize_mt5(self) -> bool:
         """初始化MT5连接"""
         try:
-            if not mt5.initialize():
-                self.logger.error(f"MT5初始化失败: {mt5.last_error()}")
+            with self.mt5_lock:
+                initialized = self.mt5.initialize()
+            if not initialized:
+                self.logger.error(f"MT5初始化失败: {self.mt5.last_error()}")
                 return False
             
             self.last_connection_time = datetime.now()
@@ -141,7 +344,9 @@ class MT5DataCollector:
     def check_connection(self) -> bool:
         """检查MT5连接状态"""
         try:
-            if not mt5.terminal_info():
+            with self.mt5_lock:
+                terminal_info = self.mt5.terminal_info()
+            if not terminal_info:
                 self.logger.error("MT5连接已断开")
                 return False
             return True
@@ -160,43 +365,32 @@ class MT5DataCollector:
         self.logger.info(f"尝试重新连接MT5 (第{self.connection_attempts}次)")
         
         try:
-            mt5.shutdown()
-            time.sleep(self.reconnect_delay)
-            return self.initialize_mt5()
+            # 重连期间持有锁，避免主循环在断开的连接上读取数据
+            with self.mt5_lock:
+                self.mt5.shutdown()
+                time.sleep(self.reconnect_delay)
+                return self.initialize_mt5()
         except Exception as e:
             self.logger.error(f"重新连接失败: {str(e)}")
             return False
 
     def get_candlestick_data(self, symbol: str, timeframe: str, count: int = 300) -> Optional[List[Dict]]:
         """获取K线数据"""
-        if timeframe not in self.timeframes:
+        if timeframe not in self.supported_timeframes:
             self.logger.error(f"不支持的时间周期: {timeframe}")
             return None
 
         try:
-            rates = mt5.copy_rates_from_pos(symbol, self.timeframes[timeframe], 0, count)
+            with self.mt5_lock:
+                rates = self.mt5.copy_rates_from_pos(symbol, self.supported_timeframes[timeframe], 0, count)
             if rates is None:
-                self.logger.error(f"获取{symbol} {timeframe}数据失败: {mt5.last_error()}")
+                self.logger.error(f"获取{symbol} {timeframe}数据失败: {self.mt5.last_error()}")
                 return None
 
-            df = pd.DataFrame(rates)
-            df['time'] = pd.to_datetime(df['time'], unit='s', utc=True)
-            
-            # 转换为北京时间
-            beijing_tz = pytz.timezone('Asia/Shanghai')
-            df['time'] = df['time'].dt.tz_convert(beijing_tz)
-
-            # 转换为列表格式
-            data = []
-            for _, row in df.iterrows():
-                data.append({
-                    'time': row['time'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'open': float(row['open']),
-                    'close': float(row['close']),
-                    'high': float(row['high']),
-                    'low': float(row['low']),
-                    'volume': float(row['tick_volume'])
-                })
+            # 转换为北京时间的列表格式
+            data = rates_to_records(rates)
+            if len(rates):
+                self.fetch_stamps[(symbol, timeframe)] = self._freshness_stamps(timeframe, rates)
 
             # 更新最后获取数据的时间
             key = f"{symbol}_{timeframe}"
@@ -207,33 +401,413 @@ class MT5DataCollector:
             self.logger.error(f"获取{symbol} {timeframe}数据异常: {str(e)}")
             return None
 
-    def send_data_to_server(self, symbol: str, timeframe: str, data: List[Dict]) -> bool:
-        """发送数据到服务器"""
-        headers = {
-            'Authorization': f'Bearer {self.api_key}',
-            'Content-Type': 'application/json'
-        }
-        
+    def _freshness_stamps(self, timeframe: str, rates) -> Dict:
+        """读取完成时间和最新已收盘K线的收盘时间，随上传发送给服务端用于计算各环节延迟"""
+        fetched_at = time.time()
+        seconds = TIMEFRAME_SECONDS[timeframe]
+        last_open = int(rates['time'][-1]) - self.server_utc_offset
+        # 最新一根仍在形成时，其开盘时间即上一根的收盘时间
+        bar_close = last_open + seconds if last_open + seconds <= fetched_at else last_open
+        return {'fetched_at': fetched_at, 'bar_close': bar_close}
+
+    def select_delta(self, symbol: str, timeframe: str, data: List[Dict]) -> List[Dict]:
+        """挑选出上次发送之后新增或被修订的K线"""
+        last_bar = self.last_sent_bars.get(f"{symbol}_{timeframe}")
+        if not last_bar:
+            return data
+
+        delta = [bar for bar in data if bar['time'] >= last_bar['time']]
+        # 上次发送的最后一根K线已不在当前窗口内（断线时间过长），发送完整窗口
+        if not delta or delta[0]['time'] != last_bar['time']:
+            return data
+        # 上次发送的K线未被修订则无需重发
+        return delta[1:] if delta[0] == last_bar else delta
+
+    def send_data_to_server(self, symbol: str, timeframe: str, data: List[Dict], mode: str = 'replace',
+                            verbose: bool = True, stamps: Optional[Dict] = None) -> bool:
+        """发送数据到服务器，stamps为读取时间戳（fetched_at/bar_close）"""
         payload = {
             'symbol': symbol,
             'timeframe': timeframe,
             'data': data,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now().isoformat(),
+            'mode': mode,
+            **(stamps or {})
         }
+        if self.fleet:
+            payload['collector'] = self.collector_id
 
+        start = time.perf_counter()
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.server_url}/kline",
-                headers=headers,
                 json=payload,
+                timeout=self.upload_timeout,
                 verify=True  # 使用系统的证书验证
             )
             response.raise_for_status()
-            self.logger.info(f"成功发送{symbol} {timeframe}数据到服务器")
+            self._check_skipped(response)
+            metrics.REQUEST_DURATION.labels('kline').observe(time.perf_counter() - start)
+            metrics.REQUEST_SIZE.labels('kline').observe(len(response.request.body or b''))
+            if verbose:
+                self.logger.info(
+                    f"成功发送{symbol} {timeframe}数据到服务器 ({len(data)}根K线, "
+                    f"耗时{(time.perf_counter() - start) * 1000:.0f}ms)"
+                )
             return True
         except requests.exceptions.RequestException as e:
+            metrics.REQUEST_FAILURES.labels('kline').inc()
             self.logger.error(f"发送数据失败: {str(e)}")
+            rejection = rejection_of(e)
+            if rejection:
+                raise rejection from e
+            return False
+
+    def encode_batch(self, payload: Dict):
+        """按配置编码批量请求体，返回 (body, headers)"""
+        if self.batch_format == 'msgpack':
+            body = msgpack.packb(payload, use_bin_type=True)
+            headers = {'Content-Type': 'application/msgpack'}
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            headers = {'Content-Type': 'application/json'}
+        if self.batch_compress:
+            body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+        return body, headers
+
+    def send_batch_to_server(self, series: List[Dict], verbose: bool = True) -> bool:
+        """通过批量接口发送多个序列"""
+        payload = {
+            'series': series,
+            'timestamp': datetime.now().isoformat()
+        }
+        if self.fleet:
+            payload['collector'] = self.collector_id
+        body, headers = self.encode_batch(payload)
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                f"{self.server_url}/kline/batch",
+                data=body,
+                headers=headers,
+                timeout=self.upload_timeout,
+                verify=True  # 使用系统的证书验证
+            )
+            response.raise_for_status()
+            self._check_skipped(response)
+            metrics.REQUEST_DURATION.labels('kline/batch').observe(time.perf_counter() - start)
+            metrics.REQUEST_SIZE.labels('kline/batch').observe(len(body))
+            if verbose:
+                self.logger.info(
+                    f"成功批量发送{len(series)}个序列到服务器 "
+                    f"({sum(len(item['data']) for item in series)}根K线, {len(body)}字节, "
+                    f"耗时{(time.perf_counter() - start) * 1000:.0f}ms)"
+                )
+            return True
+        except requests.exceptions.RequestException as e:
+            metrics.REQUEST_FAILURES.labels('kline/batch').inc()
+            self.logger.error(f"批量发送数据失败: {str(e)}")
+            rejection = rejection_of(e)
+            if rejection:
+                raise rejection from e
+            return False
+
+    def _check_skipped(self, response: requests.Response):
+        """服务端丢弃了已移交给其他采集端的品种时，立即发送心跳更新分配"""
+        if not self.fleet:
+            return
+        try:
+            skipped = response.json().get('skipped')
+        except ValueError:
+            return
+        if skipped:
+            self.logger.info(f"品种已移交给其他采集端，上传被丢弃: {', '.join(skipped)}")
+            self.fleet.wake()
+
+    def assign_symbols(self, symbols: List[str]):
+        """心跳线程收到新的品种分配"""
+        self.assigned = symbols
+
+    def apply_assignment(self):
+        """在主循环线程中切换到新分配的品种（MT5接口只在主循环线程调用）"""
+        symbols, self.assigned = self.assigned, None
+        if symbols is None or symbols == self.symbols:
+            return
+        added = [symbol for symbol in symbols if symbol not in self.symbols]
+        with self.mt5_lock:
+            for symbol in added:
+                if not self.mt5.symbol_select(symbol, True):
+                    self.logger.error(f"选择品种{symbol}失败: {self.mt5.last_error()}")
+        with self.state_lock:
+            # 新接手的品种发送完整窗口，覆盖交接前可能缺失的K线
+            for symbol in added:
+                for timeframe in self.timeframes:
+                    self.last_sent_bars.pop(f"{symbol}_{timeframe}", None)
+        self.symbols = list(symbols)
+        series = [(symbol, tf) for symbol in self.symbols for tf in self.timeframes]
+        if self.scheduler:
+            self.scheduler.set_series(series)
+        if self.tick_streamer:
+            self.tick_streamer.set_series(series)
+
+    def upload_batch(self, items: List[tuple]) -> bool:
+        """批量上传一组 (symbol, timeframe, data, full_sync, stamps)"""
+        series = []
+        for symbol, timeframe, data, full_sync, stamps in items:
+            if not self.incremental:
+                series.append({'symbol': symbol, 'timeframe': timeframe, 'data': data, 'mode': 'replace', **stamps})
+                continue
+            bars = data if full_sync else self.select_delta(symbol, timeframe, data)
+            if bars:
+                series.append({'symbol': symbol, 'timeframe': timeframe, 'data': bars, 'mode': 'merge', **stamps})
+        if not series:
+            return True
+        start = time.perf_counter()
+        sent = self.send_or_spool(series)
+        self._observe_upload(series, time.perf_counter() - start)
+        if not sent:
             return False
+        if self.incremental:
+            with self.state_lock:
+                for symbol, timeframe, data, *_ in items:
+                    self.last_sent_bars[f"{symbol}_{timeframe}"] = data[-1]
+        return True
+
+    @staticmethod
+    def _observe_upload(series: List[Dict], elapsed: float):
+        for item in series:
+            metrics.UPLOAD_DURATION.labels(item['symbol'], item['timeframe']).observe(elapsed)
+
+    def send_series(self, series: List[Dict]) -> bool:
+        """按配置通过批量接口或逐个序列发送，可重试的失败返回False，被服务端拒绝时抛出RejectedUpload"""
+        if self.batch_upload:
+            return self.send_batch_to_server(series)
+        return all(
+            self.send_data_to_server(item['symbol'], item['timeframe'], item['data'], item['mode'],
+                                     stamps=stamps_of(item))
+            for item in series
+        )
+
+    def send_live(self, series: List[Dict]) -> bool:
+        """发送逐笔模式下正在形成的K线：发送频繁，成功时不记录日志，失败时不写入缓冲"""
+        try:
+            if self.batch_upload:
+                return self.send_batch_to_server(series, verbose=False)
+            return all(
+                self.send_data_to_server(item['symbol'], item['timeframe'], item['data'], item['mode'],
+                                         verbose=False, stamps=stamps_of(item))
+                for item in series
+            )
+        except RejectedUpload as e:
+            # 丢弃被拒绝的K线，避免每次推送都重发
+            self.logger.error(f"逐笔推送被服务端拒绝，丢弃{len(series)}个序列: {str(e)}")
+            return True
+
+    def send_or_spool(self, series: List[Dict]) -> bool:
+        """发送一组序列；可重试的失败或缓冲中仍有积压时写入缓冲文件，等待按顺序重放
+
+        被服务端拒绝的序列不再重试：启用缓冲时写入 .rejected 文件，否则记录日志后丢弃。
+        """
+        try:
+            if self.spool is None:
+                return self.send_series(series)
+            if not self.spool.pending() and self.send_series(series):
+                return True
+        except RejectedUpload as e:
+            self.logger.error(f"上传被服务端拒绝，不再重试{len(series)}个序列: {str(e)}")
+            if self.spool is not None:
+                self.spool.reject(series, str(e))
+            return True
+        self.spool.append(series)
+        return True
+
+    def replay_spool(self):
+        """服务端恢复后按写入顺序分批重放缓冲中的数据，遇到可重试的失败时停止，下个周期继续
+
+        批次被拒绝时逐条重放找出被拒绝的记录，将其移入 .rejected 文件后跳过。
+        """
+        if self.spool is None or not self.spool.pending():
+            return
+        start = time.perf_counter()
+        replayed = 0
+        batch_size = self.batch_size if self.batch_upload else 1
+        while True:
+            records, offset = self.spool.read_batch(batch_size, self.replay_max_bytes)
+            if not records:
+                break
+            try:
+                if not self.send_series(records):
+                    break
+            except RejectedUpload as e:
+                if len(records) > 1:
+                    batch_size = 1
+                    continue
+                self.logger.error(
+                    f"缓冲记录被服务端拒绝，移入{self.spool.rejected_path}: "
+                    f"{records[0]['symbol']} {records[0]['timeframe']} {str(e)}"
+                )
+                self.spool.reject(records, str(e))
+                self.spool.commit(offset, records)
+                batch_size = self.batch_size if self.batch_upload else 1
+                continue
+            self.spool.commit(offset, records)
+            replayed += sum(len(item['data']) for item in records)
+        elapsed = time.perf_counter() - start
+        if replayed:
+            self.spool.record_replay(replayed, elapsed)
+            self.logger.info(
+                f"缓冲重放{replayed}根K线, 耗时{elapsed:.2f}s, 剩余{self.spool.pending()}条记录"
+            )
+
+    def upload(self, symbol: str, timeframe: str, data: List[Dict], full_sync: bool = False,
+               stamps: Optional[Dict] = None) -> bool:
+        """上传K线数据，增量模式下只发送变化的部分"""
+        stamps = stamps or {}
+        if not self.incremental:
+            series = [{'symbol': symbol, 'timeframe': timeframe, 'data': data, 'mode': 'replace', **stamps}]
+        else:
+            bars = data if full_sync else self.select_delta(symbol, timeframe, data)
+            if not bars:
+                return True
+            series = [{'symbol': symbol, 'timeframe': timeframe, 'data': bars, 'mode': 'merge', **stamps}]
+        start = time.perf_counter()
+        sent = self.send_or_spool(series)
+        self._observe_upload(series, time.perf_counter() - start)
+        if not sent or not self.incremental:
+            return sent
+        with self.state_lock:
+            self.last_sent_bars[f"{symbol}_{timeframe}"] = data[-1]
+        return True
+
+    def _record_stage(self, stage: str, elapsed: float):
+        with self.state_lock:
+            self.stage_times[stage] += elapsed
+
+    def upload_worker(self):
+        """上传线程：从队列取出一组K线数据发送到服务器"""
+        while True:
+            items = self.upload_queue.get()
+            try:
+                if items is None:
+                    return
+                start = time.perf_counter()
+                if self.batch_upload:
+                    self.upload_batch(items)
+                else:
+                    for item in items:
+                        self.upload(*item)
+                self._record_stage('upload', time.perf_counter() - start)
+            except Exception as e:
+                self.logger.error(f"上传线程异常: {str(e)}")
+            finally:
+                self.upload_queue.task_done()
+
+    def collect_cycle(self, tasks: Optional[List[tuple]] = None):
+        """执行一个采集周期：读取数据交给上传线程，等待全部上传完成
+
+        tasks 为 [(symbol, timeframe, count, full_sync, job)]，不指定时读取所有品种/周期的完整窗口。
+        """
+        cycle_start = time.perf_counter()
+        with self.state_lock:
+            self.stage_times = {'fetch': 0.0, 'upload': 0.0}
+        if tasks is None:
+            full_sync = not self.incremental or self._full_sync_due(self.cycle_count)
+            tasks = [
+                (symbol, timeframe, self.window, full_sync, None)
+                for symbol in self.symbols for timeframe in self.timeframes.keys()
+            ]
+        # 批量模式下每batch_size个序列作为一个上传任务，否则每个序列单独上传
+        group_size = self.batch_size if self.batch_upload else 1
+        series = 0
+        pending = []
+        for symbol, timeframe, count, full_sync, job in tasks:
+            if not self.running:
+                break
+
+            start = time.perf_counter()
+            started_at = time.time()
+            data = self.get_candlestick_data(symbol, timeframe, count)
+            elapsed = time.perf_counter() - start
+            self._record_stage('fetch', elapsed)
+            metrics.FETCH_DURATION.labels(symbol, timeframe).observe(elapsed)
+            if job is not None:
+                self.scheduler.record_fetch(job, started_at, data[-1] if data else None)
+            if data:
+                pending.append((symbol, timeframe, data, full_sync, self.fetch_stamps.get((symbol, timeframe), {})))
+                series += 1
+            if len(pending) >= group_size:
+                # 队列已满时阻塞，形成背压
+                self.upload_queue.put(pending)
+                pending = []
+        if pending:
+            self.upload_queue.put(pending)
+        fetch_done = time.perf_counter()
+        self.upload_queue.join()
+        self.replay_spool()
+        cycle_end = time.perf_counter()
+
+        self.cycle_count += 1
+        metrics.CYCLE_DURATION.labels('total').observe(cycle_end - cycle_start)
+        metrics.CYCLE_DURATION.labels('fetch').observe(self.stage_times['fetch'])
+        metrics.CYCLE_DURATION.labels('upload').observe(self.stage_times['upload'])
+        metrics.CYCLE_DURATION.labels('wait').observe(cycle_end - fetch_done)
+        self.logger.info(
+            f"采集周期完成: {series}个序列, MT5读取{self.stage_times['fetch']:.2f}s, "
+            f"上传累计{self.stage_times['upload']:.2f}s, 等待上传{cycle_end - fetch_done:.2f}s, "
+            f"总耗时{cycle_end - cycle_start:.2f}s"
+        )
+        return cycle_end - cycle_start
+
+    def _full_sync_due(self, count: int) -> bool:
+        """第count次（从0开始）采集是否发送完整窗口"""
+        return count == 0 or self.full_sync_interval > 0 and count % self.full_sync_interval == 0
+
+    def scheduled_tasks(self, now: float) -> List[tuple]:
+        """取出到期的调度任务，收盘读取按full_sync_interval定期发送完整窗口"""
+        tasks = []
+        for job, boundary in self.scheduler.due(now):
+            full_sync = not self.incremental
+            count = self.scheduler.fetch_count(job, now, self.window)
+            if boundary:
+                if self.incremental and self._full_sync_due(job.closes):
+                    full_sync = True
+                    count = self.window
+                job.closes += 1
+            tasks.append((job.symbol, job.timeframe, count, full_sync, job))
+        return tasks
+
+    def run_scheduled(self):
+        """按K线收盘时间调度的主循环"""
+        while self.running:
+            if not self.check_connection():
+                if not self.reconnect():
+                    break
+                continue
+
+            self.apply_assignment()
+            tasks = self.scheduled_tasks(time.time())
+            if tasks:
+                self.collect_cycle(tasks)
+                late = [job.late_last for *_, job in tasks]
+                self.logger.info(
+                    f"调度执行{len(tasks)}个任务, 相对目标时间延迟: 平均{sum(late) / len(late) * 1000:.0f}ms, "
+                    f"最大{max(late) * 1000:.0f}ms"
+                )
+                self._save_state()
+            # 最多等待1秒，以便及时响应退出信号
+            time.sleep(min(1.0, max(0.0, self.scheduler.next_wake() - time.time())))
+
+    def start_metrics_server(self):
+        """在本地端口输出Prometheus格式的指标"""
+        if not self.metrics_port:
+            return
+        try:
+            if metrics.start_server(self.metrics_port, self.metrics_host):
+                self.logger.info(f"指标服务: http://{self.metrics_host}:{self.metrics_port}/metrics")
+        except OSError as e:
+            self.logger.warning(f"指标服务启动失败: {str(e)}")
 
     def health_check(self):
         """健康检查线程"""
@@ -257,33 +831,54 @@ class MT5DataCollector:
 
         self.running = True
         self.logger.info("开始数据采集...")
+        self.start_metrics_server()
         
         # 启动健康检查线程
         health_check_thread = threading.Thread(target=self.health_check)
         health_check_thread.daemon = True
         health_check_thread.start()
+
+        # 集群模式：先注册取得第一次分配，之后由心跳线程续租
+        if self.fleet:
+            symbols = self.fleet.heartbeat()
+            if symbols is not None:
+                self.assign_symbols(symbols)
+                self.apply_assignment()
+            fleet_thread = threading.Thread(
+                target=self.fleet.run, args=(self.assign_symbols, lambda: self.running), name="fleet", daemon=True
+            )
+            fleet_thread.start()
+
+        # 启动逐笔推送线程
+        if self.tick_streamer:
+            tick_thread = threading.Thread(
+                target=self.tick_streamer.run, args=(lambda: self.running,), name="ticks", daemon=True
+            )
+            tick_thread.start()
+
+        # 启动上传线程
+        upload_threads = []
+        for i in range(self.upload_workers):
+            thread = threading.Thread(target=self.upload_worker, name=f"uploader-{i}", daemon=True)
+            thread.start()
+            upload_threads.append(thread)
         
         try:
-            while self.running:
+            if self.scheduler:
+                self.run_scheduled()
+            while self.running and not self.scheduler:
                 if not self.check_connection():
                     if not self.reconnect():
                         break
                     continue
 
-                for symbol in self.symbols:
-                    for timeframe in self.timeframes.keys():
-                        if not self.running:
-                            break
-                        
-                        data = self.get_candlestick_data(symbol, timeframe)
-                        if data:
-                            self.send_data_to_server(symbol, timeframe, data)
-                
+                self.apply_assignment()
+                elapsed = self.collect_cycle()
                 # 保存当前状态
                 self._save_state()
                 
-                # 等待下一次更新
-                time.sleep(60)  # 每分钟更新一次
+                # 等待下一次更新，扣除本周期已用时间
+                time.sleep(max(0, self.update_interval - elapsed))
                 
         except KeyboardInterrupt:
             self.logger.info("收到键盘中断信号")
@@ -291,9 +886,16 @@ class MT5DataCollector:
             self.logger.error(f"主循环发生错误: {str(e)}")
         finally:
             self.running = False
+            for _ in upload_threads:
+                self.upload_queue.put(None)
+            for thread in upload_threads:
+                thread.join(timeout=self.upload_timeout)
+            if self.fleet:
+                self.fleet.release()
+            self.session.close()
             self._save_state()
             health_check_thread.join(timeout=5)
-            mt5.shutdown()
+            self.mt5.shutdown()
             self.logger.info("程序已安全退出")
 
 if __name__ == "__main__":
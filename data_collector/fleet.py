@@ -0,0 +1,102 @@
+"""采集端集群成员
+
+多个采集端（可以在不同机器、连接不同的MT5终端）向服务端注册，按租约领取各自负责的品种：
+- 每隔 heartbeat_interval（服务端返回，为租约时长的1/3）发送一次心跳续租，返回当前分配的品种
+- 采集端停止心跳（进程退出、机器宕机、网络中断）超过租约时长后，服务端把它的品种分给其他采集端
+- 正常退出时主动释放租约，品种立即重新分配
+- 上传被服务端丢弃（品种已移交给其他采集端）时立即发送心跳更新分配
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+
+class FleetMember:
+    """向服务端注册并续租，取得分配给本采集端的品种"""
+
+    def __init__(self, session: requests.Session, server_url: str, collector_id: str,
+                 symbols: Optional[List[str]] = None, capacity: int = 0, timeout: float = 10, logger=None):
+        self.session = session
+        self.server_url = server_url
+        self.collector_id = collector_id
+        # 本采集端终端可采集的品种，为空时由服务端分配任意品种
+        self.offered = list(symbols or [])
+        self.capacity = capacity
+        self.timeout = timeout
+        self.logger = logger
+        self.symbols: Optional[List[str]] = None
+        self.lease_expires = 0.0
+        self.interval = 10.0
+        self.generation = None
+        self.wakeup = threading.Event()
+        self.heartbeats = 0
+        self.failures = 0
+        self.changes = 0
+
+    def heartbeat(self) -> Optional[List[str]]:
+        """注册或续租，返回分配的品种；请求失败时返回None（沿用当前分配直到租约到期）"""
+        try:
+            response = self.session.post(
+                f"{self.server_url}/fleet/heartbeat",
+                json={'collector_id': self.collector_id, 'symbols': self.offered, 'capacity': self.capacity},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            lease = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.failures += 1
+            if self.logger:
+                self.logger.error(f"集群心跳失败: {str(e)}")
+            return None
+        self.heartbeats += 1
+        self.lease_expires = time.time() + lease['lease_ttl']
+        self.interval = lease['heartbeat_interval']
+        self.generation = lease['generation']
+        symbols = lease['symbols']
+        if symbols != self.symbols:
+            self.changes += 1
+            if self.logger:
+                self.logger.info(f"集群分配{len(symbols)}个品种 (第{lease['generation']}版): {', '.join(symbols)}")
+            self.symbols = symbols
+        return symbols
+
+    def release(self):
+        """释放租约"""
+        try:
+            self.session.delete(f"{self.server_url}/fleet/collectors/{self.collector_id}", timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            if self.logger:
+                self.logger.error(f"释放集群租约失败: {str(e)}")
+
+    def wake(self):
+        """立即发送下一次心跳"""
+        self.wakeup.set()
+
+    def run(self, on_assign: Callable[[List[str]], None], is_running: Callable[[], bool] = lambda: True):
+        """按服务端要求的间隔发送心跳，分配变化时调用on_assign"""
+        while is_running():
+            # 最多等待1秒，以便及时响应退出信号
+            deadline = time.monotonic() + self.interval
+            while is_running() and time.monotonic() < deadline:
+                if self.wakeup.wait(min(1.0, max(0.0, deadline - time.monotonic()))):
+                    break
+            self.wakeup.clear()
+            if not is_running():
+                return
+            previous = self.symbols
+            symbols = self.heartbeat()
+            if symbols is not None and symbols != previous:
+                on_assign(symbols)
+
+    def stats(self) -> Dict:
+        return {
+            'collector_id': self.collector_id,
+            'symbols': self.symbols,
+            'generation': self.generation,
+            'lease_remaining': round(self.lease_expires - time.time(), 3),
+            'heartbeats': self.heartbeats,
+            'failures': self.failures,
+            'changes': self.changes,
+        }
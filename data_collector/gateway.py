@@ -0,0 +1,318 @@
+"""MT5接口网关
+
+采集端和Flask应用只通过网关调用MT5，用到的接口为 initialize / shutdown / terminal_info /
+last_error / symbols_get / symbol_select / symbol_info_tick / copy_rates_from_pos /
+copy_ticks_from 以及 TIMEFRAME_* 常量。
+
+backend 为 mt5 时直接返回 MetaTrader5 模块；为 synthetic 时返回 SyntheticGateway，
+按随机游走（或回放录制的M1 K线）生成行情，用于在没有Windows终端的环境中测试和压测。
+"""
+import os
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# 与 MetaTrader5.copy_rates_from_pos 返回的结构化数组一致
+RATES_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'),
+    ('close', '<f8'), ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8'),
+])
+# 与 MetaTrader5.copy_ticks_from 返回的结构化数组一致
+TICK_DTYPE = np.dtype([
+    ('time', '<i8'), ('bid', '<f8'), ('ask', '<f8'), ('last', '<f8'), ('volume', '<u8'),
+    ('time_msc', '<i8'), ('flags', '<u4'), ('volume_real', '<f8'),
+])
+COPY_TICKS_ALL = -1
+
+# 与MetaTrader5模块的取值一致
+TIMEFRAME_M1 = 1
+TIMEFRAME_M5 = 5
+TIMEFRAME_M15 = 15
+TIMEFRAME_M30 = 30
+TIMEFRAME_H1 = 16385
+TIMEFRAME_H4 = 16388
+TIMEFRAME_D1 = 16408
+TIMEFRAME_SECONDS = {
+    TIMEFRAME_M1: 60,
+    TIMEFRAME_M5: 300,
+    TIMEFRAME_M15: 900,
+    TIMEFRAME_M30: 1800,
+    TIMEFRAME_H1: 3600,
+    TIMEFRAME_H4: 14400,
+    TIMEFRAME_D1: 86400,
+}
+
+DEFAULT_SYMBOLS = ('EURUSD', 'GBPUSD', 'USDJPY', 'XAUUSD')
+
+
+def load_gateway(backend: str = 'mt5', **options):
+    """按名称创建网关，mt5 以外的选项只用于 synthetic"""
+    if backend == 'mt5':
+        import MetaTrader5
+        return MetaTrader5
+    if backend == 'synthetic':
+        return SyntheticGateway(**options)
+    raise ValueError(f"未知的MT5网关: {backend}")
+
+
+class SyntheticSymbol:
+    """一个品种的模拟行情：已收盘的M1 K线加上最近一段时间的逐笔报价
+
+    逐笔报价在被读取时才按 tick_rate 生成到当前时间，每分钟结束后汇总为一根M1 K线，
+    K线的成交量即报价笔数。
+    """
+
+    # 保留逐笔报价的时长（秒）
+    TICK_RETENTION = 600
+
+    def __init__(self, name: str, rng: np.random.Generator, now: float, history_bars: int,
+                 tick_rate: float, history: Optional[np.ndarray] = None):
+        self.name = name
+        self.rng = rng
+        self.tick_rate = tick_rate
+        start = int(now) // 60 * 60
+        if history is None:
+            history = self._random_walk(history_bars, start)
+        else:
+            # 回放的K线整体平移，使最后一根在启动前一分钟收盘
+            history = history[-history_bars:].copy()
+            history['time'] += start - 60 - int(history['time'][-1])
+        self.history = history
+        price = float(history['close'][-1]) if len(history) else 100.0
+        self.digits = 5 if price < 10 else 3 if price < 1000 else 2
+        self.point = 10.0 ** -self.digits
+        # 每分钟约0.05%的波动
+        self.tick_sigma = 0.0005 / np.sqrt(60 * max(tick_rate, 0.01))
+        self.last_price = price
+        self.forming = start
+        self.generated_to = start * 1000
+        # 此时间（毫秒）之后的报价都还保留着
+        self.retained_from = start * 1000
+        self.tick_times = np.empty(0, dtype=np.int64)
+        self.tick_prices = np.empty(0, dtype=np.float64)
+
+    def _random_walk(self, count: int, start: int) -> np.ndarray:
+        rng = self.rng
+        base = float(np.exp(rng.uniform(0, 7.5)))
+        close = base * np.exp(np.cumsum(rng.normal(0, 0.0005, count)))
+        open_ = np.r_[base, close[:-1]]
+        spread = np.abs(rng.normal(0, 0.0003, (2, count))) * close
+        rates = np.zeros(count, dtype=RATES_DTYPE)
+        rates['time'] = start - 60 * np.arange(count, 0, -1)
+        rates['open'] = open_
+        rates['close'] = close
+        rates['high'] = np.maximum(open_, close) + spread[0]
+        rates['low'] = np.minimum(open_, close) - spread[1]
+        rates['tick_volume'] = rng.integers(20, 200, count)
+        return rates
+
+    def advance(self, now: float):
+        """生成到now为止的逐笔报价，并把已结束的分钟汇总为K线"""
+        now_ms = int(now * 1000)
+        span = now_ms - self.generated_to
+        if span <= 0:
+            return
+        count = min(int(self.rng.poisson(self.tick_rate * span / 1000)), span)
+        if count:
+            offsets = np.sort(self.rng.integers(1, span + 1, count))
+            # 保证时间严格递增（毫秒）
+            offsets = np.maximum.accumulate(offsets - np.arange(count)) + np.arange(count)
+            times = self.generated_to + np.minimum(offsets, span)
+            steps = self.rng.normal(0, self.tick_sigma, count)
+            prices = np.round(self.last_price * np.exp(np.cumsum(steps)), self.digits)
+            self.last_price = float(prices[-1])
+            self.tick_times = np.r_[self.tick_times, times]
+            self.tick_prices = np.r_[self.tick_prices, prices]
+        self.generated_to = now_ms
+
+        closed = []
+        while self.forming + 60 <= now_ms // 1000:
+            bar = self._aggregate(self.forming)
+            if bar is not None:
+                closed.append(bar)
+            self.forming += 60
+        if closed:
+            self.history = np.r_[self.history, np.array(closed, dtype=RATES_DTYPE)]
+
+        threshold = min(self.forming * 1000, now_ms - self.TICK_RETENTION * 1000)
+        self.retained_from = max(self.retained_from, threshold)
+        keep = self.tick_times >= threshold
+        if not keep.all():
+            self.tick_times = self.tick_times[keep]
+            self.tick_prices = self.tick_prices[keep]
+
+    def _aggregate(self, minute: int) -> Optional[tuple]:
+        """一分钟内的报价汇总为一根K线，没有报价时不生成"""
+        lo, hi = np.searchsorted(self.tick_times, [minute * 1000, (minute + 60) * 1000])
+        if hi <= lo:
+            return None
+        prices = self.tick_prices[lo:hi]
+        return (minute, prices[0], prices.max(), prices.min(), prices[-1], hi - lo, 0, 0)
+
+    def m1(self) -> np.ndarray:
+        """全部M1 K线，包括正在形成的一根"""
+        forming = self._aggregate(self.forming)
+        if forming is None:
+            return self.history
+        return np.r_[self.history, np.array([forming], dtype=RATES_DTYPE)]
+
+    def rates(self, seconds: int, start_pos: int, count: int) -> np.ndarray:
+        needed = start_pos + count
+        m1 = self.m1()
+        if seconds > 60:
+            # 只汇总所需的尾部，多取一个周期以丢弃可能不完整的第一根
+            tail = (needed + 1) * seconds // 60
+            partial = tail < len(m1)
+            m1 = m1[-tail:]
+            buckets = m1['time'] // seconds * seconds
+            starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            ends = np.r_[starts[1:], len(m1)]
+            rates = np.zeros(len(starts), dtype=RATES_DTYPE)
+            rates['time'] = buckets[starts]
+            rates['open'] = m1['open'][starts]
+            rates['close'] = m1['close'][ends - 1]
+            rates['high'] = np.maximum.reduceat(m1['high'], starts)
+            rates['low'] = np.minimum.reduceat(m1['low'], starts)
+            rates['tick_volume'] = np.add.reduceat(m1['tick_volume'], starts)
+            m1 = rates[1:] if partial else rates
+        end = len(m1) - start_pos
+        return m1[max(0, end - count):max(0, end)].copy()
+
+    def ticks_from(self, since_ms: int, count: int) -> np.ndarray:
+        lo = int(np.searchsorted(self.tick_times, since_ms))
+        times = self.tick_times[lo:lo + count]
+        prices = self.tick_prices[lo:lo + count]
+        ticks = np.zeros(len(times), dtype=TICK_DTYPE)
+        ticks['time_msc'] = times
+        ticks['time'] = times // 1000
+        ticks['bid'] = prices
+        ticks['ask'] = prices + self.point * 10
+        return ticks
+
+    def tick_time(self, minute: int, volume: int) -> Optional[int]:
+        """某分钟第volume笔报价的时间（毫秒），已不在保留范围内时返回None"""
+        if minute * 1000 < self.retained_from:
+            return None
+        lo, hi = np.searchsorted(self.tick_times, [minute * 1000, (minute + 60) * 1000])
+        if volume < 1 or lo + volume > hi:
+            return None
+        return int(self.tick_times[lo + volume - 1])
+
+
+class SyntheticGateway:
+    """模拟的MT5网关，接口与MetaTrader5模块一致
+
+    symbols 为预先创建的品种，其他品种在第一次被请求时创建。replay_dir 中的
+    {symbol}.npy（copy_rates_from_pos 返回的数组经 np.save 保存）或 {symbol}.csv
+    （表头 time,open,high,low,close,tick_volume）作为历史K线回放，否则按随机游走生成。
+    clock 返回当前时间（秒），用于测试。
+    """
+
+    TIMEFRAME_M1 = TIMEFRAME_M1
+    TIMEFRAME_M5 = TIMEFRAME_M5
+    TIMEFRAME_M15 = TIMEFRAME_M15
+    TIMEFRAME_M30 = TIMEFRAME_M30
+    TIMEFRAME_H1 = TIMEFRAME_H1
+    TIMEFRAME_H4 = TIMEFRAME_H4
+    TIMEFRAME_D1 = TIMEFRAME_D1
+    COPY_TICKS_ALL = COPY_TICKS_ALL
+
+    def __init__(self, symbols: Iterable[str] = DEFAULT_SYMBOLS, seed: int = 0, history_bars: int = 20000,
+                 tick_rate: float = 2.0, replay_dir: str = None, clock=None):
+        self.seed = seed
+        self.history_bars = history_bars
+        self.tick_rate = tick_rate
+        self.replay_dir = replay_dir
+        self.clock = clock or time.time
+        self.lock = threading.Lock()
+        self.connected = False
+        self.symbols: Dict[str, SyntheticSymbol] = {}
+        for name in symbols:
+            self._symbol(name)
+
+    def _load_history(self, name: str) -> Optional[np.ndarray]:
+        if not self.replay_dir:
+            return None
+        path = os.path.join(self.replay_dir, name)
+        if os.path.exists(path + '.npy'):
+            return np.load(path + '.npy').astype(RATES_DTYPE)
+        if os.path.exists(path + '.csv'):
+            table = np.genfromtxt(path + '.csv', delimiter=',', names=True)
+            history = np.zeros(len(table), dtype=RATES_DTYPE)
+            for field in ('time', 'open', 'high', 'low', 'close', 'tick_volume'):
+                history[field] = table[field]
+            return history
+        return None
+
+    def _symbol(self, name: str) -> SyntheticSymbol:
+        symbol = self.symbols.get(name)
+        if symbol is None:
+            # 每个品种的行情只由seed和品种名决定
+            rng = np.random.default_rng([self.seed, zlib.crc32(name.encode())])
+            symbol = self.symbols[name] = SyntheticSymbol(
+                name, rng, self.clock(), self.history_bars, self.tick_rate, self._load_history(name)
+            )
+        return symbol
+
+    def _advanced(self, name: str) -> SyntheticSymbol:
+        symbol = self._symbol(name)
+        symbol.advance(self.clock())
+        return symbol
+
+    def initialize(self, *args, **kwargs) -> bool:
+        self.connected = True
+        return True
+
+    def shutdown(self):
+        self.connected = False
+
+    def terminal_info(self):
+        if not self.connected:
+            return None
+        return SimpleNamespace(connected=True, name='synthetic', trade_allowed=False)
+
+    def last_error(self):
+        return (1, 'Success')
+
+    def symbols_get(self, group: str = None) -> List[SimpleNamespace]:
+        with self.lock:
+            return [
+                SimpleNamespace(name=name, digits=symbol.digits, point=symbol.point,
+                                description=f"synthetic {name}", visible=True)
+                for name, symbol in self.symbols.items()
+            ]
+
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        with self.lock:
+            self._symbol(symbol)
+        return True
+
+    def symbol_info_tick(self, symbol: str):
+        with self.lock:
+            state = self._advanced(symbol)
+            if not state.tick_times.size:
+                return None
+            tick = state.ticks_from(int(state.tick_times[-1]), 1)[0]
+        return SimpleNamespace(**{name: tick[name].item() for name in TICK_DTYPE.names})
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int):
+        seconds = TIMEFRAME_SECONDS.get(timeframe)
+        if seconds is None:
+            return None
+        with self.lock:
+            return self._advanced(symbol).rates(seconds, start_pos, count)
+
+    def copy_ticks_from(self, symbol: str, date_from, count: int, flags: int = COPY_TICKS_ALL):
+        since = int(date_from.timestamp() if hasattr(date_from, 'timestamp') else date_from) * 1000
+        with self.lock:
+            return self._advanced(symbol).ticks_from(since, count)
+
+    def tick_time(self, symbol: str, minute: int, volume: int) -> Optional[int]:
+        """M1 K线 minute 中第volume笔报价的时间（毫秒），用于计算端到端延迟"""
+        with self.lock:
+            state = self.symbols.get(symbol)
+            return state.tick_time(minute, volume) if state else None
@@ -0,0 +1,42 @@
+"""采集端指标（Prometheus文本格式），由本地HTTP端口输出
+
+- 每个品种/周期的MT5读取耗时和上传耗时（批量上传时为包含该序列的请求的耗时）
+- 每个上传请求的耗时、请求体大小和失败次数
+- 采集周期各阶段耗时
+"""
+import threading
+
+from prometheus_client import Counter, Histogram, start_http_server
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+FETCH_DURATION = Histogram(
+    'collector_fetch_duration_seconds', 'MT5读取K线耗时', ['symbol', 'timeframe'], buckets=LATENCY_BUCKETS
+)
+UPLOAD_DURATION = Histogram(
+    'collector_upload_duration_seconds', '上传耗时（含发送失败后写入缓冲）', ['symbol', 'timeframe'],
+    buckets=LATENCY_BUCKETS
+)
+REQUEST_DURATION = Histogram(
+    'collector_request_duration_seconds', '上传请求耗时', ['endpoint'], buckets=LATENCY_BUCKETS
+)
+REQUEST_SIZE = Histogram('collector_request_size_bytes', '上传请求体字节数', ['endpoint'], buckets=SIZE_BUCKETS)
+REQUEST_FAILURES = Counter('collector_request_failures_total', '上传请求失败次数', ['endpoint'])
+CYCLE_DURATION = Histogram(
+    'collector_cycle_duration_seconds', '采集周期耗时，stage为 total/fetch/upload/wait', ['stage'],
+    buckets=LATENCY_BUCKETS
+)
+
+_server_lock = threading.Lock()
+_server_port = None
+
+
+def start_server(port: int, host: str = '127.0.0.1') -> bool:
+    """启动指标HTTP服务，同一进程中只启动一次；端口被占用时抛出OSError"""
+    global _server_port
+    with _server_lock:
+        if _server_port is None:
+            start_http_server(port, addr=host)
+            _server_port = port
+        return _server_port == port
@@ -0,0 +1,141 @@
+"""按K线收盘时间调度采集任务
+
+每个 品种/周期 是一个任务：在K线收盘后稍等 close_delay 秒读取刚收盘的K线，
+两次收盘之间按 forming_interval 轮询正在形成的K线。较高周期的轮询只在该品种的
+最低周期数据发生变化后执行。每次执行记录相对目标时间的延迟。
+"""
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TIMEFRAME_SECONDS = {
+    'M1': 60,
+    'M5': 300,
+    'M15': 900,
+    'M30': 1800,
+    'H1': 3600,
+    'H4': 14400,
+    'D1': 86400,
+}
+
+
+class Job:
+    """一个 品种/周期 的调度状态"""
+    __slots__ = ('symbol', 'timeframe', 'seconds', 'next_close', 'next_poll', 'target', 'closes',
+                 'last_fetch', 'last_bar', 'runs', 'skipped', 'late_last', 'late_max', 'late_total')
+
+    def __init__(self, symbol: str, timeframe: str, seconds: int):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.seconds = seconds
+        self.next_close = 0.0
+        self.next_poll = 0.0
+        self.target = 0.0
+        # 已执行的收盘读取次数，用于决定何时发送完整窗口
+        self.closes = 0
+        self.last_fetch = None
+        self.last_bar = None
+        self.runs = 0
+        self.skipped = 0
+        self.late_last = 0.0
+        self.late_max = 0.0
+        self.late_total = 0.0
+
+    def record_run(self, started: float):
+        """记录一次执行，延迟为实际开始时间与目标时间之差"""
+        late = max(0.0, started - self.target)
+        self.runs += 1
+        self.late_last = late
+        self.late_max = max(self.late_max, late)
+        self.late_total += late
+
+    def stats(self) -> Dict:
+        return {
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'late_last_ms': round(self.late_last * 1000, 1),
+            'late_max_ms': round(self.late_max * 1000, 1),
+            'late_avg_ms': round(self.late_total / self.runs * 1000, 1) if self.runs else 0.0,
+        }
+
+
+class BarScheduler:
+    """K线收盘对齐的任务调度"""
+
+    def __init__(self, series: Iterable[Tuple[str, str]], close_delay: float = 1.0,
+                 forming_interval: float = 10.0, utc_offset_hours: float = 0):
+        self.close_delay = close_delay
+        self.forming_interval = forming_interval
+        # MT5服务器时间相对UTC的偏移，H4/D1按服务器时间收盘
+        self.offset = int(utc_offset_hours * 3600)
+        self.jobs: List[Job] = []
+        self.base_seconds: Dict[str, int] = {}
+        self.changed_at: Dict[str, float] = {}
+        self.set_series(series)
+
+    def set_series(self, series: Iterable[Tuple[str, str]]):
+        """更换调度的 品种/周期，保留仍在其中的任务的状态，新增的任务立即执行"""
+        jobs = {(job.symbol, job.timeframe): job for job in self.jobs}
+        self.jobs = [jobs.get((symbol, tf)) or Job(symbol, tf, TIMEFRAME_SECONDS[tf]) for symbol, tf in series]
+        # 每个品种的最低周期，较高周期是否需要轮询取决于它是否有变化
+        self.base_seconds = {}
+        for job in self.jobs:
+            self.base_seconds[job.symbol] = min(self.base_seconds.get(job.symbol, job.seconds), job.seconds)
+        self.changed_at = {symbol: t for symbol, t in self.changed_at.items() if symbol in self.base_seconds}
+
+    def next_boundary(self, seconds: int, now: float) -> float:
+        """now之后第一个收盘时间加上close_delay"""
+        shifted = now + self.offset - self.close_delay
+        return (shifted // seconds + 1) * seconds - self.offset + self.close_delay
+
+    def due(self, now: Optional[float] = None) -> List[Tuple[Job, bool]]:
+        """返回到期的任务 [(job, 是否为收盘读取)]，并推进它们的下一次目标时间"""
+        now = time.time() if now is None else now
+        result = []
+        for job in self.jobs:
+            if now >= job.next_close:
+                # 首次执行的目标时间为当前时间
+                job.target = job.next_close or now
+                job.next_close = self.next_boundary(job.seconds, now)
+                job.next_poll = now + self.forming_interval
+                result.append((job, True))
+            elif self.forming_interval > 0 and now >= job.next_poll:
+                job.target = job.next_poll
+                job.next_poll = max(job.next_poll + self.forming_interval, now)
+                if self.is_idle(job):
+                    job.skipped += 1
+                    continue
+                result.append((job, False))
+        return result
+
+    def next_wake(self) -> float:
+        """下一个任务到期的时间"""
+        targets = [job.next_close for job in self.jobs]
+        if self.forming_interval > 0:
+            targets += [job.next_poll for job in self.jobs]
+        return min(targets) if targets else time.time() + 1
+
+    def is_idle(self, job: Job) -> bool:
+        """较高周期自上次读取后该品种的最低周期没有变化，可以跳过"""
+        if job.seconds == self.base_seconds[job.symbol] or job.last_fetch is None:
+            return False
+        return self.changed_at.get(job.symbol, 0.0) <= job.last_fetch
+
+    def fetch_count(self, job: Job, now: float, window: int) -> int:
+        """本次需要读取的K线数：覆盖上次读取之后的全部K线，首次读取完整窗口"""
+        if job.last_fetch is None:
+            return window
+        return min(window, int((now - job.last_fetch) // job.seconds) + 2)
+
+    def record_fetch(self, job: Job, started: float, last_bar: Optional[Dict]):
+        """记录一次读取结果，最低周期的最新K线变化时标记该品种有变化"""
+        job.record_run(started)
+        if last_bar is None:
+            return
+        job.last_fetch = started
+        if last_bar != job.last_bar:
+            job.last_bar = last_bar
+            if job.seconds == self.base_seconds[job.symbol]:
+                self.changed_at[job.symbol] = started
+
+    def stats(self) -> Dict:
+        return {f"{job.symbol}_{job.timeframe}": job.stats() for job in self.jobs}
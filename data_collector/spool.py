@@ -0,0 +1,197 @@
+"""上传失败时的本地磁盘缓冲（spool）
+
+发送失败或缓冲中仍有积压时，待上传的序列按顺序追加写入一个JSON Lines文件，
+服务端恢复后按写入顺序分批重放，保证同一序列的新数据不会被旧数据覆盖。
+文件超过大小上限时合并同一序列被覆盖的K线（同一时间只保留最新一根）。
+被服务端拒绝（4xx，重试也不会成功）的记录移入 {path}.rejected，不再阻塞后面的记录。
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 合并时保留的读取时间戳字段
+STAMP_FIELDS = ('fetched_at', 'bar_close')
+
+
+class UploadSpool:
+    """追加写入、按顺序重放的上传缓冲文件"""
+
+    def __init__(self, path: str = 'spool.jsonl', max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.rejected_path = path + '.rejected'
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # 已重放部分的结束位置，积压全部重放后清空文件
+        self.offset = 0
+        # 每次合并后递增，合并前读出的批次不能再提交
+        self.generation = 0
+        self.read_generation = 0
+        self.records = 0
+        self.bars = 0
+        self.compactions = 0
+        self.dropped_bars = 0
+        self.rejected_records = 0
+        self.replayed_bars = 0
+        self.replay_rate = 0.0
+        self.last_replay = None
+        if os.path.exists(path):
+            records, end = self._read(0)
+            self.records = len(records)
+            self.bars = sum(len(record['data']) for record in records)
+            # 丢弃上次退出时写了一半的行
+            if end < self._size():
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+
+    def _read(self, offset: int, max_records: int = None, max_bytes: int = None) -> Tuple[List[Dict], int]:
+        """从offset开始读取记录，返回 (记录列表, 结束位置)，忽略末尾写了一半的行
+
+        max_bytes 限制读出的总字节数，但至少读出一条记录。
+        """
+        records = []
+        if not os.path.exists(self.path):
+            return records, offset
+        size = 0
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while max_records is None or len(records) < max_records:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                if max_bytes is not None and records and size + len(line) > max_bytes:
+                    break
+                size += len(line)
+                offset += len(line)
+                records.append(json.loads(line))
+        return records, offset
+
+    def _size(self) -> int:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def pending(self) -> int:
+        """积压的序列记录数"""
+        return self.records
+
+    def append(self, series: List[Dict]):
+        """按顺序追加待上传的序列 {symbol, timeframe, data, mode}"""
+        if not series:
+            return
+        lines = b''.join(json.dumps(item, ensure_ascii=False).encode('utf-8') + b'\n' for item in series)
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self.records += len(series)
+            self.bars += sum(len(item['data']) for item in series)
+            if self._size() > self.max_bytes:
+                self._compact()
+
+    def read_batch(self, max_records: int, max_bytes: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """读取下一批待重放的记录（不超过max_records条、max_bytes字节），重放成功后调用commit"""
+        with self.lock:
+            self.read_generation = self.generation
+            return self._read(self.offset, max_records, max_bytes)
+
+    def reject(self, records: List[Dict], reason: str):
+        """把被服务端拒绝的记录写入 .rejected 文件，之后仍需调用commit跳过它们"""
+        rejected_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        lines = b''.join(
+            json.dumps({'rejected_at': rejected_at, 'reason': reason, 'record': record},
+                       ensure_ascii=False).encode('utf-8') + b'\n'
+            for record in records
+        )
+        with self.lock:
+            with open(self.rejected_path, 'ab') as f:
+                f.write(lines)
+            self.rejected_records += len(records)
+
+    def commit(self, offset: int, records: List[Dict]):
+        """标记一批记录已重放成功，期间发生过合并时不提交（合并后的记录会再次重放，合并写入是幂等的）"""
+        with self.lock:
+            if self.read_generation != self.generation:
+                return
+            self.offset = offset
+            self.records -= len(records)
+            self.bars -= sum(len(item['data']) for item in records)
+            if offset >= self._size():
+                open(self.path, 'wb').close()
+                self.offset = 0
+                self.records = 0
+                self.bars = 0
+
+    def record_replay(self, bars: int, elapsed: float):
+        """记录一次重放的K线数和耗时"""
+        with self.lock:
+            self.replayed_bars += bars
+            self.replay_rate = round(bars / elapsed, 1) if elapsed > 0 else 0.0
+            self.last_replay = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    def _compact(self):
+        """合并积压记录：同一序列相邻的同模式记录合并为一条，同一时间的K线只保留最新写入的一根
+
+        merge记录合并为一条merge；replace记录只与时间范围相接或重叠的上一条replace合并，
+        否则合并后的replace会删除两者之间服务端已有的K线。读取时间戳取最新一条记录的。
+        合并后仍超过上限时，按比例丢弃各记录最早的K线。
+        """
+        records, _ = self._read(self.offset)
+        entries: List[Dict] = []
+        # 每个序列最近的一条合并记录
+        current: Dict[Tuple[str, str], Dict] = {}
+        for record in records:
+            key = (record['symbol'], record['timeframe'])
+            mode = record.get('mode', 'merge')
+            entry = current.get(key)
+            if entry is None or entry['mode'] != mode or (
+                    mode == 'replace' and record['data'] and entry['bars']
+                    and record['data'][0]['time'] > max(entry['bars'])):
+                entry = current[key] = {'symbol': key[0], 'timeframe': key[1], 'mode': mode, 'bars': {},
+                                        'stamps': {}}
+                entries.append(entry)
+            for bar in record['data']:
+                entry['bars'][bar['time']] = bar
+            entry['stamps'].update({field: record[field] for field in STAMP_FIELDS if field in record})
+
+        compacted = [
+            {'symbol': entry['symbol'], 'timeframe': entry['timeframe'],
+             'data': [entry['bars'][t] for t in sorted(entry['bars'])], 'mode': entry['mode'], **entry['stamps']}
+            for entry in entries
+        ]
+        lines = [json.dumps(item, ensure_ascii=False).encode('utf-8') + b'\n' for item in compacted]
+        size = sum(len(line) for line in lines)
+        if size > self.max_bytes:
+            # 留出余量，避免下次追加后立即再次合并
+            ratio = self.max_bytes * 0.8 / size
+            for item in compacted:
+                keep = max(1, int(len(item['data']) * ratio))
+                self.dropped_bars += len(item['data']) - keep
+                item['data'] = item['data'][-keep:]
+            lines = [json.dumps(item, ensure_ascii=False).encode('utf-8') + b'\n' for item in compacted]
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.offset = 0
+        self.generation += 1
+        self.records = len(compacted)
+        self.bars = sum(len(item['data']) for item in compacted)
+        self.compactions += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'depth_records': self.records,
+                'depth_bars': self.bars,
+                'depth_bytes': max(0, self._size() - self.offset),
+                'replayed_bars': self.replayed_bars,
+                'replay_rate': self.replay_rate,
+                'last_replay': self.last_replay,
+                'compactions': self.compactions,
+                'dropped_bars': self.dropped_bars,
+                'rejected_records': self.rejected_records,
+            }
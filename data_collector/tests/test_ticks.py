@@ -0,0 +1,117 @@
+"""逐笔模式：用 ScriptedTickSource 回放跨越K线收盘的报价，检查 TickStreamer 合并后的推送
+
+在 data_collector 目录执行：python -m pytest -q tests
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bars import format_bar_times  # noqa: E402
+from gateway import TIMEFRAME_M1, TIMEFRAME_M5  # noqa: E402
+from ticks import ScriptedTickSource, TickStreamer  # noqa: E402
+
+SYMBOL = 'EURUSD'
+CODES = {'M1': TIMEFRAME_M1, 'M5': TIMEFRAME_M5}
+
+
+def bar_time(epoch: int) -> str:
+    return format_bar_times(np.array([epoch]))[0]
+
+
+class Clock:
+    """脚本时钟（毫秒），由测试推进"""
+
+    def __init__(self, now_ms: int):
+        self.now_ms = now_ms
+
+    def __call__(self) -> int:
+        return self.now_ms
+
+
+def make_streamer(ticks, clock, sends, results=None):
+    results = list(results or [])
+
+    def send(series):
+        sends.append(series)
+        return results.pop(0) if results else True
+
+    source = ScriptedTickSource({SYMBOL: ticks}, clock=clock)
+    return TickStreamer(source, [(SYMBOL, 'M1'), (SYMBOL, 'M5')], CODES, send=send)
+
+
+def future_minute() -> int:
+    """当前时间之后的一个M1收盘时间（不是M5收盘），报价都晚于TickStreamer的起点"""
+    minute = (int(time.time()) // 60 + 2) * 60
+    return minute + 60 if minute % 300 == 0 else minute
+
+
+def bars_of(push, timeframe):
+    return next(item['data'] for item in push if item['timeframe'] == timeframe)
+
+
+def test_ticks_across_bar_close_are_coalesced():
+    close = future_minute()
+    ticks = [
+        ((close - 3) * 1000, 1.10), ((close - 2) * 1000, 1.12), ((close - 1) * 1000, 1.09),
+        ((close + 1) * 1000, 1.11), ((close + 2) * 1000 + 500, 1.13),
+    ]
+    clock = Clock((close - 30) * 1000)
+    sends = []
+    streamer = make_streamer(ticks, clock, sends)
+
+    # 还没有报价：起点为当前时间而不是0，没有推送
+    streamer.step()
+    assert streamer.cursors[SYMBOL] >= (close - 120) * 1000
+    assert sends == []
+
+    # 收盘前的三笔报价合并为一次推送，每个周期一根K线
+    clock.now_ms = (close - 1) * 1000
+    streamer.step()
+    assert len(sends) == 1
+    m1 = bars_of(sends[0], 'M1')
+    assert m1 == [{'time': bar_time(close - 60), 'open': 1.10, 'close': 1.09, 'high': 1.12, 'low': 1.09,
+                   'volume': 3.0}]
+    assert bars_of(sends[0], 'M5')[0]['volume'] == 3.0
+
+    # 跨过收盘的两笔报价：M1推送收盘K线的最终状态和新K线，M5仍是同一根K线
+    clock.now_ms = (close + 5) * 1000
+    streamer.step()
+    assert len(sends) == 2
+    m1 = bars_of(sends[1], 'M1')
+    assert [bar['time'] for bar in m1] == [bar_time(close - 60), bar_time(close)]
+    assert m1[0]['volume'] == 3.0
+    assert m1[1] == {'time': bar_time(close), 'open': 1.11, 'close': 1.13, 'high': 1.13, 'low': 1.11,
+                     'volume': 2.0}
+    m5 = bars_of(sends[1], 'M5')
+    assert len(m5) == 1 and m5[0]['volume'] == 5.0 and m5[0]['close'] == 1.13
+
+    # 没有新报价时不推送
+    streamer.step()
+    assert len(sends) == 2
+    assert streamer.stats() == {'ticks': 5, 'pushes': 2, 'pending': 0}
+
+
+def test_failed_push_is_merged_into_the_next_one():
+    close = future_minute()
+    ticks = [((close - 2) * 1000, 1.10), ((close + 1) * 1000, 1.20), ((close + 2) * 1000, 1.25)]
+    clock = Clock((close - 30) * 1000)
+    sends = []
+    streamer = make_streamer(ticks, clock, sends, results=[False])
+    streamer.step()
+
+    clock.now_ms = (close - 1) * 1000
+    streamer.step()
+    assert len(sends) == 1 and streamer.pushes == 0
+
+    # 重试时与新的变化合并：收盘K线和新K线在同一次推送中，新K线只有最新状态
+    clock.now_ms = (close + 3) * 1000
+    streamer.step()
+    assert len(sends) == 2 and streamer.pushes == 1
+    m1 = bars_of(sends[1], 'M1')
+    assert [(bar['time'], bar['close'], bar['volume']) for bar in m1] == [
+        (bar_time(close - 60), 1.10, 1.0), (bar_time(close), 1.25, 2.0)
+    ]
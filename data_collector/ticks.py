@@ -0,0 +1,235 @@
+"""由逐笔报价实时更新正在形成的K线
+
+按固定间隔通过 copy_ticks_from 读取新到的报价，更新每个 品种/周期 当前K线的
+开高低收和成交笔数；同一间隔内的多笔报价合并为一次推送，只发送发生变化的K线。
+收盘K线仍以 copy_rates_from_pos 的结果为准（由采集主循环在收盘时重新读取）。
+"""
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from bars import format_bar_times
+from gateway import COPY_TICKS_ALL, TICK_DTYPE
+from scheduler import TIMEFRAME_SECONDS
+
+
+class FormingBar:
+    """一个 品种/周期 正在形成的K线"""
+    __slots__ = ('seconds', 'bucket', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self.bucket = None
+
+    def seed(self, rate):
+        """用 copy_rates_from_pos 返回的当前K线初始化"""
+        self.bucket = int(rate['time'])
+        self.open = float(rate['open'])
+        self.high = float(rate['high'])
+        self.low = float(rate['low'])
+        self.close = float(rate['close'])
+        self.volume = float(rate['tick_volume'])
+
+    def rolls(self, epoch: int) -> bool:
+        """该报价是否属于下一根K线"""
+        return self.bucket is not None and epoch - epoch % self.seconds > self.bucket
+
+    def add(self, epoch: int, price: float):
+        """加入一笔报价，早于当前K线的报价忽略"""
+        bucket = epoch - epoch % self.seconds
+        if self.bucket is None or bucket > self.bucket:
+            self.bucket = bucket
+            self.open = self.high = self.low = self.close = price
+            self.volume = 1.0
+        elif bucket == self.bucket:
+            self.high = max(self.high, price)
+            self.low = min(self.low, price)
+            self.close = price
+            self.volume += 1
+
+    def record(self) -> Dict:
+        return {
+            'time': format_bar_times(np.array([self.bucket]))[0],
+            'open': self.open,
+            'close': self.close,
+            'high': self.high,
+            'low': self.low,
+            'volume': self.volume,
+        }
+
+
+class TickStreamer:
+    """读取逐笔报价并按固定间隔推送正在形成的K线
+
+    source 提供 copy_ticks_from / copy_rates_from_pos（MT5网关或 ScriptedTickSource），
+    send 接收 [{symbol, timeframe, data, mode}] 并返回是否发送成功。
+    server_utc_offset 为MT5服务器时间相对UTC的秒数，取不到最新报价时据此以服务器当前时间为起点。
+    """
+
+    def __init__(self, source, series: Iterable[Tuple[str, str]], timeframe_codes: Dict[str, int],
+                 send: Callable[[List[Dict]], bool], interval: float = 0.25,
+                 lock: Optional[threading.RLock] = None, logger=None, server_utc_offset: int = 0):
+        self.source = source
+        self.server_utc_offset = server_utc_offset
+        self.timeframe_codes = timeframe_codes
+        self.send = send
+        self.interval = interval
+        self.lock = lock or threading.RLock()
+        self.logger = logger
+        self.bars: Dict[str, Dict[str, FormingBar]] = {}
+        for symbol, timeframe in series:
+            self.bars.setdefault(symbol, {})[timeframe] = FormingBar(TIMEFRAME_SECONDS[timeframe])
+        # 由其他线程更换的 品种/周期，在推送线程的下一次step开始时生效
+        self.next_series: Optional[List[Tuple[str, str]]] = None
+        # 每个品种已处理的最后一笔报价（毫秒）
+        self.cursors: Dict[str, int] = {}
+        # 尚未发送的K线 {(symbol, timeframe): {time: bar}}，同一K线多次变化只保留最新一次
+        self.pending: Dict[Tuple[str, str], Dict[str, Dict]] = {}
+        # 每个品种最近一次读到新报价的本地时间（UTC秒），随上传发送用于计算延迟
+        self.fetched_at: Dict[str, float] = {}
+        self.ticks = 0
+        self.pushes = 0
+
+    def seed(self, symbol: str):
+        """以当前K线和最新一笔报价为起点，之后只处理新到的报价"""
+        with self.lock:
+            tick = self.source.symbol_info_tick(symbol)
+            for timeframe, bar in self.bars[symbol].items():
+                rates = self.source.copy_rates_from_pos(symbol, self.timeframe_codes[timeframe], 0, 1)
+                if rates is not None and len(rates):
+                    bar.seed(rates[-1])
+        if tick is not None:
+            # 报价时间是MT5服务器时间，有最新报价时以它为起点
+            self.cursors[symbol] = int(tick.time_msc)
+            return
+        # 没有最新报价（如休市）时以服务器当前时间为起点，且不早于当前K线的开盘时间，避免从1970年读起
+        opened = [bar.bucket for bar in self.bars[symbol].values() if bar.bucket is not None]
+        now = int((time.time() + self.server_utc_offset) * 1000)
+        self.cursors[symbol] = max([now] + [bucket * 1000 for bucket in opened])
+
+    def poll(self, symbol: str):
+        """读取一个品种的新报价并更新其各周期的当前K线"""
+        cursor = self.cursors.get(symbol)
+        if cursor is None:
+            self.seed(symbol)
+            cursor = self.cursors[symbol]
+        with self.lock:
+            ticks = self.source.copy_ticks_from(symbol, cursor // 1000, 100000, COPY_TICKS_ALL)
+        if ticks is None or len(ticks) == 0:
+            return
+        ticks = ticks[ticks['time_msc'] > cursor]
+        # 只有成交价或报价变化的笔（bid为0的笔不含价格）
+        ticks = ticks[ticks['bid'] > 0]
+        if len(ticks) == 0:
+            return
+        self.cursors[symbol] = int(ticks['time_msc'][-1])
+        self.fetched_at[symbol] = time.time()
+        self.ticks += len(ticks)
+        epochs = ticks['time'].tolist()
+        prices = ticks['bid'].tolist()
+        for timeframe, bar in self.bars[symbol].items():
+            changed = self.pending.setdefault((symbol, timeframe), {})
+            for epoch, price in zip(epochs, prices):
+                if bar.rolls(epoch):
+                    # 进入新K线前发送刚收盘K线的最终状态，之后由主循环按 copy_rates_from_pos 校正
+                    closed = bar.record()
+                    changed[closed['time']] = closed
+                bar.add(epoch, price)
+            current = bar.record()
+            changed[current['time']] = current
+
+    def flush(self) -> bool:
+        """发送合并后的K线"""
+        if not self.pending:
+            return True
+        series = [
+            {'symbol': symbol, 'timeframe': timeframe, 'data': [bars[t] for t in sorted(bars)], 'mode': 'merge',
+             'fetched_at': self.fetched_at.get(symbol)}
+            for (symbol, timeframe), bars in self.pending.items() if bars
+        ]
+        if not series:
+            return True
+        if not self.send(series):
+            # 发送失败时保留，下次与新的变化合并后重试
+            return False
+        self.pending = {}
+        self.pushes += 1
+        return True
+
+    def set_series(self, series: Iterable[Tuple[str, str]]):
+        """更换推送的 品种/周期（可在其他线程调用）"""
+        self.next_series = list(series)
+
+    def _apply_series(self):
+        series, self.next_series = self.next_series, None
+        bars = {}
+        for symbol, timeframe in series:
+            current = self.bars.get(symbol, {}).get(timeframe)
+            bars.setdefault(symbol, {})[timeframe] = current or FormingBar(TIMEFRAME_SECONDS[timeframe])
+        # 新增的品种重新以当前报价为起点，移除的品种丢弃未发送的K线
+        for symbol in set(self.cursors) - set(bars):
+            del self.cursors[symbol]
+        self.pending = {key: changed for key, changed in self.pending.items() if key[0] in bars}
+        self.bars = bars
+
+    def step(self):
+        if self.next_series is not None:
+            self._apply_series()
+        for symbol in self.bars:
+            try:
+                self.poll(symbol)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"读取{symbol}报价失败: {str(e)}")
+        self.flush()
+
+    def run(self, is_running: Callable[[], bool] = lambda: True):
+        """按interval循环读取报价并推送，直到is_running返回False"""
+        while is_running():
+            start = time.monotonic()
+            self.step()
+            time.sleep(max(0.0, self.interval - (time.monotonic() - start)))
+
+    def stats(self) -> Dict:
+        return {'ticks': self.ticks, 'pushes': self.pushes, 'pending': len(self.pending)}
+
+
+class ScriptedTickSource:
+    """按脚本回放报价的模拟数据源，用于在没有MT5终端时测试逐笔模式
+
+    ticks 为 {symbol: [(time_msc, bid), ...]}，clock 返回当前毫秒时间，只返回不晚于当前时间的报价。
+    """
+
+    def __init__(self, ticks: Dict[str, List[Tuple[int, float]]], clock: Callable[[], int] = None):
+        self.ticks = {}
+        for symbol, items in ticks.items():
+            array = np.zeros(len(items), dtype=TICK_DTYPE)
+            array['time_msc'] = [t for t, _ in items]
+            array['time'] = array['time_msc'] // 1000
+            array['bid'] = [price for _, price in items]
+            array['ask'] = array['bid']
+            self.ticks[symbol] = array
+        self.clock = clock or (lambda: int(time.time() * 1000))
+
+    def copy_ticks_from(self, symbol: str, date_from, count: int, flags: int):
+        ticks = self.ticks.get(symbol)
+        if ticks is None:
+            return None
+        since = int(date_from.timestamp() if hasattr(date_from, 'timestamp') else date_from) * 1000
+        mask = (ticks['time_msc'] >= since) & (ticks['time_msc'] <= self.clock())
+        return ticks[mask][:count]
+
+    def symbol_info_tick(self, symbol: str):
+        ticks = self.ticks.get(symbol)
+        if ticks is None:
+            return None
+        released = ticks[ticks['time_msc'] <= self.clock()]
+        if not len(released):
+            return None
+        return SimpleNamespace(**{name: released[-1][name].item() for name in TICK_DTYPE.names})
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start: int, count: int):
+        return None
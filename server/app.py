@@ -1,17 +1,46 @@
-from fastapi import FastAPI, HTTPException, Depends, Security
+from fastapi import FastAPI, HTTPException, Depends, Security, Query, Request
+from fastapi.responses import StreamingResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Optional
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
+import asyncio
+import hmac
+import logging
+import random
+import tempfile
+import time
+import uuid
+import zlib
+from contextlib import asynccontextmanager
+from email.utils import formatdate
 import jwt
 import json
-from redis import Redis
+import msgpack
+from redis.asyncio import Redis, ConnectionPool
 import uvicorn
 import configparser
 import os
 from typing import Union
 
+from timeframes import TimeframeAggregator, bar_score
+from push import Broadcaster, RESYNC, format_event
+from response_cache import ResponseCache, CachedResponse
+from token_cache import TokenCache
+from memory_store import FIELDS as BAR_VALUE_FIELDS, SeriesStore
+from archive import BarArchive, parse_scores
+from downsample import downsample
+from indicators import IndicatorEngine, parse_spec
+from freshness import FreshnessTracker
+from fleet import FleetCoordinator
+from series_cache import SeriesCache
+from sync import ClusterSync
+from metrics import (
+    MetricsMiddleware, INGESTED_BARS, multiprocess_enabled, prepare_multiprocess_dir,
+    render as render_metrics, timed_store, worker_exit
+)
+
 # 配置
 config = configparser.ConfigParser()
 try:
@@ -31,68 +60,372 @@ except Exception as e:
         'access_token_expire_days': '365'
     }
 
+# 日志：请求级别的日志为DEBUG级别，并按sample_rate抽样，避免在热路径上输出大量日志
+logging.basicConfig(
+    level=config.get('logging', 'level', fallback='INFO').upper(),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('candlestick')
+LOG_SAMPLE_RATE = config.getfloat('logging', 'sample_rate', fallback=0.01)
+
+def log_sampled(message: str):
+    """DEBUG级别开启时按LOG_SAMPLE_RATE抽样输出"""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE:
+        logger.debug(message)
+
+# 每个品种/周期保留的最大K线数量
+MAX_BARS = config.getint('storage', 'max_bars', fallback=100000)
+# 查询未指定limit时默认返回的K线数量
+DEFAULT_LIMIT = config.getint('storage', 'default_limit', fallback=300)
+# 内存模式下所有K线序列的内存预算（字节），超出时淘汰最久未读取的序列
+MEMORY_MAX_BYTES = config.getint('storage', 'memory_max_bytes', fallback=512 * 1024 * 1024)
+
+# 历史归档：已收盘的K线定期从热存储写入按列存放的分区文件，查询超出热存储范围时从归档读取
+archive = None
+if config.getboolean('archive', 'enabled', fallback=True):
+    archive = BarArchive(path=config.get('archive', 'path', fallback='archive'))
+# 写入归档的间隔（秒）
+ARCHIVE_INTERVAL = config.getint('archive', 'compact_interval', fallback=60)
+# 待归档的序列及其最早发生变化的K线时间
+archive_dirty: Dict[Tuple[str, str], int] = {}
+
+# 技术指标：被请求过的指标在入库时增量更新，保留最近capacity根K线的指标值
+indicator_engine = IndicatorEngine(
+    capacity=config.getint('indicators', 'capacity', fallback=5000),
+    max_tracks=config.getint('indicators', 'max_tracks', fallback=1000)
+)
+# 数据新鲜度：采集端上传的收盘/读取时间、入库时间和第一次被查询的时间
+freshness = FreshnessTracker(
+    window=config.getint('freshness', 'window', fallback=500),
+    stale_after=config.getfloat('freshness', 'stale_after', fallback=120)
+)
+
+# 批量上传的请求体上限（压缩后）和解压后的上限，超出时返回413；Nginx的client_max_body_size需一致
+MAX_BODY_BYTES = config.getint('server', 'max_body_bytes', fallback=8 * 1024 * 1024)
+MAX_DECOMPRESSED_BYTES = config.getint('server', 'max_decompressed_bytes', fallback=32 * 1024 * 1024)
+
+# 一次查询最多请求的指标数
+MAX_INDICATORS = config.getint('indicators', 'max_per_request', fallback=8)
+
+# 多工作进程：共用Redis存储，各进程在本地缓存热序列，入库通过Redis发布/订阅通知其他进程
+WORKERS = config.getint('server', 'workers', fallback=int(os.getenv('WEB_CONCURRENCY', '1')))
+SYNC_ENABLED = config.getboolean('sync', 'enabled', fallback=True)
+SYNC_CHANNEL = config.get('sync', 'channel', fallback='kline:sync')
+# 同步消息中附带变化K线的上限，超出时其他进程只使缓存失效并让推送订阅者重新获取快照
+SYNC_BARS_LIMIT = config.getint('sync', 'max_bars', fallback=1000)
+# 本地热序列缓存，只在Redis模式下启用
+series_cache = None
+if config.getboolean('sync', 'series_cache', fallback=True):
+    series_cache = SeriesCache(
+        size=config.getint('sync', 'cache_bars', fallback=1000),
+        max_series=config.getint('sync', 'cache_series', fallback=1000)
+    )
+cluster = None
+
+# 采集端集群：采集端通过心跳领取租约和品种分配，交接期间去重重叠的上传
+fleet = None
+if config.getboolean('fleet', 'enabled', fallback=True):
+    fleet = FleetCoordinator(
+        symbols=[s.strip() for s in config.get('fleet', 'symbols', fallback='').split(',') if s.strip()],
+        lease_ttl=config.getfloat('fleet', 'lease_ttl', fallback=30),
+        handover_grace=config.getfloat('fleet', 'handover_grace', fallback=0) or None
+    )
+
+# 多周期聚合：由源周期（M1）在入库时合成更高周期
+aggregator = None
+if config.getboolean('aggregation', 'enabled', fallback=True):
+    aggregator = TimeframeAggregator(
+        source=config.get('aggregation', 'source', fallback='M1'),
+        targets=[tf.strip() for tf in config.get(
+            'aggregation', 'timeframes', fallback='M5,M15,M30,H1,H4,D1').split(',') if tf.strip()]
+    )
+# 聚合状态按品种加锁：同一品种的入库串行更新，不同品种互不阻塞
+aggregation_locks: Dict[str, asyncio.Lock] = {}
+
 # FastAPI应用
 app = FastAPI(title="Candlestick Data API")
 
 # 安全认证
 security = HTTPBearer()
+# 推送通道没有Authorization头时（如浏览器EventSource）从query参数读取token
+optional_security = HTTPBearer(auto_error=False)
+
+# 已验证令牌缓存，max_size为0时不缓存；吊销检查不受缓存影响
+token_cache = TokenCache(
+    max_size=config.getint('token_cache', 'max_size', fallback=1024),
+    ttl=config.getfloat('token_cache', 'ttl', fallback=300)
+)
+# 配置中吊销的客户端，其令牌立即失效
+REVOKED_CLIENTS = {
+    client.strip() for client in config.get('jwt', 'revoked_clients', fallback='').split(',') if client.strip()
+}
+if REVOKED_CLIENTS:
+    token_cache.add_deny_hook(lambda token, data: data.client_id in REVOKED_CLIENTS)
+
+# 实时推送
+broadcaster = Broadcaster(queue_size=config.getint('push', 'queue_size', fallback=100))
+# 推送连接的心跳间隔（秒），防止代理因空闲断开连接
+HEARTBEAT_INTERVAL = config.getint('push', 'heartbeat_interval', fallback=15)
+
+# K线查询响应缓存：保存最终响应字节及用到的压缩版本，入库时失效
+MIN_COMPRESS_SIZE = config.getint('cache', 'min_compress_size', fallback=512)
+response_cache = None
+if config.getboolean('cache', 'enabled', fallback=True):
+    response_cache = ResponseCache(
+        max_bytes=config.getint('cache', 'max_bytes', fallback=64 * 1024 * 1024),
+        min_compress_size=MIN_COMPRESS_SIZE
+    )
 
 # 数据存储类
 class DataStore:
+    """K线数据存储，Redis模式使用异步客户端和连接池，不阻塞事件循环"""
     def __init__(self, use_redis: bool = False, redis_config: dict = None):
         self.use_redis = use_redis
         if use_redis and redis_config:
-            self.redis_client = Redis(
+            self.redis_pool = ConnectionPool(
                 host=redis_config['host'],
                 port=int(redis_config['port']),
                 password=redis_config.get('password', 'mycandle'),
+                max_connections=int(redis_config.get('max_connections', 100)),
+                health_check_interval=int(redis_config.get('health_check_interval', 30)),
+                socket_timeout=float(redis_config.get('socket_timeout', 5)),
+                socket_connect_timeout=float(redis_config.get('socket_timeout', 5)),
                 decode_responses=True
             )
+            self.redis_client = Redis(connection_pool=self.redis_pool)
         else:
-            self.memory_store = {}
-            self.symbols = set()
+            self._init_memory()
+
+    def _init_memory(self):
+        self.use_redis = False
+        self.memory_store = {}
+        self.memory_meta = {}
+        self.memory_series = SeriesStore(max_bytes=MEMORY_MAX_BYTES)
+        self.memory_sets = {}
+
+    async def connect(self):
+        """检查Redis连接，不可用时改用内存存储"""
+        if not self.use_redis:
+            return
+        try:
+            await self.redis_client.ping()
+        except Exception as e:
+            print(f"Redis连接失败，使用内存存储: {str(e)}")
+            await self.close()
+            self._init_memory()
 
-    def set(self, key: str, value: str, ex: int = None):
+    async def close(self):
+        """关闭Redis连接池"""
+        if self.use_redis:
+            await self.redis_client.close()
+            await self.redis_pool.disconnect()
+
+    @timed_store('set')
+    async def set(self, key: str, value: str, ex: int = None):
         """存储数据"""
         if self.use_redis:
-            self.redis_client.set(key, value, ex=ex)
+            await self.redis_client.set(key, value, ex=ex)
         else:
             self.memory_store[key] = value
 
-    def get(self, key: str) -> Optional[str]:
+    @timed_store('get')
+    async def get(self, key: str) -> Optional[str]:
         """获取数据"""
         if self.use_redis:
-            return self.redis_client.get(key)
+            return await self.redis_client.get(key)
         else:
             return self.memory_store.get(key)
 
-    def sadd(self, key: str, value: str):
+    def _memory_update_meta(self, key: str, fields: Dict):
+        meta = self.memory_meta.setdefault(key, {})
+        meta.update(fields)
+        meta['version'] = meta.get('version', 0) + 1
+
+    @timed_store('update_meta')
+    async def update_meta(self, key: str, fields: Dict):
+        """更新序列元数据并递增其版本号"""
+        if self.use_redis:
+            pipe = self.redis_client.pipeline()
+            pipe.hset(key, mapping=fields)
+            pipe.hincrby(key, 'version', 1)
+            await pipe.execute()
+        else:
+            self._memory_update_meta(key, fields)
+
+    @timed_store('get_meta')
+    async def get_meta(self, key: str) -> Optional[Dict]:
+        """读取序列元数据，不存在时返回None"""
+        if self.use_redis:
+            meta = await self.redis_client.hgetall(key)
+        else:
+            meta = dict(self.memory_meta.get(key, {}))
+        if not meta:
+            return None
+        meta['version'] = int(meta['version'])
+        meta['updated_at'] = float(meta['updated_at'])
+        return meta
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float = 60):
+        """多个工作进程之间互斥（Redis SET NX，超过ttl秒自动释放），内存模式下直接执行"""
+        if not self.use_redis:
+            yield
+            return
+        key, token = f"lock:{name}", uuid.uuid4().hex
+        while not await self.redis_client.set(key, token, nx=True, px=int(ttl * 1000)):
+            await asyncio.sleep(0.2)
+        try:
+            yield
+        finally:
+            if await self.redis_client.get(key) == token:
+                await self.redis_client.delete(key)
+
+    def batch(self) -> 'StoreBatch':
+        """创建批量写入，Redis模式下所有写操作在一次pipeline往返中提交"""
+        return StoreBatch(self)
+
+    @staticmethod
+    def _queue_upsert(pipe, key: str, bars: List[Dict], replace: bool, max_bars: int):
+        """把写入K线的命令加入Redis pipeline"""
+        scored = [(bar_score(bar['time']), bar) for bar in bars]
+        if replace:
+            pipe.zremrangebyscore(key, min(s for s, _ in scored), max(s for s, _ in scored))
+        for score, bar in scored:
+            if not replace:
+                pipe.zremrangebyscore(key, score, score)
+            pipe.zadd(key, {json.dumps(bar): score})
+        pipe.zremrangebyrank(key, 0, -max_bars - 1)
+
+    def _memory_upsert(self, key: str, bars: List[Dict], replace: bool, max_bars: int):
+        self.memory_series.upsert(key, bars, replace, max_bars)
+
+    @timed_store('upsert_bars')
+    async def upsert_bars(self, key: str, bars: List[Dict], replace: bool = False, max_bars: int = MAX_BARS):
+        """按开盘时间写入K线，replace为True时先清除该时间范围内的旧K线"""
+        if not bars:
+            return
+        if self.use_redis:
+            pipe = self.redis_client.pipeline()
+            self._queue_upsert(pipe, key, bars, replace, max_bars)
+            await pipe.execute()
+        else:
+            self._memory_upsert(key, bars, replace, max_bars)
+
+    @timed_store('get_bars')
+    async def get_bars(self, key: str, start: Optional[int] = None, end: Optional[int] = None,
+                       limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        """按时间范围读取K线，指定start时从start开始取，否则取截至end的最新limit根"""
+        from_start = start is not None
+        if self.use_redis:
+            low = '-inf' if start is None else start
+            high = '+inf' if end is None else end
+            if from_start:
+                members = await self.redis_client.zrangebyscore(key, low, high, start=0, num=limit)
+            else:
+                members = await self.redis_client.zrevrangebyscore(key, high, low, start=0, num=limit)
+                members.reverse()
+            return [json.loads(member) for member in members]
+        return self.memory_series.range(key, start, end, limit, from_start)
+
+    @timed_store('sadd')
+    async def sadd(self, key: str, value: str):
         """添加到集合"""
         if self.use_redis:
-            self.redis_client.sadd(key, value)
+            await self.redis_client.sadd(key, value)
         else:
-            self.symbols.add(value)
+            self.memory_sets.setdefault(key, set()).add(value)
 
-    def smembers(self, key: str) -> set:
+    @timed_store('smembers')
+    async def smembers(self, key: str) -> set:
         """获取集合成员"""
         if self.use_redis:
-            return self.redis_client.smembers(key)
+            return await self.redis_client.smembers(key)
+        else:
+            return set(self.memory_sets.get(key, ()))
+
+class StoreBatch:
+    """批量写入"""
+    def __init__(self, store: DataStore):
+        self.store = store
+        self.pipe = store.redis_client.pipeline() if store.use_redis else None
+        self.pending = []
+
+    def upsert_bars(self, key: str, bars: List[Dict], replace: bool = False, max_bars: int = MAX_BARS):
+        if not bars:
+            return
+        if self.pipe is not None:
+            self.store._queue_upsert(self.pipe, key, bars, replace, max_bars)
+        else:
+            self.pending.append(lambda: self.store._memory_upsert(key, bars, replace, max_bars))
+
+    def set(self, key: str, value: str):
+        if self.pipe is not None:
+            self.pipe.set(key, value)
         else:
-            return self.symbols
+            self.pending.append(lambda: self.store.memory_store.__setitem__(key, value))
+
+    def update_meta(self, key: str, fields: Dict):
+        if self.pipe is not None:
+            self.pipe.hset(key, mapping=fields)
+            self.pipe.hincrby(key, 'version', 1)
+        else:
+            self.pending.append(lambda: self.store._memory_update_meta(key, fields))
+
+    def sadd(self, key: str, value: str):
+        if self.pipe is not None:
+            self.pipe.sadd(key, value)
+        else:
+            self.pending.append(lambda: self.store.memory_sets.setdefault(key, set()).add(value))
+
+    @timed_store('batch')
+    async def execute(self):
+        """提交所有写操作"""
+        if self.pipe is not None:
+            await self.pipe.execute()
+        else:
+            for operation in self.pending:
+                operation()
+        self.pending = []
 
 # 初始化数据存储
-try:
-    redis_config = config['redis'] if 'redis' in config else {
-        'host': os.getenv('REDIS_HOST', 'redis'),
-        'port': os.getenv('REDIS_PORT', '6379'),
-        'password': os.getenv('REDIS_PASSWORD', 'mycandle')
-    }
-    use_redis = bool(redis_config and redis_config.get('host'))
-    data_store = DataStore(use_redis=use_redis, redis_config=redis_config)
-    print(f"使用{'Redis' if use_redis else '内存'}存储数据")
-except Exception as e:
-    print(f"Redis连接失败，使用内存存储: {str(e)}")
-    data_store = DataStore(use_redis=False)
+redis_config = config['redis'] if 'redis' in config else {
+    'host': os.getenv('REDIS_HOST', 'redis'),
+    'port': os.getenv('REDIS_PORT', '6379'),
+    'password': os.getenv('REDIS_PASSWORD', 'mycandle')
+}
+use_redis = bool(redis_config and redis_config.get('host'))
+data_store = DataStore(use_redis=use_redis, redis_config=redis_config)
+
+# 启动时创建的后台任务（集群同步订阅、归档），关闭时取消
+background_tasks: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def open_data_store():
+    global series_cache, cluster
+    await data_store.connect()
+    print(f"使用{'Redis' if data_store.use_redis else '内存'}存储数据")
+    if not data_store.use_redis:
+        series_cache = None
+        if WORKERS > 1:
+            print(f"警告: 内存存储下{WORKERS}个工作进程的数据互不相通，多进程部署需要Redis")
+    elif SYNC_ENABLED:
+        cluster = ClusterSync(data_store.redis_client, SYNC_CHANNEL)
+        background_tasks.append(asyncio.create_task(cluster.run(apply_sync_message, resync_local_state)))
+    if fleet:
+        await load_fleet_state()
+    if archive:
+        background_tasks.append(asyncio.create_task(archive_loop()))
+    if METRICS_ENABLED and WORKERS > 1 and not multiprocess_enabled():
+        print("警告: 未设置PROMETHEUS_MULTIPROC_DIR，/metrics 只包含处理该请求的工作进程的指标")
+
+@app.on_event("shutdown")
+async def close_data_store():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    worker_exit()
+    await data_store.close()
 
 # CORS设置
 app.add_middleware(
@@ -101,14 +434,51 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified"],
 )
 
+# 请求耗时、请求体和响应体大小的指标，由 /metrics 输出
+METRICS_ENABLED = config.getboolean('metrics', 'enabled', fallback=True)
+# 多工作进程时汇总各进程指标的目录，为空时启动时创建临时目录
+METRICS_MULTIPROC_DIR = config.get('metrics', 'multiproc_dir', fallback='')
+# 抓取 /metrics 需要的令牌（Authorization: Bearer <token>），为空时不校验，由Nginx禁止外部访问
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') or config.get('metrics', 'token', fallback='')
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, routes=app.routes)
+
 # 数据模型
 class CandlestickData(BaseModel):
     symbol: str
     timeframe: str
     data: List[Dict]
     timestamp: str
+    # replace: 整体覆盖；merge: 按K线时间合并（增量上传）
+    mode: str = "replace"
+    # 采集端的MT5读取完成时间和最新已收盘K线的收盘时间（UTC秒），用于统计数据新鲜度
+    fetched_at: Optional[float] = None
+    bar_close: Optional[float] = None
+    # 集群模式下上传的采集端ID，用于交接期间去重
+    collector: Optional[str] = None
+
+class BatchSeries(BaseModel):
+    symbol: str
+    timeframe: str
+    data: List[Dict]
+    mode: str = "merge"
+    fetched_at: Optional[float] = None
+    bar_close: Optional[float] = None
+
+class KlineBatch(BaseModel):
+    series: List[BatchSeries]
+    timestamp: str
+    collector: Optional[str] = None
+
+class FleetHeartbeat(BaseModel):
+    collector_id: str
+    # 采集端终端可采集的品种，为空时可分配任意品种
+    symbols: Optional[List[str]] = None
+    # 最多分配的品种数，0为不限
+    capacity: int = 0
 
 class TokenData(BaseModel):
     client_id: str
@@ -125,10 +495,37 @@ def create_access_token(client_id: str) -> str:
     )
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)) -> TokenData:
+async def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)) -> TokenData:
     """验证JWT token"""
+    return decode_token(credentials.credentials)
+
+async def verify_stream_token(
+    token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Security(optional_security)
+) -> TokenData:
+    """验证推送通道的JWT token，支持Authorization头或token参数"""
+    if credentials:
+        return decode_token(credentials.credentials)
+    if token:
+        return decode_token(token)
+    raise HTTPException(status_code=401, detail="缺少认证凭据")
+
+def decode_token(token: str) -> TokenData:
+    """解码并校验JWT token，验证结果按令牌缓存"""
+    token_data = token_cache.get(token)
+    if token_data is None:
+        token_data = verify_jwt(token)
+        token_cache.put(token, token_data, token_data.exp.timestamp())
+    if token_cache.is_denied(token, token_data):
+        raise HTTPException(
+            status_code=401,
+            detail="Token已被吊销"
+        )
+    return token_data
+
+def verify_jwt(token: str) -> TokenData:
+    """完整校验JWT签名和过期时间"""
     try:
-        token = credentials.credentials
         payload = jwt.decode(
             token,
             config['jwt']['secret_key'],
@@ -146,6 +543,380 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Security(security))
             detail="无效的认证凭据"
         )
 
+def parse_bar_time(value: Optional[str], name: str) -> Optional[int]:
+    """解析查询参数中的K线时间"""
+    if value is None:
+        return None
+    try:
+        return bar_score(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name}参数格式错误，应为YYYY-MM-DD HH:MM:SS")
+
+async def load_source_bars(symbol: str, start: int, end: int) -> List[Dict]:
+    """读取聚合所需的源周期K线"""
+    return await data_store.get_bars(f"bars:{symbol}:{aggregator.source}", start, end, limit=MAX_BARS)
+
+async def update_aggregated_timeframes(batch: StoreBatch, data: CandlestickData) -> Dict[str, List[Dict]]:
+    """根据新入库的源周期K线更新各聚合周期，返回发生变化的K线"""
+    changed = await aggregator.update(data.symbol, data.data, load_source_bars)
+    for timeframe, bars in changed.items():
+        batch.upsert_bars(f"bars:{data.symbol}:{timeframe}", bars)
+        batch.update_meta(f"meta:{data.symbol}:{timeframe}", series_meta(data.symbol, timeframe, data.timestamp))
+    return changed
+
+async def aggregate_symbol(symbol: str, series: List[CandlestickData]) -> List[Tuple[str, str, List[Dict]]]:
+    """更新一个品种的聚合周期并提交，返回发生变化的K线"""
+    changes = []
+    # 聚合状态在await之间共享，同一品种串行更新避免并发入库互相覆盖
+    async with aggregation_locks.setdefault(symbol, asyncio.Lock()):
+        batch = data_store.batch()
+        for data in series:
+            for timeframe, bars in (await update_aggregated_timeframes(batch, data)).items():
+                changes.append((symbol, timeframe, bars))
+        await batch.execute()
+    return changes
+
+# 每根K线必须包含的字段
+BAR_FIELDS = frozenset(('time',) + BAR_VALUE_FIELDS)
+
+def validate_bars(series: List) -> None:
+    """写入前检查每根K线的字段，缺少字段时返回422，避免写入一半后出错"""
+    for data in series:
+        for index, bar in enumerate(data.data):
+            if not bar.keys() >= BAR_FIELDS:
+                missing = ', '.join(sorted(BAR_FIELDS - bar.keys()))
+                raise HTTPException(
+                    status_code=422, detail=f"{data.symbol} {data.timeframe} 第{index + 1}根K线缺少字段: {missing}"
+                )
+
+def series_meta(symbol: str, timeframe: str, timestamp: str) -> Dict:
+    """序列元数据，updated_at为服务端入库时间"""
+    return {'symbol': symbol, 'timeframe': timeframe, 'timestamp': timestamp, 'updated_at': time.time()}
+
+async def ingest(series: List[CandlestickData]) -> int:
+    """写入一组K线序列并推送变化，返回写入的K线数量
+
+    源周期数据在一次批量写入中提交；聚合周期依赖已写入的源数据，之后按品种分别批量提交。
+    """
+    for data in series:
+        if data.mode not in ("replace", "merge"):
+            raise HTTPException(status_code=400, detail=f"不支持的更新模式: {data.mode}")
+    validate_bars(series)
+
+    batch = data_store.batch()
+    for data in series:
+        batch.upsert_bars(f"bars:{data.symbol}:{data.timeframe}", data.data, replace=data.mode == "replace")
+        batch.update_meta(f"meta:{data.symbol}:{data.timeframe}", series_meta(data.symbol, data.timeframe, data.timestamp))
+        batch.sadd("available_symbols", data.symbol)
+    await batch.execute()
+
+    changes = [(data.symbol, data.timeframe, data.data) for data in series]
+    if aggregator:
+        by_symbol: Dict[str, List[CandlestickData]] = {}
+        for data in series:
+            if data.timeframe == aggregator.source:
+                by_symbol.setdefault(data.symbol, []).append(data)
+        for aggregated in await asyncio.gather(*(
+                aggregate_symbol(symbol, items) for symbol, items in by_symbol.items())):
+            changes.extend(aggregated)
+
+    for symbol, timeframe, bars in changes:
+        if series_cache:
+            series_cache.invalidate(f"{symbol}:{timeframe}")
+        indicator_engine.update(symbol, timeframe, bars)
+        broadcaster.publish(symbol, timeframe, bars)
+        if archive and bars:
+            mark_archive_dirty(symbol, timeframe, min(bar['time'] for bar in bars))
+    if response_cache:
+        invalidate_response_cache({(symbol, timeframe) for symbol, timeframe, _ in changes})
+    now = time.time()
+    for data in series:
+        INGESTED_BARS.labels(data.timeframe).inc(len(data.data))
+        freshness.record_ingest(data.symbol, data.timeframe, data.bar_close, data.fetched_at, now)
+    if cluster:
+        await cluster.publish(sync_message(series, changes, now))
+    return sum(len(data.data) for data in series)
+
+def sync_message(series: List[CandlestickData], changes: List[Tuple[str, str, List[Dict]]], now: float) -> Dict:
+    """入库后广播给其他工作进程的消息，变化的K线总数不超过SYNC_BARS_LIMIT时附带K线"""
+    with_bars = sum(len(bars) for _, _, bars in changes) <= SYNC_BARS_LIMIT
+    stamps = {(data.symbol, data.timeframe): data for data in series}
+    items = []
+    for symbol, timeframe, bars in changes:
+        item = {'symbol': symbol, 'timeframe': timeframe, 'bars': bars if with_bars else None}
+        uploaded = stamps.get((symbol, timeframe))
+        if uploaded is not None:
+            item.update(uploaded=True, fetched_at=uploaded.fetched_at, bar_close=uploaded.bar_close)
+        items.append(item)
+    return {'type': 'ingest', 'series': items, 'ingested_at': now}
+
+async def apply_sync_message(message: Dict):
+    """处理其他工作进程的同步消息：本地缓存失效，更新指标并推送给本进程的订阅者"""
+    if message.get('type') == 'fleet':
+        if fleet:
+            fleet.load_state(message['state'])
+        return
+    if message.get('type') == 'archive':
+        if archive:
+            for symbol, timeframe in message['series']:
+                archive.forget(symbol, timeframe)
+        return
+    changed = set()
+    for item in message['series']:
+        symbol, timeframe, bars = item['symbol'], item['timeframe'], item.get('bars')
+        if series_cache:
+            series_cache.invalidate(f"{symbol}:{timeframe}")
+        if aggregator and timeframe == aggregator.source:
+            aggregator.forget(symbol)
+        if bars is None:
+            indicator_engine.invalidate(symbol, timeframe)
+            broadcaster.resync(symbol, timeframe)
+        else:
+            indicator_engine.update(symbol, timeframe, bars)
+            broadcaster.publish(symbol, timeframe, bars)
+        if item.get('uploaded'):
+            freshness.record_ingest(symbol, timeframe, item.get('bar_close'), item.get('fetched_at'),
+                                    message['ingested_at'])
+        changed.add((symbol, timeframe))
+    if response_cache:
+        invalidate_response_cache(changed)
+
+async def resync_local_state():
+    """同步订阅中断后可能错过了消息，清空所有本地缓存和状态"""
+    print("同步订阅已恢复，清空本地缓存")
+    if series_cache:
+        series_cache.clear()
+    if response_cache:
+        response_cache.clear()
+    if aggregator:
+        aggregator.forget()
+    if archive:
+        archive.forget()
+    indicator_engine.invalidate()
+    broadcaster.resync()
+    if fleet:
+        await load_fleet_state()
+
+async def load_fleet_state():
+    """Redis模式下读取各工作进程共享的集群状态"""
+    if data_store.use_redis:
+        state = await data_store.get('fleet:state')
+        if state:
+            fleet.load_state(json.loads(state))
+
+async def update_fleet(change):
+    """在集群锁内读取最新状态、执行change(now)并保存，分配或交接变化时通知其他工作进程"""
+    async with data_store.lock('fleet', ttl=10):
+        await load_fleet_state()
+        before = (fleet.generation, fleet.handovers())
+        result = change(time.time())
+        if data_store.use_redis:
+            await data_store.set('fleet:state', json.dumps(fleet.state()))
+    if cluster and (fleet.generation, fleet.handovers()) != before:
+        await cluster.publish({'type': 'fleet', 'state': fleet.state()})
+    return result
+
+async def fence(series: List[CandlestickData]) -> Tuple[List[CandlestickData], List[str]]:
+    """去掉已移交给其他采集端的品种，返回 (接受的序列, 被丢弃的品种)
+
+    新所有者在交接期内第一次上传时保存交接完成，各工作进程此后都只接受新所有者的上传。
+    """
+    if not fleet:
+        return series, []
+    now = time.time()
+    accepted, skipped, completed = [], set(), {}
+    for data in series:
+        if fleet.accept(data.collector, data.symbol, now):
+            accepted.append(data)
+            if fleet.completes_handover(data.collector, data.symbol):
+                completed.setdefault(data.collector, set()).add(data.symbol)
+        else:
+            skipped.add(data.symbol)
+    for collector_id, symbols in completed.items():
+        await update_fleet(lambda now: fleet.complete_handovers(collector_id, symbols))
+    return accepted, sorted(skipped)
+
+def render_json(content) -> bytes:
+    """与FastAPI的JSONResponse相同的编码方式"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def validators(data: Dict) -> Dict[str, str]:
+    """由序列版本生成ETag和Last-Modified"""
+    return {
+        'ETag': f'W/"{data["version"]}"',
+        'Last-Modified': formatdate(data['updated_at'], usegmt=True),
+    }
+
+async def encoded_response(entry: CachedResponse, request: Request) -> Response:
+    """按Accept-Encoding返回压缩后的响应体，ETag匹配时返回304"""
+    headers = {'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache', **entry.headers}
+    etag = entry.headers.get('ETag')
+    if etag and etag in [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]:
+        return Response(status_code=304, headers=headers)
+    body, encoding = await entry.select(request.headers.get('accept-encoding', ''))
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(content=body, media_type='application/json', headers=headers)
+
+def invalidate_response_cache(series: set):
+    """使发生变化的序列的缓存失效，由之后的第一次查询重建"""
+    for symbol, timeframe in series:
+        response_cache.invalidate(f"{symbol}:{timeframe}")
+
+async def read_body(request: Request) -> bytes:
+    """读取请求体，超过MAX_BODY_BYTES时返回413；gzip压缩的请求体解压后不能超过MAX_DECOMPRESSED_BYTES"""
+    too_large = HTTPException(status_code=413, detail=f"请求体超过{MAX_BODY_BYTES}字节")
+    if int(request.headers.get('content-length') or 0) > MAX_BODY_BYTES:
+        raise too_large
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise too_large
+        chunks.append(chunk)
+    body = b''.join(chunks)
+    if request.headers.get('content-encoding', '').lower() != 'gzip':
+        return body
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_DECOMPRESSED_BYTES)
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"请求体解压失败: {str(e)}")
+    if decompressor.unconsumed_tail:
+        raise HTTPException(status_code=413, detail=f"请求体解压后超过{MAX_DECOMPRESSED_BYTES}字节")
+    if not decompressor.eof:
+        raise HTTPException(status_code=400, detail="请求体解压失败: gzip数据不完整")
+    return data
+
+async def read_batch_body(request: Request) -> Dict:
+    """读取批量上传的请求体，支持gzip压缩和JSON/msgpack编码"""
+    body = await read_body(request)
+    content_type = request.headers.get('content-type', 'application/json').split(';')[0].strip().lower()
+    try:
+        if content_type in ('application/msgpack', 'application/x-msgpack'):
+            return msgpack.unpackb(body, raw=False)
+        if content_type == 'application/json':
+            return json.loads(body)
+    except (ValueError, msgpack.UnpackException) as e:
+        raise HTTPException(status_code=400, detail=f"请求体解析失败: {str(e)}")
+    raise HTTPException(status_code=415, detail=f"不支持的数据格式: {content_type}")
+
+async def load_kline(symbol: str, timeframe: str, start: Optional[int] = None, end: Optional[int] = None,
+                     limit: int = DEFAULT_LIMIT) -> Optional[Dict]:
+    """读取K线序列，序列不存在时返回None"""
+    bars = None
+    if series_cache:
+        cached = await hot_series(symbol, timeframe)
+        if cached is None:
+            return None
+        data = dict(cached.meta)
+        bars = cached.range(start, end, limit)
+    else:
+        data = await data_store.get_meta(f"meta:{symbol}:{timeframe}")
+        if not data:
+            return None
+    if bars is None:
+        bars = await data_store.get_bars(f"bars:{symbol}:{timeframe}", start, end, limit)
+    if archive:
+        bars = await extend_from_archive(symbol, timeframe, start, end, limit, bars)
+    data['data'] = bars
+    return data
+
+async def hot_series(symbol: str, timeframe: str):
+    """本地热序列缓存中的序列，未缓存时从Redis读取元数据和最新的K线"""
+    key = f"{symbol}:{timeframe}"
+    cached = series_cache.get(key)
+    if cached is None:
+        generation = series_cache.generation(key)
+        meta = await data_store.get_meta(f"meta:{key}")
+        if not meta:
+            return None
+        bars = await data_store.get_bars(f"bars:{key}", limit=series_cache.size)
+        cached = series_cache.put(key, meta, bars, generation)
+    return cached
+
+async def extend_from_archive(symbol: str, timeframe: str, start: Optional[int], end: Optional[int],
+                              limit: int, bars: List[Dict]) -> List[Dict]:
+    """热存储中没有的更早部分从归档读取，只读取热存储最早一根之前的K线"""
+    first = bar_score(bars[0]['time']) if bars else None
+    if start is not None:
+        if first is not None and first <= start:
+            return bars
+        archived = await asyncio.to_thread(
+            archive.range, symbol, timeframe, start, end if first is None else first - 1, limit, True
+        )
+        return (archived + bars)[:limit]
+    if len(bars) >= limit:
+        return bars
+    archived = await asyncio.to_thread(
+        archive.range, symbol, timeframe, None, end if first is None else first - 1, limit - len(bars), False
+    )
+    return archived + bars
+
+def parse_indicators(value: Optional[str]) -> Tuple[str, ...]:
+    """解析逗号分隔的indicators参数，返回去重排序后的指标写法"""
+    if not value:
+        return ()
+    specs = sorted({spec.strip().lower() for spec in value.split(',') if spec.strip()})
+    if len(specs) > MAX_INDICATORS:
+        raise HTTPException(status_code=400, detail=f"一次最多请求{MAX_INDICATORS}个指标")
+    for spec in specs:
+        try:
+            parse_spec(spec)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return tuple(specs)
+
+async def indicator_values(symbol: str, timeframe: str, specs: Tuple[str, ...], bars: List[Dict]) -> Dict:
+    """按返回的K线取指标值
+
+    尚未计算过或较早K线被修订过的指标，先读取热存储中最近capacity根K线做一次向量化计算。
+    """
+    scores = parse_scores(bars)
+    series = None
+    result = {}
+    for spec in specs:
+        track = indicator_engine.get(symbol, timeframe, spec)
+        if track is None:
+            generation = indicator_engine.generation(symbol, timeframe)
+            if series is None:
+                series = await data_store.get_bars(f"bars:{symbol}:{timeframe}", limit=indicator_engine.capacity)
+            track = indicator_engine.load(symbol, timeframe, spec, series, generation)
+        result[spec] = track.lookup(scores)
+    return result
+
+def mark_archive_dirty(symbol: str, timeframe: str, bar_time: str):
+    """记录序列中需要重新归档的最早K线时间"""
+    score = bar_score(bar_time)
+    key = (symbol, timeframe)
+    archive_dirty[key] = min(score, archive_dirty.get(key, score))
+
+async def compact_archive() -> int:
+    """把热存储中发生变化的已收盘K线写入归档，返回写入的K线数"""
+    dirty = dict(archive_dirty)
+    archive_dirty.clear()
+    written = 0
+    # 多个工作进程写同一分区时需要互斥（各自读取的是Redis中的最新K线，先后写入结果相同）
+    async with data_store.lock('archive', ttl=max(60, ARCHIVE_INTERVAL)):
+        for (symbol, timeframe), start in dirty.items():
+            bars = await data_store.get_bars(f"bars:{symbol}:{timeframe}", start, None, MAX_BARS)
+            if not bars:
+                continue
+            # 最新一根可能仍在形成中，留到下次归档
+            written += await asyncio.to_thread(archive.write, symbol, timeframe, bars[:-1])
+            mark_archive_dirty(symbol, timeframe, bars[-1]['time'])
+    if cluster and dirty:
+        await cluster.publish({'type': 'archive', 'series': list(dirty)})
+    return written
+
+async def archive_loop():
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+        try:
+            await compact_archive()
+        except Exception as e:
+            print(f"写入历史归档失败: {str(e)}")
+
 @app.post("/api/v1/kline")
 async def update_kline_data(
     data: CandlestickData,
@@ -153,10 +924,82 @@ async def update_kline_data(
 ):
     """更新K线数据"""
     try:
-        key = f"kline:{data.symbol}:{data.timeframe}"
-        data_store.set(key, json.dumps(data.dict()))
-        data_store.sadd("available_symbols", data.symbol)
-        return {"status": "success", "message": "数据更新成功"}
+        series, skipped = await fence([data])
+        count = await ingest(series) if series else 0
+        return {"status": "success", "message": "数据更新成功", "count": count, "skipped": skipped}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v1/kline/batch")
+async def update_kline_batch(
+    request: Request,
+    token: TokenData = Depends(verify_token)
+):
+    """批量更新多个品种/周期的K线数据
+
+    请求体为 KlineBatch，可使用 application/json 或 application/msgpack 编码，
+    并可通过 Content-Encoding: gzip 压缩。
+    """
+    body = await read_batch_body(request)
+    try:
+        batch = KlineBatch.parse_obj(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    try:
+        series, skipped = await fence([
+            CandlestickData(timestamp=batch.timestamp, collector=batch.collector, **item.dict())
+            for item in batch.series
+        ])
+        count = await ingest(series) if series else 0
+        return {"status": "success", "message": "数据更新成功", "series": len(series), "count": count,
+                "skipped": skipped}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v1/archive/batch")
+async def update_archive_batch(
+    request: Request,
+    token: TokenData = Depends(verify_token)
+):
+    """直接向历史归档写入已收盘的K线（用于补录长历史），请求体格式与 /api/v1/kline/batch 相同"""
+    if not archive:
+        raise HTTPException(status_code=404, detail="历史归档未启用")
+    body = await read_batch_body(request)
+    try:
+        batch = KlineBatch.parse_obj(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    validate_bars(batch.series)
+    try:
+        count = 0
+        store_batch = data_store.batch()
+        async with data_store.lock('archive'):
+            for item in batch.series:
+                count += await asyncio.to_thread(archive.write, item.symbol, item.timeframe, item.data)
+                store_batch.update_meta(f"meta:{item.symbol}:{item.timeframe}",
+                                        series_meta(item.symbol, item.timeframe, batch.timestamp))
+                store_batch.sadd("available_symbols", item.symbol)
+        await store_batch.execute()
+        series = {(item.symbol, item.timeframe) for item in batch.series}
+        if series_cache:
+            for symbol, timeframe in series:
+                series_cache.invalidate(f"{symbol}:{timeframe}")
+        if response_cache:
+            invalidate_response_cache(series)
+        if cluster:
+            await cluster.publish({'type': 'archive', 'series': list(series)})
+            await cluster.publish({
+                'type': 'ingest', 'series': [
+                    {'symbol': symbol, 'timeframe': timeframe, 'bars': None} for symbol, timeframe in series
+                ], 'ingested_at': time.time()
+            })
+        return {"status": "success", "message": "归档写入成功", "series": len(batch.series), "count": count}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -164,31 +1007,177 @@ async def update_kline_data(
 async def get_kline_data(
     symbol: str,
     timeframe: str,
+    request: Request,
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_BARS),
+    since: Optional[str] = Query(None),
+    max_points: Optional[int] = Query(None, ge=1),
+    indicators: Optional[str] = Query(None),
     token: TokenData = Depends(verify_token)
 ):
-    """获取K线数据"""
+    """获取K线数据，可通过from/to/limit查询指定时间范围
+
+    since为客户端已有的最后一根K线时间，只返回该K线（可能仍在形成中被修订）及之后的K线；
+    max_points为最多返回的K线数，超出时合并相邻K线，resolution为每根代表的秒数；
+    indicators为逗号分隔的技术指标（如 ma20,ema50,rsi14,macd,boll20），与data逐根对应；
+    响应带有由序列版本生成的ETag，If-None-Match匹配时返回304。
+    """
+    start_score = parse_bar_time(since if since is not None else start, "since" if since is not None else "from")
+    end_score = parse_bar_time(end, "to")
+    specs = parse_indicators(indicators)
+    if end_score is None:
+        freshness.record_read(symbol, timeframe, time.time())
     try:
-        print(f"Received request for symbol: {symbol}, timeframe: {timeframe}")
-        key = f"kline:{symbol}:{timeframe}"
-        print(f"Looking for key: {key}")
-        data = data_store.get(key)
-        print(f"Found data: {data}")
+        series = f"{symbol}:{timeframe}"
+        view = (start_score, end_score, limit, max_points, specs)
+        # since增量轮询的游标各不相同，缓存几乎不会命中，不缓存
+        cacheable = response_cache is not None and since is None
+        if cacheable:
+            entry = response_cache.get(series, view)
+            if entry is not None:
+                return await encoded_response(entry, request)
+            generation = response_cache.generation(series)
+
+        data = await load_kline(symbol, timeframe, start_score, end_score, limit)
         if not data:
             raise HTTPException(status_code=404, detail="数据未找到")
-        return json.loads(data)
+        if specs:
+            data['indicators'] = await indicator_values(symbol, timeframe, specs, data['data'])
+        if max_points:
+            data['data'], data['resolution'], last = await asyncio.to_thread(
+                downsample, data['data'], timeframe, max_points
+            )
+            # 合并后的K线取组内最后一根的指标值
+            for outputs in data.get('indicators', {}).values():
+                for name, values in outputs.items():
+                    outputs[name] = [values[i] for i in last]
+        body = render_json(data)
+        log_sampled(f"K线查询 {series} view={view} 返回{len(data['data'])}根K线, {len(body)}字节")
+        if cacheable:
+            entry = response_cache.put(series, view, body, generation, validators(data))
+        else:
+            entry = CachedResponse(body, MIN_COMPRESS_SIZE, validators(data))
+        return await encoded_response(entry, request)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.exception(f"K线查询失败: {symbol} {timeframe}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/stream/{symbol}/{timeframe}")
+async def stream_kline_data(
+    symbol: str,
+    timeframe: str,
+    request: Request,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_BARS),
+    token: TokenData = Depends(verify_stream_token)
+):
+    """K线实时推送（SSE）：订阅后先发送snapshot快照，之后只推送发生变化的K线（update）"""
+    async def snapshot() -> str:
+        data = await load_kline(symbol, timeframe, limit=limit) or {
+            'symbol': symbol, 'timeframe': timeframe, 'data': [], 'timestamp': None
+        }
+        return format_event('snapshot', data)
+
+    async def event_stream():
+        # 先订阅再读取快照，避免遗漏两者之间入库的数据
+        queue = broadcaster.subscribe(symbol, timeframe)
+        try:
+            yield await snapshot()
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield await snapshot() if message is RESYNC else message
+        finally:
+            broadcaster.unsubscribe(symbol, timeframe, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.get("/api/v1/cache/stats")
+async def get_cache_stats(token: TokenData = Depends(verify_token)):
+    """K线查询响应缓存的命中统计"""
+    if not response_cache:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+@app.get("/api/v1/storage/stats")
+async def get_storage_stats(token: TokenData = Depends(verify_token)):
+    """存储后端统计，内存模式下返回序列数、K线数和内存占用，启用归档时附带归档统计，以及技术指标统计"""
+    stats = {"backend": "redis"} if data_store.use_redis else {"backend": "memory", **data_store.memory_series.stats()}
+    if archive:
+        stats["archive"] = archive.stats()
+    stats["indicators"] = indicator_engine.stats()
+    if series_cache:
+        stats["series_cache"] = series_cache.stats()
+    if cluster:
+        stats["sync"] = cluster.stats()
+    return stats
+
+@app.get("/api/v1/freshness")
+async def get_freshness(
+    threshold: Optional[float] = Query(None, ge=0),
+    stale_only: bool = Query(False),
+    token: TokenData = Depends(verify_token)
+):
+    """各品种/周期的数据新鲜度：最近的收盘、读取、入库时间，各环节延迟分布，超过threshold秒未入库的标记为stale"""
+    return freshness.report(time.time(), threshold, stale_only)
+
+@app.post("/api/v1/fleet/heartbeat")
+async def fleet_heartbeat(beat: FleetHeartbeat, token: TokenData = Depends(verify_token)):
+    """采集端注册或续租，返回分配的品种、租约到期时间和建议的心跳间隔"""
+    if not fleet:
+        raise HTTPException(status_code=404, detail="采集端集群未启用")
+    return await update_fleet(lambda now: fleet.heartbeat(beat.collector_id, now, beat.symbols, beat.capacity))
+
+@app.delete("/api/v1/fleet/collectors/{collector_id}")
+async def fleet_release(collector_id: str, token: TokenData = Depends(verify_token)):
+    """采集端退出时释放租约，其品种立即分配给其他采集端"""
+    if not fleet:
+        raise HTTPException(status_code=404, detail="采集端集群未启用")
+    released = await update_fleet(lambda now: fleet.release(collector_id, now))
+    return {"status": "success", "released": released}
+
+@app.get("/api/v1/fleet")
+async def get_fleet(token: TokenData = Depends(verify_token)):
+    """采集端租约、品种分配、交接中的品种和去重统计"""
+    if not fleet:
+        return {"enabled": False}
+    await load_fleet_state()
+    return {"enabled": True, **fleet.stats(time.time())}
+
+@app.get("/api/v1/auth/stats")
+async def get_auth_stats(token: TokenData = Depends(verify_token)):
+    """已验证令牌缓存的命中统计"""
+    return token_cache.stats()
+
 @app.get("/api/v1/symbols")
 async def get_available_symbols(token: TokenData = Depends(verify_token)):
     """获取可用的交易品种"""
     try:
-        symbols = data_store.smembers("available_symbols")
+        symbols = await data_store.smembers("available_symbols")
         return list(symbols) if symbols else []
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    """Prometheus文本格式的指标"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="指标未启用")
+    if METRICS_TOKEN and not hmac.compare_digest(
+            request.headers.get('authorization', ''), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="指标令牌无效")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # 添加生成token的接口
 @app.post("/api/v1/token")
 async def generate_token(client_id: str):
@@ -204,9 +1193,13 @@ async def generate_token(client_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
+    if METRICS_ENABLED and WORKERS > 1 and not multiprocess_enabled():
+        prepare_multiprocess_dir(METRICS_MULTIPROC_DIR or tempfile.mkdtemp(prefix='kline-metrics-'))
     uvicorn.run(
         "app:app",
         host=config['server']['host'],
         port=int(config['server']['port']),
-        reload=True
+        # 多工作进程时不能使用自动重载
+        workers=WORKERS,
+        reload=WORKERS == 1
     ) 
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""K线历史归档
+
+已收盘的K线按 品种/周期/时间分区 保存为按列存放的NumPy文件
+（archive/{symbol}/{timeframe}/{YYYYMMDD}.npy，形状为(6, n)的float64数组，
+各行依次为时间、开、高、低、收、量）。读取时以内存映射方式打开，只对时间列做二分查找
+并读取所需的行，不加载整个文件。写入时与已有分区合并（同一时间以新写入的为准），
+先写临时文件再原子替换，已打开的内存映射不受影响。
+"""
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from timeframes import TIMEFRAME_SECONDS
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+DAY = 86400
+# 各周期一个分区覆盖的时间，使每个文件的K线数在几百到一千多根之间
+PARTITION_SECONDS = {
+    'M1': DAY,
+    'M5': DAY,
+    'M15': 7 * DAY,
+    'M30': 7 * DAY,
+    'H1': 28 * DAY,
+    'H4': 112 * DAY,
+    'D1': 728 * DAY,
+}
+# 品种和周期用作目录名，只允许常见字符
+NAME_PATTERN = re.compile(r'^[\w.#\-]+$')
+
+
+def parse_scores(bars: List[Dict]) -> np.ndarray:
+    """与bar_score相同：按K线时间本身的时区换算为整数秒"""
+    return np.array([bar['time'] for bar in bars], dtype='datetime64[s]').astype(np.int64)
+
+
+def to_records(block: np.ndarray) -> List[Dict]:
+    """(6, n)数组转换为K线字典列表"""
+    times = np.datetime_as_string(block[0].astype(np.int64).astype('datetime64[s]')).tolist()
+    columns = [block[i + 1].tolist() for i in range(len(FIELDS))]
+    return [
+        {'time': t.replace('T', ' '), 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for t, o, h, l, c, v in zip(times, *columns)
+    ]
+
+
+class BarArchive:
+    """按列存放、按时间分区的K线历史归档"""
+
+    def __init__(self, path: str = 'archive'):
+        self.path = path
+        self.lock = threading.Lock()
+        # 每个序列已有的分区起始时间（升序），首次访问时从目录读取
+        self.partitions: Dict[Tuple[str, str], List[int]] = {}
+        self.written_bars = 0
+        self.read_bars = 0
+        self.partition_reads = 0
+
+    def _series_dir(self, symbol: str, timeframe: str) -> Optional[str]:
+        if not NAME_PATTERN.match(symbol) or timeframe not in TIMEFRAME_SECONDS:
+            return None
+        return os.path.join(self.path, symbol, timeframe)
+
+    @staticmethod
+    def _file_name(start: int) -> str:
+        return str(np.datetime64(start, 's').astype('datetime64[D]')).replace('-', '') + '.npy'
+
+    @staticmethod
+    def _partition_start(name: str) -> int:
+        day = np.datetime64(f"{name[:4]}-{name[4:6]}-{name[6:8]}", 'D')
+        return int(day.astype('datetime64[s]').astype(np.int64))
+
+    def _list(self, symbol: str, timeframe: str) -> List[int]:
+        key = (symbol, timeframe)
+        starts = self.partitions.get(key)
+        if starts is None:
+            directory = self._series_dir(symbol, timeframe)
+            names = os.listdir(directory) if directory and os.path.isdir(directory) else []
+            starts = sorted(self._partition_start(name) for name in names if name.endswith('.npy'))
+            self.partitions[key] = starts
+        return starts
+
+    def forget(self, symbol: Optional[str] = None, timeframe: Optional[str] = None):
+        """丢弃缓存的分区列表（分区可能由其他进程写入），不指定序列时丢弃全部"""
+        with self.lock:
+            if symbol is None:
+                self.partitions.clear()
+            else:
+                self.partitions.pop((symbol, timeframe), None)
+
+    def write(self, symbol: str, timeframe: str, bars: List[Dict]) -> int:
+        """写入已收盘的K线，返回写入的K线数"""
+        directory = self._series_dir(symbol, timeframe)
+        if directory is None or not bars:
+            return 0
+        scores = parse_scores(bars)
+        block = np.empty((len(FIELDS) + 1, len(bars)), dtype=np.float64)
+        block[0] = scores
+        for i, field in enumerate(FIELDS):
+            block[i + 1] = [bar[field] for bar in bars]
+
+        span = PARTITION_SECONDS[timeframe]
+        parts = scores // span * span
+        with self.lock:
+            os.makedirs(directory, exist_ok=True)
+            starts = set(self._list(symbol, timeframe))
+            for start in np.unique(parts).tolist():
+                self._merge(os.path.join(directory, self._file_name(start)), block[:, parts == start])
+                starts.add(start)
+            self.partitions[(symbol, timeframe)] = sorted(starts)
+            self.written_bars += len(bars)
+        return len(bars)
+
+    @staticmethod
+    def _merge(path: str, block: np.ndarray):
+        """与已有分区合并，同一时间保留后写入的K线"""
+        if os.path.exists(path):
+            block = np.concatenate([np.load(path), block], axis=1)
+        order = np.argsort(block[0], kind='stable')
+        block = block[:, order]
+        keep = np.r_[block[0, 1:] != block[0, :-1], True]
+        block = np.ascontiguousarray(block[:, keep])
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, block)
+        os.replace(tmp_path, path)
+
+    def range(self, symbol: str, timeframe: str, start: Optional[int], end: Optional[int], limit: int,
+              from_start: bool) -> List[Dict]:
+        """返回时间在[start, end]之间的K线，from_start为False时取最新的limit根"""
+        directory = self._series_dir(symbol, timeframe)
+        if directory is None or limit <= 0:
+            return []
+        span = PARTITION_SECONDS[timeframe]
+        starts = [
+            s for s in self._list(symbol, timeframe)
+            if (start is None or s + span > start) and (end is None or s <= end)
+        ]
+        if not from_start:
+            starts.reverse()
+
+        blocks = []
+        remaining = limit
+        for partition in starts:
+            try:
+                mapped = np.load(os.path.join(directory, self._file_name(partition)), mmap_mode='r')
+            except FileNotFoundError:
+                continue
+            self.partition_reads += 1
+            times = mapped[0]
+            lo = 0 if start is None else int(np.searchsorted(times, start, 'left'))
+            hi = len(times) if end is None else int(np.searchsorted(times, end, 'right'))
+            if from_start:
+                hi = min(hi, lo + remaining)
+            else:
+                lo = max(lo, hi - remaining)
+            if hi <= lo:
+                continue
+            blocks.append(np.array(mapped[:, lo:hi]))
+            remaining -= hi - lo
+            if remaining <= 0:
+                break
+        if not blocks:
+            return []
+        if not from_start:
+            blocks.reverse()
+        records = to_records(np.concatenate(blocks, axis=1))
+        self.read_bars += len(records)
+        return records
+
+    def stats(self) -> Dict:
+        return {
+            'series': len([starts for starts in self.partitions.values() if starts]),
+            'partitions': sum(len(starts) for starts in self.partitions.values()),
+            'written_bars': self.written_bars,
+            'read_bars': self.read_bars,
+            'partition_reads': self.partition_reads,
+        }
@@ -0,0 +1,51 @@
+"""K线降采样
+
+长时间范围的查询按 max_points 把相邻K线合并，返回的K线数不超过屏幕能显示的数量。
+合并按时间对齐分组（组宽为周期的整数倍），新K线到达时已有分组不会移动；
+每组取首根开盘价、最高价、最低价、末根收盘价并累加成交量。
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from timeframes import TIMEFRAME_SECONDS
+
+
+def downsample(bars: List[Dict], timeframe: str, max_points: int) -> Tuple[List[Dict], int, List[int]]:
+    """把K线合并为不超过max_points根
+
+    返回 (合并后的K线, 每根代表的秒数, 每组最后一根K线在原列表中的下标)。
+    """
+    seconds = TIMEFRAME_SECONDS.get(timeframe, 60)
+    count = len(bars)
+    if count <= max_points:
+        return bars, seconds, list(range(count))
+
+    # 与bar_score相同：按K线时间本身的时区换算为整数秒
+    scores = np.array([bar['time'] for bar in bars], dtype='datetime64[s]').astype(np.int64)
+    values = np.array([[bar['open'], bar['high'], bar['low'], bar['close'], bar['volume']] for bar in bars],
+                      dtype=np.float64)
+
+    span = int(scores[-1] - scores[0]) + seconds
+    factor = max(1, -(-span // (seconds * max_points)))
+    while True:
+        width = seconds * factor
+        buckets = scores // width
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        # 分组对齐到整数倍时间，首尾可能各多出一组
+        if len(starts) <= max_points:
+            break
+        factor += 1
+
+    ends = np.r_[starts[1:], count]
+    columns = zip(
+        values[starts, 0].tolist(),
+        np.maximum.reduceat(values[:, 1], starts).tolist(),
+        np.minimum.reduceat(values[:, 2], starts).tolist(),
+        values[ends - 1, 3].tolist(),
+        np.add.reduceat(values[:, 4], starts).tolist(),
+    )
+    return [
+        {'time': bars[i]['time'], 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for i, (o, h, l, c, v) in zip(starts.tolist(), columns)
+    ], width, (ends - 1).tolist()
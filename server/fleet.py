@@ -0,0 +1,179 @@
+"""采集端集群：租约和品种分配
+
+采集端定期发送心跳（注册即第一次心跳），服务端为每个采集端维护lease_ttl秒的租约，
+并把品种全集按加权最高随机权重（rendezvous hash）分配给租约有效的采集端：
+采集端加入或退出时只有它分到或持有的品种会移动，其余品种不变。
+
+品种全集为 [fleet] symbols 加上各采集端报告的可采集品种；采集端报告了品种列表时
+只分配列表中的品种，未报告时可分配任意品种。capacity 为单个采集端最多分配的品种数（0为不限）。
+
+交接：品种从A移到B后，A在下次心跳前仍会上传，B第一次上传前需要A继续提供数据。
+handover_grace 秒内两者的上传都接受，B上传后或超时后只接受B，A的上传被丢弃（重复上传去重），
+避免两个终端交替写入同一序列（如A的终端落后时覆盖B已写入的形成中K线）。
+不属于任何采集端的品种（未启用集群的采集端上传）不受限制。
+"""
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+
+def weight(collector_id: str, symbol: str) -> int:
+    digest = hashlib.blake2b(f"{collector_id}:{symbol}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class FleetCoordinator:
+    """采集端租约和品种分配，状态可序列化以便多个工作进程通过Redis共享"""
+
+    def __init__(self, symbols: Iterable[str] = (), lease_ttl: float = 30.0, handover_grace: float = None):
+        self.symbols = sorted(set(symbols))
+        self.lease_ttl = lease_ttl
+        self.handover_grace = lease_ttl if handover_grace is None else handover_grace
+        # {collector_id: {'expires', 'symbols', 'capacity', 'registered_at'}}
+        self.collectors: Dict[str, Dict] = {}
+        # {symbol: {'owner', 'previous', 'handover_until'}}
+        self.assignments: Dict[str, Dict] = {}
+        self.generation = 0
+        # 以下统计只在本进程内累计
+        self.accepted = 0
+        self.dropped = 0
+        self.expired = 0
+
+    def state(self) -> Dict:
+        return {'collectors': self.collectors, 'assignments': self.assignments, 'generation': self.generation}
+
+    def load_state(self, state: Dict):
+        if state.get('generation', 0) >= self.generation:
+            self.collectors = state['collectors']
+            self.assignments = state['assignments']
+            self.generation = state['generation']
+
+    def handovers(self) -> List[str]:
+        """交接中的品种"""
+        return sorted(s for s, a in self.assignments.items() if a['previous'] is not None)
+
+    def universe(self) -> List[str]:
+        symbols = set(self.symbols)
+        for collector in self.collectors.values():
+            symbols.update(collector['symbols'] or ())
+        return sorted(symbols)
+
+    def heartbeat(self, collector_id: str, now: float, symbols: Optional[List[str]] = None,
+                  capacity: int = 0) -> Dict:
+        """注册或续租，返回该采集端当前分配的品种"""
+        collector = self.collectors.get(collector_id)
+        offered = sorted(set(symbols)) if symbols else []
+        changed = self.expire(now)
+        if collector is None:
+            collector = self.collectors[collector_id] = {'registered_at': now}
+            changed = True
+        elif collector['symbols'] != offered or collector['capacity'] != capacity:
+            changed = True
+        collector.update(expires=now + self.lease_ttl, symbols=offered, capacity=capacity)
+        if changed:
+            self.rebalance(now)
+        return self.lease(collector_id)
+
+    def release(self, collector_id: str, now: float) -> bool:
+        """采集端正常退出时释放租约，其品种立即重新分配"""
+        if self.collectors.pop(collector_id, None) is None:
+            return False
+        self.rebalance(now)
+        return True
+
+    def expire(self, now: float) -> bool:
+        """移除租约过期的采集端，返回是否有变化（需要重新分配）"""
+        dead = [cid for cid, collector in self.collectors.items() if collector['expires'] <= now]
+        for cid in dead:
+            del self.collectors[cid]
+        self.expired += len(dead)
+        return bool(dead)
+
+    def rebalance(self, now: float):
+        """按权重重新分配全部品种，所有者变化的品种进入交接期"""
+        load = {cid: 0 for cid in self.collectors}
+        assignments = {}
+        for symbol in self.universe():
+            candidates = sorted(
+                (cid for cid, collector in self.collectors.items()
+                 if (not collector['symbols'] or symbol in collector['symbols'])
+                 and (not collector['capacity'] or load[cid] < collector['capacity'])),
+                key=lambda cid: weight(cid, symbol), reverse=True
+            )
+            current = self.assignments.get(symbol)
+            if not candidates:
+                # 暂时没有采集端可以接手，保留原记录以便继续接受原所有者的上传
+                if current is not None:
+                    assignments[symbol] = current
+                continue
+            owner = candidates[0]
+            load[owner] += 1
+            if current is not None and current['owner'] == owner:
+                assignments[symbol] = current
+            elif current is not None:
+                assignments[symbol] = {
+                    'owner': owner, 'previous': current['owner'], 'handover_until': now + self.handover_grace
+                }
+            else:
+                assignments[symbol] = {'owner': owner, 'previous': None, 'handover_until': None}
+        self.assignments = assignments
+        self.generation += 1
+
+    def lease(self, collector_id: str) -> Dict:
+        collector = self.collectors[collector_id]
+        return {
+            'collector_id': collector_id,
+            'symbols': sorted(s for s, a in self.assignments.items() if a['owner'] == collector_id),
+            'lease_expires': collector['expires'],
+            'lease_ttl': self.lease_ttl,
+            # 租约期内至少发送三次心跳
+            'heartbeat_interval': self.lease_ttl / 3,
+            'generation': self.generation,
+        }
+
+    def accept(self, collector_id: Optional[str], symbol: str, now: float) -> bool:
+        """是否接受该采集端上传的品种数据"""
+        assignment = self.assignments.get(symbol)
+        if collector_id is None or assignment is None:
+            return True
+        if assignment['owner'] == collector_id or \
+                assignment['previous'] == collector_id and now < assignment['handover_until']:
+            self.accepted += 1
+            return True
+        self.dropped += 1
+        return False
+
+    def completes_handover(self, collector_id: Optional[str], symbol: str) -> bool:
+        """该上传是否为新所有者在交接期内的上传（需要调用complete_handovers保存交接完成）"""
+        assignment = self.assignments.get(symbol)
+        return assignment is not None and assignment['owner'] == collector_id and assignment['previous'] is not None
+
+    def complete_handovers(self, collector_id: str, symbols: Iterable[str]) -> bool:
+        """新所有者已开始上传，结束交接，之后只接受新所有者的上传；返回是否有变化"""
+        changed = False
+        for symbol in symbols:
+            if self.completes_handover(collector_id, symbol):
+                assignment = self.assignments[symbol]
+                assignment['previous'] = assignment['handover_until'] = None
+                changed = True
+        return changed
+
+    def stats(self, now: float) -> Dict:
+        return {
+            'generation': self.generation,
+            'lease_ttl': self.lease_ttl,
+            'symbols': len(self.assignments),
+            'unassigned': sorted(set(self.universe()) - set(self.assignments)),
+            'handovers': self.handovers(),
+            'accepted': self.accepted,
+            'dropped': self.dropped,
+            'expired': self.expired,
+            'collectors': {
+                cid: {
+                    'lease_remaining': round(collector['expires'] - now, 3),
+                    'capacity': collector['capacity'],
+                    'offered': len(collector['symbols']),
+                    'symbols': sorted(s for s, a in self.assignments.items() if a['owner'] == cid),
+                }
+                for cid, collector in sorted(self.collectors.items())
+            },
+        }
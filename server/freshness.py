@@ -0,0 +1,116 @@
+"""数据新鲜度
+
+采集端随每个序列上传 bar_close（最新已收盘K线的收盘时间）和 fetched_at（MT5读取完成时间），
+服务端记录入库时间，并在K线查询第一次返回新收盘的K线时记录读取时间，按环节统计延迟：
+- mt5: 收盘 → 采集端读取完成（MT5出数和采集调度）
+- upload: 读取完成 → 入库（采集端队列、网络和服务端处理），每次上传都记录
+- read: 入库 → 第一次被查询读取（读取端的轮询间隔）
+- total: 收盘 → 第一次被查询读取
+时间均为UTC秒；采集端与服务端不在同一台机器时，延迟包含两端的时钟误差。
+"""
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from metrics import FRESHNESS_LAG
+
+STAGES = ('mt5', 'upload', 'read', 'total')
+
+
+def summarize(samples) -> Dict:
+    """延迟样本（秒）的分位数"""
+    if not samples:
+        return {'count': 0}
+    values = np.fromiter(samples, dtype=np.float64, count=len(samples))
+    p50, p90, p99 = np.percentile(values, (50, 90, 99)).tolist()
+    return {
+        'count': len(values),
+        'p50': round(p50, 3),
+        'p90': round(p90, 3),
+        'p99': round(p99, 3),
+        'max': round(float(values.max()), 3),
+    }
+
+
+class SeriesFreshness:
+    """一个品种/周期最近的时间戳和各环节最近window个延迟样本"""
+
+    def __init__(self, window: int):
+        self.bar_close: Optional[float] = None
+        self.fetched_at: Optional[float] = None
+        self.ingested_at: Optional[float] = None
+        # 已入库但尚未被查询读取的新收盘K线 (收盘时间, 入库时间)
+        self.unread: Optional[Tuple[float, float]] = None
+        self.lags = {stage: deque(maxlen=window) for stage in STAGES}
+
+    def add(self, stage: str, lag: float):
+        self.lags[stage].append(lag)
+        FRESHNESS_LAG.labels(stage).observe(max(0.0, lag))
+
+
+class FreshnessTracker:
+    """按品种/周期记录入库和读取时间，超过stale_after秒未入库的序列视为过期"""
+
+    def __init__(self, window: int = 500, stale_after: float = 120.0):
+        self.window = window
+        self.stale_after = stale_after
+        self.series: Dict[Tuple[str, str], SeriesFreshness] = {}
+
+    def record_ingest(self, symbol: str, timeframe: str, bar_close: Optional[float],
+                      fetched_at: Optional[float], now: float):
+        state = self.series.get((symbol, timeframe))
+        if state is None:
+            state = self.series[(symbol, timeframe)] = SeriesFreshness(self.window)
+        state.ingested_at = now
+        if fetched_at is not None:
+            state.fetched_at = fetched_at
+            state.add('upload', now - fetched_at)
+        if bar_close is None or (state.bar_close is not None and bar_close <= state.bar_close):
+            return
+        # 首次看到的收盘K线可能是采集端启动前收盘的，不计入延迟
+        if state.bar_close is not None:
+            if fetched_at is not None:
+                state.add('mt5', fetched_at - bar_close)
+            state.unread = (bar_close, now)
+        state.bar_close = bar_close
+
+    def record_read(self, symbol: str, timeframe: str, now: float):
+        """查询返回了序列的最新K线"""
+        state = self.series.get((symbol, timeframe))
+        if state is None or state.unread is None:
+            return
+        bar_close, ingested_at = state.unread
+        state.unread = None
+        state.add('read', now - ingested_at)
+        state.add('total', now - bar_close)
+
+    def report(self, now: float, threshold: Optional[float] = None, stale_only: bool = False) -> Dict:
+        threshold = self.stale_after if threshold is None else threshold
+        series = []
+        overall = {stage: [] for stage in STAGES}
+        for (symbol, timeframe), state in sorted(self.series.items()):
+            age = now - state.ingested_at
+            stale = age > threshold
+            for stage in STAGES:
+                overall[stage].extend(state.lags[stage])
+            if stale_only and not stale:
+                continue
+            series.append({
+                'symbol': symbol,
+                'timeframe': timeframe,
+                'bar_close': state.bar_close,
+                'fetched_at': state.fetched_at,
+                'ingested_at': state.ingested_at,
+                'age': round(age, 3),
+                'bar_age': round(now - state.bar_close, 3) if state.bar_close is not None else None,
+                'stale': stale,
+                'lags': {stage: summarize(state.lags[stage]) for stage in STAGES},
+            })
+        return {
+            'now': now,
+            'threshold': threshold,
+            'stale': sum(1 for state in self.series.values() if now - state.ingested_at > threshold),
+            'lags': {stage: summarize(samples) for stage, samples in overall.items()},
+            'series': series,
+        }
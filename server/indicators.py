@@ -0,0 +1,400 @@
+"""技术指标（MA/EMA/RSI/MACD/BOLL）
+
+每个 品种/周期/指标 维护一份增量状态：除最新一根以外的K线已计入状态，最新一根（可能仍在形成）
+只用于计算当前值而不改变状态，新K线到达时先把上一根计入状态，因此每根新K线每个指标O(1)。
+首次请求某个指标或较早的K线被修订时，用NumPy对整个序列做一次向量化计算并重建状态。
+
+指标写法（查询参数 indicators，逗号分隔）：ma20、ema50、rsi14、macd（或 macd12_26_9）、boll20（或 boll20_2）。
+"""
+import re
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from archive import parse_scores
+
+NAN = float('nan')
+# 指标周期上限，避免任意参数创建过大的窗口
+MAX_PERIOD = 1000
+SPEC_PATTERN = re.compile(r'^(ma|ema|rsi|macd|boll)(\d+(?:_\d+(?:\.\d+)?)*)?$')
+
+
+def ema_vector(values: np.ndarray, alpha: float, prev: float) -> np.ndarray:
+    """y[i] = alpha * x[i] + (1 - alpha) * y[i-1]，y[-1] = prev
+
+    分块展开递推：块内 y[i] = w^(i+1) * (prev + alpha * cumsum(x[j] / w^(j+1)))，
+    块长保证 w^-块长 不溢出。
+    """
+    out = np.empty(len(values))
+    w = 1.0 - alpha
+    if w <= 0:
+        out[:] = values
+        return out
+    block = int(max(1, min(256, 200 / -np.log10(w)))) if w < 1 else 256
+    powers = w ** np.arange(1, block + 1)
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        p = powers[:len(chunk)]
+        y = p * (prev + alpha * np.cumsum(chunk / p))
+        out[start:start + len(chunk)] = y
+        prev = y[-1]
+    return out
+
+
+class RollingWindow:
+    """最近n根已计入K线的滑动和与平方和，减去参考值以降低大数相消的误差"""
+
+    def __init__(self, size: int, values: Sequence[float], ref: float):
+        self.size = size
+        self.ref = ref
+        self.items = deque()
+        self.sum = 0.0
+        self.sumsq = 0.0
+        for value in values:
+            self.push(value)
+
+    def push(self, value: float):
+        if self.size <= 0:
+            return
+        value -= self.ref
+        self.items.append(value)
+        self.sum += value
+        self.sumsq += value * value
+        if len(self.items) > self.size:
+            old = self.items.popleft()
+            self.sum -= old
+            self.sumsq -= old * old
+
+    def stats_with(self, value: float) -> Tuple[float, float]:
+        """加入value后窗口（size+1根）的均值和总体标准差"""
+        n = len(self.items) + 1
+        value -= self.ref
+        mean = (self.sum + value) / n
+        var = max(0.0, (self.sumsq + value * value) / n - mean * mean)
+        return mean + self.ref, var ** 0.5
+
+
+class MA:
+    outputs = ('value',)
+
+    def __init__(self, period: int = 20):
+        self.period = period
+
+    def load(self, closes: np.ndarray) -> Dict[str, np.ndarray]:
+        p = self.period
+        out = np.full(len(closes), NAN)
+        if len(closes) >= p:
+            out[p - 1:] = np.lib.stride_tricks.sliding_window_view(closes, p).mean(axis=1)
+        committed = closes[:-1][-(p - 1):] if p > 1 else closes[:0]
+        self.window = RollingWindow(p - 1, committed.tolist(), float(closes[0]) if len(closes) else 0.0)
+        return {'value': out}
+
+    def commit(self, close: float):
+        self.window.push(close)
+
+    def peek(self, close: float) -> Tuple[float, ...]:
+        if len(self.window.items) < self.period - 1:
+            return (NAN,)
+        return (self.window.stats_with(close)[0],)
+
+
+class EMA:
+    """以第一根收盘价为初值的指数移动平均"""
+    outputs = ('value',)
+
+    def __init__(self, period: int = 20):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.prev = None
+
+    def load(self, closes: np.ndarray) -> Dict[str, np.ndarray]:
+        out = np.empty(len(closes))
+        if len(closes):
+            out[0] = closes[0]
+            out[1:] = ema_vector(closes[1:], self.alpha, closes[0])
+        self.prev = float(out[-2]) if len(closes) >= 2 else None
+        return {'value': out}
+
+    def commit(self, close: float):
+        self.prev = self.peek(close)[0]
+
+    def peek(self, close: float) -> Tuple[float, ...]:
+        if self.prev is None:
+            return (close,)
+        return (self.alpha * close + (1 - self.alpha) * self.prev,)
+
+
+class RSI:
+    """Wilder RSI，平均涨跌幅以前period个变化的简单平均为初值"""
+    outputs = ('value',)
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.prev_close = None
+        self.count = 0
+        self.gain = 0.0
+        self.loss = 0.0
+
+    @staticmethod
+    def _rsi(gain, loss):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(loss == 0, np.where(gain == 0, 50.0, 100.0), 100.0 - 100.0 / (1.0 + gain / loss))
+
+    def load(self, closes: np.ndarray) -> Dict[str, np.ndarray]:
+        p = self.period
+        out = np.full(len(closes), NAN)
+        diffs = np.diff(closes)
+        gains = np.maximum(diffs, 0.0)
+        losses = np.maximum(-diffs, 0.0)
+        avg_gain = avg_loss = None
+        if len(diffs) >= p:
+            avg_gain = np.r_[gains[:p].mean(), ema_vector(gains[p:], 1.0 / p, gains[:p].mean())]
+            avg_loss = np.r_[losses[:p].mean(), ema_vector(losses[p:], 1.0 / p, losses[:p].mean())]
+            out[p:] = self._rsi(avg_gain, avg_loss)
+
+        # 计入除最新一根以外的K线：共 len(closes) - 2 个变化
+        self.count = max(0, len(closes) - 2)
+        self.prev_close = float(closes[-2]) if len(closes) >= 2 else None
+        if self.count >= p:
+            self.gain = float(avg_gain[self.count - p])
+            self.loss = float(avg_loss[self.count - p])
+        else:
+            self.gain = float(gains[:self.count].sum())
+            self.loss = float(losses[:self.count].sum())
+        return {'value': out}
+
+    def _next(self, close: float) -> Tuple[int, float, float]:
+        """计入close后的 (变化数, 平均涨幅或累计涨幅, 平均跌幅或累计跌幅)"""
+        diff = close - self.prev_close
+        gain, loss = max(diff, 0.0), max(-diff, 0.0)
+        count = self.count + 1
+        p = self.period
+        if count < p:
+            return count, self.gain + gain, self.loss + loss
+        if count == p:
+            return count, (self.gain + gain) / p, (self.loss + loss) / p
+        return count, (self.gain * (p - 1) + gain) / p, (self.loss * (p - 1) + loss) / p
+
+    def commit(self, close: float):
+        if self.prev_close is not None:
+            self.count, self.gain, self.loss = self._next(close)
+        self.prev_close = close
+
+    def peek(self, close: float) -> Tuple[float, ...]:
+        if self.prev_close is None:
+            return (NAN,)
+        count, gain, loss = self._next(close)
+        if count < self.period:
+            return (NAN,)
+        return (float(self._rsi(np.float64(gain), np.float64(loss))),)
+
+
+class MACD:
+    outputs = ('macd', 'signal', 'hist')
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+
+    def load(self, closes: np.ndarray) -> Dict[str, np.ndarray]:
+        macd = self.fast.load(closes)['value'] - self.slow.load(closes)['value']
+        signal = self.signal.load(macd)['value']
+        return {'macd': macd, 'signal': signal, 'hist': macd - signal}
+
+    def commit(self, close: float):
+        macd = self.fast.peek(close)[0] - self.slow.peek(close)[0]
+        self.fast.commit(close)
+        self.slow.commit(close)
+        self.signal.commit(macd)
+
+    def peek(self, close: float) -> Tuple[float, ...]:
+        macd = self.fast.peek(close)[0] - self.slow.peek(close)[0]
+        signal = self.signal.peek(macd)[0]
+        return macd, signal, macd - signal
+
+
+class BOLL:
+    outputs = ('mid', 'upper', 'lower')
+
+    def __init__(self, period: int = 20, width: float = 2.0):
+        self.period = period
+        self.width = width
+
+    def load(self, closes: np.ndarray) -> Dict[str, np.ndarray]:
+        p = self.period
+        mid = np.full(len(closes), NAN)
+        std = np.full(len(closes), NAN)
+        if len(closes) >= p:
+            windows = np.lib.stride_tricks.sliding_window_view(closes, p)
+            mid[p - 1:] = windows.mean(axis=1)
+            std[p - 1:] = windows.std(axis=1)
+        committed = closes[:-1][-(p - 1):] if p > 1 else closes[:0]
+        self.window = RollingWindow(p - 1, committed.tolist(), float(closes[0]) if len(closes) else 0.0)
+        return {'mid': mid, 'upper': mid + self.width * std, 'lower': mid - self.width * std}
+
+    def commit(self, close: float):
+        self.window.push(close)
+
+    def peek(self, close: float) -> Tuple[float, ...]:
+        if len(self.window.items) < self.period - 1:
+            return NAN, NAN, NAN
+        mid, std = self.window.stats_with(close)
+        return mid, mid + self.width * std, mid - self.width * std
+
+
+INDICATORS = {'ma': MA, 'ema': EMA, 'rsi': RSI, 'macd': MACD, 'boll': BOLL}
+
+
+def parse_spec(spec: str):
+    """解析指标写法，返回指标实例，格式错误时抛出ValueError"""
+    match = SPEC_PATTERN.match(spec)
+    if not match:
+        raise ValueError(f"不支持的指标: {spec}")
+    params = [float(value) for value in match.group(2).split('_')] if match.group(2) else []
+    cls = INDICATORS[match.group(1)]
+    # 布林带的第二个参数为标准差倍数，其余参数均为周期
+    periods, extra = (params[:1], params[1:]) if cls is BOLL else (params, [])
+    if any(not period.is_integer() or period < 1 or period > MAX_PERIOD for period in periods):
+        raise ValueError(f"指标周期应为1到{MAX_PERIOD}之间的整数: {spec}")
+    try:
+        return cls(*[int(period) for period in periods], *extra)
+    except TypeError:
+        raise ValueError(f"指标参数个数错误: {spec}")
+
+
+class IndicatorTrack:
+    """一个 品种/周期/指标 的状态，以及最近capacity根K线的指标值"""
+
+    def __init__(self, indicator, capacity: int):
+        self.indicator = indicator
+        self.capacity = capacity
+        self.times: List[int] = []
+        self.closes: List[float] = []
+        self.values: Dict[str, List[float]] = {name: [] for name in indicator.outputs}
+        self.stale = True
+
+    def load(self, scores: np.ndarray, closes: np.ndarray):
+        """向量化计算整个序列并重建增量状态"""
+        values = self.indicator.load(closes)
+        self.times = scores.tolist()
+        self.closes = closes.tolist()
+        self.values = {name: values[name].tolist() for name in self.indicator.outputs}
+        self.stale = False
+        self._trim()
+
+    def update(self, score: int, close: float):
+        """按时间顺序处理一根入库的K线"""
+        if self.stale:
+            return
+        if not self.times or score > self.times[-1]:
+            if self.closes:
+                self.indicator.commit(self.closes[-1])
+            self.times.append(score)
+            self.closes.append(close)
+            for name, value in zip(self.indicator.outputs, self.indicator.peek(close)):
+                self.values[name].append(value)
+            self._trim()
+        elif score == self.times[-1]:
+            self.closes[-1] = close
+            for name, value in zip(self.indicator.outputs, self.indicator.peek(close)):
+                self.values[name][-1] = value
+        else:
+            # 较早的K线：未变化（如全量同步重发）时忽略，否则需要重新计算
+            i = bisect_left(self.times, score)
+            if i >= len(self.times) or self.times[i] != score or self.closes[i] != close:
+                self.stale = True
+
+    def _trim(self):
+        excess = len(self.times) - self.capacity
+        if excess > self.capacity:
+            del self.times[:excess]
+            del self.closes[:excess]
+            for values in self.values.values():
+                del values[:excess]
+
+    def lookup(self, scores: np.ndarray) -> Dict[str, List[Optional[float]]]:
+        """按K线时间取指标值，不在保留范围内或尚未形成的值为None"""
+        times = np.asarray(self.times, dtype=np.int64)
+        index = np.searchsorted(times, scores)
+        found = index < len(times)
+        found[found] = times[index[found]] == scores[found]
+        result = {}
+        for name, values in self.values.items():
+            picked = np.where(found, np.asarray(values)[np.minimum(index, len(values) - 1)] if values else NAN, NAN)
+            result[name] = [None if value != value else value for value in picked.tolist()]
+        return result
+
+
+class IndicatorEngine:
+    """所有被请求过的指标，超过max_tracks时淘汰最久未被请求的"""
+
+    def __init__(self, capacity: int = 5000, max_tracks: int = 1000):
+        self.capacity = capacity
+        self.max_tracks = max_tracks
+        self.tracks: 'OrderedDict[Tuple[str, str, str], IndicatorTrack]' = OrderedDict()
+        self.series: Dict[Tuple[str, str], Set[str]] = {}
+        # 每个序列的入库次数，用于发现全量计算期间发生的入库
+        self.generations: Dict[Tuple[str, str], int] = {}
+        self.full_computes = 0
+        self.updates = 0
+
+    def update(self, symbol: str, timeframe: str, bars: List[Dict]):
+        """入库时增量更新该序列的所有指标"""
+        key = (symbol, timeframe)
+        self.generations[key] = self.generations.get(key, 0) + 1
+        specs = self.series.get(key)
+        if not specs or not bars:
+            return
+        scores = parse_scores(bars)
+        order = np.argsort(scores, kind='stable')
+        items = [(int(scores[i]), float(bars[i]['close'])) for i in order]
+        for spec in specs:
+            track = self.tracks[(symbol, timeframe, spec)]
+            for score, close in items:
+                track.update(score, close)
+            self.updates += len(items)
+
+    def get(self, symbol: str, timeframe: str, spec: str) -> Optional[IndicatorTrack]:
+        """已有且无需重新计算的指标"""
+        track = self.tracks.get((symbol, timeframe, spec))
+        if track is None or track.stale:
+            return None
+        self.tracks.move_to_end((symbol, timeframe, spec))
+        return track
+
+    def load(self, symbol: str, timeframe: str, spec: str, bars: List[Dict], generation: int) -> IndicatorTrack:
+        """用完整序列计算指标，generation为读取序列前的入库次数"""
+        key = (symbol, timeframe, spec)
+        track = self.tracks.get(key) or IndicatorTrack(parse_spec(spec), self.capacity)
+        if bars:
+            track.load(parse_scores(bars), np.array([bar['close'] for bar in bars], dtype=np.float64))
+        # 读取期间有新的入库时，本次结果仍可使用，下次请求重新计算
+        if generation != self.generation(symbol, timeframe) or not bars:
+            track.stale = True
+        self.full_computes += 1
+        self.tracks[key] = track
+        self.tracks.move_to_end(key)
+        self.series.setdefault((symbol, timeframe), set()).add(spec)
+        while len(self.tracks) > self.max_tracks:
+            (old_symbol, old_timeframe, old_spec), _ = self.tracks.popitem(last=False)
+            self.series[(old_symbol, old_timeframe)].discard(old_spec)
+        return track
+
+    def invalidate(self, symbol: Optional[str] = None, timeframe: Optional[str] = None):
+        """序列变化未知（如来自其他进程的大批量入库）时标记为需要重新计算，不指定序列时标记全部"""
+        for (track_symbol, track_timeframe, _), track in self.tracks.items():
+            if symbol is None or (track_symbol, track_timeframe) == (symbol, timeframe):
+                track.stale = True
+
+    def generation(self, symbol: str, timeframe: str) -> int:
+        return self.generations.get((symbol, timeframe), 0)
+
+    def stats(self) -> Dict:
+        return {
+            'tracks': len(self.tracks),
+            'full_computes': self.full_computes,
+            'updates': self.updates,
+        }
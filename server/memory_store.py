@@ -0,0 +1,236 @@
+"""内存模式的K线存储
+
+每个品种/周期的K线保存在一个按列存放的环形缓冲区中（时间为int64，开高低收量为float64），
+追加新K线为O(1)，写满容量后覆盖最旧的K线。所有序列共享一个内存预算，
+超出时淘汰最久未被读取的序列。
+"""
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger('candlestick')
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+# 缓冲区初始长度，之后按需倍增直到容量上限
+INITIAL_SIZE = 1024
+
+
+class RingSeries:
+    """一个K线序列的环形缓冲区，逻辑顺序按开盘时间升序"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._allocate(min(capacity, INITIAL_SIZE))
+
+    def _allocate(self, size: int):
+        self.times = np.empty(size, dtype=np.int64)
+        self.columns = {field: np.empty(size, dtype=np.float64) for field in FIELDS}
+        self.start = 0
+        self.count = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.times)
+
+    @property
+    def nbytes(self) -> int:
+        return self.times.nbytes + sum(column.nbytes for column in self.columns.values())
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, lo: int, hi: int) -> np.ndarray:
+        """逻辑下标[lo, hi)对应的物理位置"""
+        return (self.start + np.arange(lo, hi)) % self.size
+
+    def _search(self, score: int, side: str) -> int:
+        """在逻辑顺序上做二分查找，缓冲区回绕时分两段查找"""
+        first = min(self.count, self.size - self.start)
+        head = self.times[self.start:self.start + first]
+        i = int(np.searchsorted(head, score, side))
+        if i < first:
+            return i
+        tail = self.times[:self.count - first]
+        return first + int(np.searchsorted(tail, score, side))
+
+    def last_time(self) -> int:
+        """最新一根K线的时间，序列不能为空"""
+        return int(self.times[(self.start + self.count - 1) % self.size])
+
+    def _linear(self):
+        """按逻辑顺序复制出连续数组"""
+        positions = self._positions(0, self.count)
+        return self.times[positions], {field: column[positions] for field, column in self.columns.items()}
+
+    def _reset(self, times: np.ndarray, columns: Dict[str, np.ndarray]):
+        """用连续数组重建缓冲区，超出容量时只保留最新的部分"""
+        count = min(len(times), self.capacity)
+        self._allocate(min(self.capacity, max(INITIAL_SIZE, count)))
+        self.times[:count] = times[len(times) - count:]
+        for field in FIELDS:
+            self.columns[field][:count] = columns[field][len(times) - count:]
+        self.count = count
+
+    def _grow(self, needed: int):
+        if needed <= self.size or self.size >= self.capacity:
+            return
+        times, columns = self._linear()
+        count = self.count
+        self._allocate(min(self.capacity, max(self.size * 2, needed)))
+        self.times[:count] = times
+        for field in FIELDS:
+            self.columns[field][:count] = columns[field]
+        self.count = count
+
+    def append(self, times: np.ndarray, values: Dict[str, np.ndarray]):
+        """批量追加时间严格递增且晚于现有K线的数据，容量写满时覆盖最旧的K线"""
+        if len(times) > self.capacity:
+            times = times[-self.capacity:]
+            values = {field: column[-self.capacity:] for field, column in values.items()}
+        k = len(times)
+        self._grow(self.count + k)
+        positions = (self.start + self.count + np.arange(k)) % self.size
+        self.times[positions] = times
+        for field in FIELDS:
+            self.columns[field][positions] = values[field]
+        overflow = self.count + k - self.size
+        if overflow > 0:
+            self.start = (self.start + overflow) % self.size
+            self.count = self.size
+        else:
+            self.count += k
+
+    def upsert(self, score: int, row: Dict):
+        """插入或覆盖同一时间的K线，追加到末尾时为O(1)"""
+        if self.count == 0 or score > self.last_time():
+            if self.count == self.size:
+                self._grow(self.count + 1)
+            position = (self.start + self.count) % self.size
+            self.times[position] = score
+            for field in FIELDS:
+                self.columns[field][position] = row[field]
+            if self.count == self.size:
+                self.start = (self.start + 1) % self.size
+            else:
+                self.count += 1
+            return
+        i = self._search(score, 'left')
+        if i < self.count and int(self.times[(self.start + i) % self.size]) == score:
+            position = (self.start + i) % self.size
+            for field in FIELDS:
+                self.columns[field][position] = row[field]
+            return
+        # 插入到中间（乱序补数据），需要重排整个缓冲区
+        times, columns = self._linear()
+        times = np.insert(times, i, score)
+        columns = {field: np.insert(columns[field], i, row[field]) for field in FIELDS}
+        self._reset(times, columns)
+
+    def remove_range(self, start: int, end: int):
+        """删除时间在[start, end]之间的K线"""
+        lo = self._search(start, 'left')
+        hi = self._search(end, 'right')
+        if hi <= lo:
+            return
+        times, columns = self._linear()
+        keep = np.r_[0:lo, hi:self.count]
+        self._reset(times[keep], {field: column[keep] for field, column in columns.items()})
+
+    def trim(self, max_bars: int):
+        """只保留最新的max_bars根K线"""
+        excess = self.count - max_bars
+        if excess > 0:
+            self.start = (self.start + excess) % self.size
+            self.count = max_bars
+
+    def range(self, start: Optional[int], end: Optional[int], limit: int, from_start: bool) -> List[Dict]:
+        """返回时间在[start, end]之间的K线，from_start为False时取最新的limit根"""
+        lo = 0 if start is None else self._search(start, 'left')
+        hi = self.count if end is None else self._search(end, 'right')
+        if from_start:
+            hi = min(hi, lo + limit)
+        else:
+            lo = max(lo, hi - limit)
+        if hi <= lo:
+            return []
+        positions = self._positions(lo, hi)
+        times = np.datetime_as_string(self.times[positions].astype('datetime64[s]')).tolist()
+        columns = [self.columns[field][positions].tolist() for field in FIELDS]
+        return [
+            {'time': t.replace('T', ' '), 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+            for t, o, h, l, c, v in zip(times, *columns)
+        ]
+
+
+class SeriesStore:
+    """所有内存序列及其共享的内存预算"""
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        # 按最近读取排序，最久未读取的在最前
+        self.series: 'OrderedDict[str, RingSeries]' = OrderedDict()
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def upsert(self, key: str, bars: List[Dict], replace: bool, max_bars: int):
+        """写入K线，replace为True时先清除该时间范围内的旧K线"""
+        series = self.series.get(key)
+        # 新建的序列在构造时已分配第一块内存，全部计入预算
+        before = 0 if series is None else series.nbytes
+        if series is None:
+            series = self.series[key] = RingSeries(max_bars)
+
+        # 与bar_score相同：按K线时间本身的时区换算为整数秒
+        scores = np.array([bar['time'] for bar in bars], dtype='datetime64[s]').astype(np.int64)
+        order = np.argsort(scores, kind='stable')
+        scores = scores[order]
+        rows = [bars[i] for i in order]
+        if replace:
+            series.remove_range(int(scores[0]), int(scores[-1]))
+
+        # 晚于已有最后一根的部分批量追加，其余逐根覆盖或插入
+        last = series.last_time() if series.count else None
+        split = 0 if last is None else int(np.searchsorted(scores, last, 'right'))
+        for i in range(split):
+            series.upsert(int(scores[i]), rows[i])
+        new_scores = scores[split:]
+        if len(new_scores):
+            # 同一批中重复的时间只保留最后一根
+            unique = np.r_[new_scores[1:] != new_scores[:-1], True]
+            new_rows = [row for row, keep in zip(rows[split:], unique) if keep]
+            series.append(new_scores[unique], {
+                field: np.array([row[field] for row in new_rows], dtype=np.float64) for field in FIELDS
+            })
+        series.trim(max_bars)
+
+        self.total_bytes += series.nbytes - before
+        self._evict(keep=key)
+
+    def range(self, key: str, start: Optional[int], end: Optional[int], limit: int,
+              from_start: bool) -> List[Dict]:
+        series = self.series.get(key)
+        if series is None:
+            return []
+        self.series.move_to_end(key)
+        return series.range(start, end, limit, from_start)
+
+    def _evict(self, keep: str):
+        """超出内存预算时淘汰最久未读取的序列，不淘汰刚写入的序列"""
+        while self.total_bytes > self.max_bytes:
+            victim = next((key for key in self.series if key != keep), None)
+            if victim is None:
+                break
+            self.total_bytes -= self.series.pop(victim).nbytes
+            self.evictions += 1
+            logger.warning(f"内存超出预算，淘汰序列: {victim}")
+
+    def stats(self) -> Dict:
+        return {
+            'series': len(self.series),
+            'bars': sum(len(series) for series in self.series.values()),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions,
+        }
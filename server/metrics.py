@@ -0,0 +1,122 @@
+"""服务端指标（Prometheus文本格式，由 /metrics 输出）
+
+- 每个接口的请求耗时、请求体和响应体大小（按路由模板区分，不按具体品种）
+- 存储操作的往返耗时（按后端和操作区分）
+- 数据新鲜度各环节的延迟
+
+多工作进程时每个进程有各自的指标，设置环境变量 PROMETHEUS_MULTIPROC_DIR（各进程共用的空目录）后
+指标写入该目录，/metrics 汇总所有工作进程；python app.py 启动多个工作进程时自动设置。
+"""
+import functools
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', '请求处理耗时（至响应发送完毕）', ['method', 'endpoint'],
+    buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter('http_requests_total', '请求数', ['method', 'endpoint', 'status'])
+REQUEST_SIZE = Histogram('http_request_size_bytes', '请求体字节数', ['method', 'endpoint'], buckets=SIZE_BUCKETS)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', '响应体字节数（压缩后）', ['method', 'endpoint'], buckets=SIZE_BUCKETS
+)
+STORE_LATENCY = Histogram(
+    'store_operation_duration_seconds', '存储操作往返耗时', ['backend', 'operation'], buckets=LATENCY_BUCKETS
+)
+INGESTED_BARS = Counter('ingested_bars_total', '入库的K线数', ['timeframe'])
+FRESHNESS_LAG = Histogram(
+    'freshness_lag_seconds', '数据新鲜度各环节延迟（见freshness.py）', ['stage'],
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def render():
+    """返回 (响应体, Content-Type)"""
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def prepare_multiprocess_dir(path: str):
+    """主进程启动工作进程前调用：清空上次运行留下的指标文件并设置环境变量（工作进程继承）"""
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith('.db'):
+            os.remove(os.path.join(path, name))
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = path
+
+
+def worker_exit():
+    """工作进程退出时调用"""
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def timed_store(operation: str):
+    """记录存储异步方法的耗时，用于DataStore及StoreBatch"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                store = getattr(self, 'store', self)
+                STORE_LATENCY.labels('redis' if store.use_redis else 'memory', operation).observe(
+                    time.perf_counter() - start
+                )
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI中间件：记录每个请求的耗时和大小，endpoint为匹配到的路由模板"""
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    def endpoint(self, scope) -> str:
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        state = {'status': 500, 'size': 0}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                state['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                state['size'] += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            method = scope['method']
+            endpoint = self.endpoint(scope)
+            REQUEST_LATENCY.labels(method, endpoint).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, endpoint, str(state['status'])).inc()
+            RESPONSE_SIZE.labels(method, endpoint).observe(state['size'])
+            length = dict(scope['headers']).get(b'content-length')
+            if length:
+                REQUEST_SIZE.labels(method, endpoint).observe(int(length))
@@ -0,0 +1,69 @@
+"""K线实时推送（Server-Sent Events）
+
+每个订阅者对应一个有界队列。入库时每次变化只序列化一次，再把同一条
+SSE消息分发给该品种/周期的所有订阅者；订阅者消费过慢导致队列写满时，
+清空其队列并要求重新发送快照，保证客户端数据不出现缺口。
+"""
+import asyncio
+import json
+from typing import Dict, List, Optional, Set
+
+# 队列写满后放入的标记，流处理函数收到后重新发送快照
+RESYNC = object()
+
+
+def format_event(event: str, payload: Dict) -> str:
+    """格式化为一条SSE消息"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class Broadcaster:
+    """按 symbol/timeframe 分组的订阅管理"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    @staticmethod
+    def channel(symbol: str, timeframe: str) -> str:
+        return f"{symbol}:{timeframe}"
+
+    def subscribe(self, symbol: str, timeframe: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(self.channel(symbol, timeframe), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, symbol: str, timeframe: str, queue: asyncio.Queue):
+        channel = self.channel(symbol, timeframe)
+        queues = self.subscribers.get(channel)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[channel]
+
+    def publish(self, symbol: str, timeframe: str, bars: List[Dict]):
+        """向订阅者推送发生变化的K线，必须在事件循环线程中调用"""
+        queues = self.subscribers.get(self.channel(symbol, timeframe))
+        if not queues or not bars:
+            return
+        message = format_event('update', {'symbol': symbol, 'timeframe': timeframe, 'data': bars})
+        for queue in queues:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+    def resync(self, symbol: Optional[str] = None, timeframe: Optional[str] = None):
+        """变化的K线未知时让订阅者重新获取快照，不指定序列时通知全部订阅者"""
+        channels = [self.channel(symbol, timeframe)] if symbol is not None else list(self.subscribers)
+        for channel in channels:
+            for queue in self.subscribers.get(channel, ()):
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self.subscribers.values())
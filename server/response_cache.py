@@ -0,0 +1,162 @@
+"""K线查询响应缓存
+
+缓存最终的响应字节，命中时直接返回，无需再次读取存储、解析JSON和编码。
+gzip/brotli压缩版本在第一次有客户端接受该编码时在线程中生成并保存，只压缩实际用到的编码。
+按总字节数限制内存，超出时淘汰最久未访问的条目；序列入库时整体失效。
+"""
+import asyncio
+import gzip
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖，未安装时只提供gzip
+    brotli = None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class CachedResponse:
+    """一个响应的原始字节、已生成的压缩版本及ETag等响应头"""
+    __slots__ = ('body', 'encoded', 'headers', 'min_compress_size', 'cache')
+
+    def __init__(self, body: bytes, min_compress_size: int = 512, headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.headers = headers or {}
+        self.min_compress_size = min_compress_size
+        self.encoded: Dict[str, bytes] = {}
+        # 所在的缓存，压缩版本生成后计入其字节数
+        self.cache: Optional['ResponseCache'] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+    def encoding_for(self, accept_encoding: str) -> Optional[str]:
+        """按客户端的 Accept-Encoding 选择编码，较小的响应不压缩"""
+        if len(self.body) < self.min_compress_size:
+            return None
+        accepted = {item.split(';')[0].strip().lower() for item in accept_encoding.split(',')}
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    async def select(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        """返回 (body, content_encoding)，该编码第一次被使用时在线程中压缩并保存"""
+        encoding = self.encoding_for(accept_encoding)
+        if encoding is None:
+            return self.body, None
+        body = self.encoded.get(encoding)
+        if body is None:
+            body = await asyncio.to_thread(compress, self.body, encoding)
+            # 并发请求可能已经生成了同一编码
+            if encoding not in self.encoded:
+                self.encoded[encoding] = body
+                if self.cache is not None:
+                    self.cache.grow(self, len(body))
+        return body, encoding
+
+
+class ResponseCache:
+    """按序列分组的LRU响应缓存"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, min_compress_size: int = 512):
+        self.max_bytes = max_bytes
+        self.min_compress_size = min_compress_size
+        self.entries: 'OrderedDict[Tuple[str, Hashable], CachedResponse]' = OrderedDict()
+        self.series_variants: Dict[str, Set[Hashable]] = {}
+        # 每次失效递增，读取存储期间序列被更新时放弃写入缓存，避免缓存旧数据
+        self.generations: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, series: str, variant: Hashable) -> Optional[CachedResponse]:
+        entry = self.entries.get((series, variant))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end((series, variant))
+        self.hits += 1
+        return entry
+
+    def generation(self, series: str) -> int:
+        return self.generations.get(series, 0)
+
+    def put(self, series: str, variant: Hashable, body: bytes, generation: Optional[int] = None,
+            headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        """写入缓存；generation 与当前不一致（期间已失效）时只返回不缓存"""
+        entry = CachedResponse(body, self.min_compress_size, headers)
+        if generation is not None and generation != self.generation(series):
+            return entry
+        self._remove((series, variant))
+        if entry.size > self.max_bytes:
+            return entry
+        self.entries[(series, variant)] = entry
+        entry.cache = self
+        self.series_variants.setdefault(series, set()).add(variant)
+        self.total_bytes += entry.size
+        self._evict()
+        return entry
+
+    def grow(self, entry: CachedResponse, added: int):
+        """条目生成了新的压缩版本，已被淘汰或失效的条目不再计入"""
+        if entry.cache is not self:
+            return
+        self.total_bytes += added
+        self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            key, _ = next(iter(self.entries.items()))
+            self._remove(key)
+            self.evictions += 1
+
+    def invalidate(self, series: str) -> Set[Hashable]:
+        """删除一个序列的所有缓存条目，返回被删除的变体"""
+        self.generations[series] = self.generation(series) + 1
+        variants = self.series_variants.pop(series, set())
+        for variant in variants:
+            entry = self.entries.pop((series, variant), None)
+            if entry is not None:
+                entry.cache = None
+                self.total_bytes -= entry.size
+        return variants
+
+    def clear(self):
+        """使所有序列失效"""
+        for series in set(self.series_variants) | set(self.generations):
+            self.invalidate(series)
+
+    def _remove(self, key: Tuple[str, Hashable]):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        entry.cache = None
+        self.total_bytes -= entry.size
+        variants = self.series_variants.get(key[0])
+        if variants is not None:
+            variants.discard(key[1])
+            if not variants:
+                del self.series_variants[key[0]]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'brotli': brotli is not None,
+        }
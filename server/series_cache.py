@@ -0,0 +1,92 @@
+"""工作进程本地的热序列缓存
+
+多工作进程共用Redis时，每个进程在本地保存最近被读取的序列的元数据和最新size根K线，
+范围落在缓存内的查询（默认视图、since增量轮询、较小的limit）不再访问Redis。
+本进程入库或收到其他进程的同步消息时失效；读取Redis期间发生失效的结果不写入缓存。
+"""
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from archive import parse_scores
+
+
+class CachedSeries:
+    __slots__ = ('meta', 'bars', 'scores', 'complete')
+
+    def __init__(self, meta: Dict, bars: List[Dict], complete: bool):
+        self.meta = meta
+        self.bars = bars
+        self.scores = parse_scores(bars).tolist() if bars else []
+        # 缓存中是否为热存储中的全部K线
+        self.complete = complete
+
+    def range(self, start: Optional[int], end: Optional[int], limit: int) -> Optional[List[Dict]]:
+        """与DataStore.get_bars相同的范围查询，超出缓存范围时返回None"""
+        hi = len(self.scores) if end is None else bisect_right(self.scores, end)
+        if start is not None:
+            if not self.complete and start < self.scores[0]:
+                return None
+            lo = bisect_left(self.scores, start)
+            return self.bars[lo:min(hi, lo + limit)]
+        if not self.complete and hi < limit:
+            return None
+        return self.bars[max(0, hi - limit):hi]
+
+
+class SeriesCache:
+    """按最近读取淘汰的序列缓存"""
+
+    def __init__(self, size: int = 1000, max_series: int = 1000):
+        self.size = size
+        self.max_series = max_series
+        self.entries: 'OrderedDict[str, CachedSeries]' = OrderedDict()
+        self.generations: Dict[str, int] = {}
+        # 全部失效（如同步连接断开后）时递增
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[CachedSeries]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def generation(self, key: str) -> Tuple[int, int]:
+        return self.epoch, self.generations.get(key, 0)
+
+    def put(self, key: str, meta: Dict, bars: List[Dict], generation: Tuple[int, int]) -> CachedSeries:
+        """写入缓存；generation与当前不一致（读取期间已失效）时只返回不缓存"""
+        entry = CachedSeries(meta, bars, len(bars) < self.size)
+        if generation != self.generation(key):
+            return entry
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_series:
+            self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, key: str):
+        self.generations[key] = self.generations.get(key, 0) + 1
+        if self.entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.epoch += 1
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'series': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
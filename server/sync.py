@@ -0,0 +1,82 @@
+"""多工作进程/多节点同步
+
+多个工作进程（uvicorn --workers 或多个API容器）共用Redis存储，各自在本地缓存序列、响应和指标状态。
+入库的进程通过Redis发布/订阅广播发生变化的序列（数量不多时附带变化的K线），其他进程收到后
+使本地缓存失效、更新指标并推送给各自的订阅者，因此任何进程返回的数据最多落后一次发布的延迟。
+订阅连接断开期间可能错过消息，重新订阅后清空全部本地缓存。
+"""
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable, Dict
+
+
+class ClusterSync:
+    """通过Redis发布/订阅在工作进程之间广播序列变化"""
+
+    def __init__(self, redis_client, channel: str = 'kline:sync'):
+        self.redis = redis_client
+        self.channel = channel
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.connected = False
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+
+    async def publish(self, message: Dict):
+        """广播一条消息，失败时只记录日志（其他进程会在下次入库或重新订阅时更新）"""
+        message['origin'] = self.worker_id
+        try:
+            await self.redis.publish(self.channel, json.dumps(message, ensure_ascii=False))
+            self.published += 1
+        except Exception as e:
+            print(f"发布同步消息失败: {str(e)}")
+
+    async def run(self, handle: Callable[[Dict], Awaitable[None]], resync: Callable[[], Awaitable[None]]):
+        """订阅并处理其他进程的消息；连接断开时退避重连，重新订阅成功后调用resync"""
+        delay = 1.0
+        subscribed_before = False
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                self.connected = True
+                if subscribed_before:
+                    await resync()
+                subscribed_before = True
+                delay = 1.0
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None or message.get('type') != 'message':
+                        continue
+                    payload = json.loads(message['data'])
+                    if payload.get('origin') == self.worker_id:
+                        continue
+                    self.received += 1
+                    try:
+                        await handle(payload)
+                    except Exception as e:
+                        print(f"处理同步消息失败: {str(e)}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"同步订阅断开，{delay:.0f}秒后重连: {str(e)}")
+            finally:
+                self.connected = False
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def stats(self) -> Dict:
+        return {
+            'worker_id': self.worker_id,
+            'channel': self.channel,
+            'connected': self.connected,
+            'published': self.published,
+            'received': self.received,
+            'reconnects': self.reconnects,
+        }
@@ -0,0 +1,159 @@
+"""K线时间工具与多周期聚合
+
+服务端只需接收M1数据，更高周期（M5/M15/M30/H1/H4/D1）由本模块在入库时
+增量合成：每个目标周期只维护当前桶的状态，新的M1 K线到达时O(1)更新。
+"""
+import calendar
+from bisect import bisect_left
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+BAR_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 各周期的秒数，桶按K线时间本身的时区对齐（如D1以北京时间零点为界）
+TIMEFRAME_SECONDS = {
+    'M1': 60,
+    'M5': 300,
+    'M15': 900,
+    'M30': 1800,
+    'H1': 3600,
+    'H4': 14400,
+    'D1': 86400,
+}
+
+
+def bar_score(bar_time: str) -> int:
+    """将K线时间转换为排序用的整数秒（按K线时间本身的时区计算）"""
+    if len(bar_time) == 10:
+        bar_time += ' 00:00:00'
+    return calendar.timegm(datetime.strptime(bar_time, BAR_TIME_FORMAT).timetuple())
+
+
+def format_score(score: int) -> str:
+    """bar_score的逆运算"""
+    return datetime.utcfromtimestamp(score).strftime(BAR_TIME_FORMAT)
+
+
+def combine(aggregate: Optional[Dict], bar: Dict) -> Dict:
+    """把一根较小周期的K线合并进聚合K线"""
+    if aggregate is None:
+        return {
+            'time': bar['time'],
+            'open': bar['open'],
+            'close': bar['close'],
+            'high': bar['high'],
+            'low': bar['low'],
+            'volume': bar['volume'],
+        }
+    return {
+        'time': aggregate['time'],
+        'open': aggregate['open'],
+        'close': bar['close'],
+        'high': max(aggregate['high'], bar['high']),
+        'low': min(aggregate['low'], bar['low']),
+        'volume': aggregate['volume'] + bar['volume'],
+    }
+
+
+class BucketState:
+    """一个目标周期当前桶的聚合状态
+
+    closed 为桶内除最新一根以外所有源K线的聚合结果，latest 为最新一根源K线。
+    最新一根（正在形成的K线）被修订时只需替换 latest，无需回看整个桶。
+    """
+    __slots__ = ('bucket', 'closed', 'latest_score', 'latest')
+
+    def __init__(self, bucket: int):
+        self.bucket = bucket
+        self.closed = None
+        self.latest_score = None
+        self.latest = None
+
+    def add(self, score: int, bar: Dict):
+        if self.latest is not None and score > self.latest_score:
+            self.closed = combine(self.closed, self.latest)
+        self.latest_score = score
+        self.latest = bar
+
+    def bar(self) -> Dict:
+        aggregate = combine(self.closed, self.latest)
+        aggregate['time'] = format_score(self.bucket)
+        return aggregate
+
+
+# 读取源周期K线的异步回调：(symbol, start_score, end_score) -> 按时间排序的K线列表
+SourceLoader = Callable[[str, int, int], Awaitable[List[Dict]]]
+
+
+class TimeframeAggregator:
+    """由源周期K线增量合成多个更高周期"""
+
+    def __init__(self, source: str = 'M1', targets: Iterable[str] = ('M5', 'M15', 'M30', 'H1', 'H4', 'D1')):
+        targets = list(targets)
+        for timeframe in [source] + targets:
+            if timeframe not in TIMEFRAME_SECONDS:
+                raise ValueError(f"不支持的时间周期: {timeframe}")
+        self.source = source
+        self.targets = [tf for tf in targets if TIMEFRAME_SECONDS[tf] > TIMEFRAME_SECONDS[source]]
+        self.states: Dict[Tuple[str, str], BucketState] = {}
+
+    async def update(self, symbol: str, bars: List[Dict], load_source: SourceLoader) -> Dict[str, List[Dict]]:
+        """处理新入库的源K线，返回 {目标周期: 发生变化的聚合K线}
+
+        调用前源K线必须已经写入存储：桶状态缺失或有非最新K线被修订时，需要从存储中重建该桶，
+        所有需要重建的桶合并为一次 load_source 读取。
+        """
+        # 同一时间的K线可能重复出现，只按时间排序，不比较K线本身
+        scored = sorted(((bar_score(bar['time']), bar) for bar in bars), key=lambda item: item[0])
+        plans = []
+        lo = hi = None
+        for timeframe in self.targets:
+            seconds = TIMEFRAME_SECONDS[timeframe]
+            buckets: Dict[int, List[Tuple[int, Dict]]] = {}
+            for score, bar in scored:
+                buckets.setdefault(score - score % seconds, []).append((score, bar))
+            # 按顺序处理各桶时跟踪的桶及其最新K线时间，据此判断哪些桶可以增量更新
+            state = self.states.get((symbol, timeframe))
+            tracked = (state.bucket, state.latest_score) if state is not None else None
+            for bucket, items in buckets.items():
+                rebuild = tracked is None or tracked[0] != bucket or items[0][0] < tracked[1]
+                if tracked is None or bucket >= tracked[0]:
+                    tracked = (bucket, items[-1][0])
+                if rebuild:
+                    lo = bucket if lo is None else min(lo, bucket)
+                    hi = bucket + seconds - 1 if hi is None else max(hi, bucket + seconds - 1)
+                plans.append((timeframe, seconds, bucket, items, rebuild))
+
+        source: List[Tuple[int, Dict]] = []
+        if lo is not None:
+            source = [(bar_score(bar['time']), bar) for bar in await load_source(symbol, lo, hi)]
+        source_scores = [score for score, _ in source]
+
+        changed = {}
+        for timeframe, seconds, bucket, items, rebuild in plans:
+            state = self.states.get((symbol, timeframe))
+            if not rebuild:
+                for score, bar in items:
+                    state.add(score, bar)
+            else:
+                rebuilt = BucketState(bucket)
+                start = bisect_left(source_scores, bucket)
+                end = bisect_left(source_scores, bucket + seconds)
+                for score, bar in source[start:end]:
+                    rebuilt.add(score, bar)
+                if rebuilt.latest is None:
+                    continue
+                # 只跟踪最新的桶，历史桶的修订直接重算
+                if state is None or bucket >= state.bucket:
+                    self.states[(symbol, timeframe)] = rebuilt
+                state = rebuilt
+            changed.setdefault(timeframe, []).append(state.bar())
+        return changed
+
+    def forget(self, symbol: Optional[str] = None):
+        """丢弃桶状态（源K线可能由其他进程写入），下次入库时从存储重建，不指定品种时丢弃全部"""
+        if symbol is None:
+            self.states.clear()
+            return
+        for key in [key for key in self.states if key[0] == symbol]:
+            del self.states[key]
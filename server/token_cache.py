@@ -0,0 +1,81 @@
+"""已验证JWT的缓存
+
+同一批客户端令牌（网页、采集端、电视端）几乎承担了全部请求，缓存验证结果后
+命中时无需再做HMAC校验和模型构建。条目在令牌的exp或缓存TTL到期时失效（取较早者），
+超出容量时淘汰最久未使用的条目。吊销检查（deny hook）在每次请求时执行，
+不受缓存影响，吊销立即生效。
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 吊销检查：(token, 解码后的令牌数据) -> 是否拒绝
+DenyHook = Callable[[str, Any], bool]
+
+
+class TokenCache:
+    """按令牌字符串缓存验证结果的LRU缓存，只在事件循环线程中使用"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+        self.deny_hooks: List[DenyHook] = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.denied = 0
+
+    def get(self, token: str) -> Optional[Any]:
+        entry = self.entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        data, expires_at = entry
+        if time.time() >= expires_at:
+            del self.entries[token]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(token)
+        self.hits += 1
+        return data
+
+    def put(self, token: str, data: Any, exp: float):
+        """缓存验证通过的令牌，exp为令牌自身的过期时间（Unix时间戳）"""
+        if self.max_size <= 0:
+            return
+        self.entries[token] = (data, min(exp, time.time() + self.ttl))
+        self.entries.move_to_end(token)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, token: Optional[str] = None):
+        """删除指定令牌的缓存，不指定时清空"""
+        if token is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(token, None)
+
+    def add_deny_hook(self, hook: DenyHook):
+        self.deny_hooks.append(hook)
+
+    def is_denied(self, token: str, data: Any) -> bool:
+        for hook in self.deny_hooks:
+            if hook(token, data):
+                self.denied += 1
+                return True
+        return False
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'denied': self.denied,
+        }
@@ -1,7 +1,24 @@
+// 合并增量K线：同一时间的K线覆盖，新K线追加，最多保留maxBars根
+export function mergeBars(list, bars, maxBars) {
+    for (const bar of bars) {
+        const last = list.length ? list[list.length - 1] : null;
+        if (!last || bar.time > last.time) {
+            list.push(bar);
+        } else {
+            const index = list.findIndex(item => item.time === bar.time);
+            if (index >= 0) list[index] = bar;
+        }
+    }
+    if (list.length > maxBars) list.splice(0, list.length - maxBars);
+    return list;
+}
+
 export class ApiClient {
     constructor(config) {
         this.baseUrl = config.baseUrl;
         this.token = config.token;
+        // 增量轮询的状态：symbol/timeframe -> { etag, data }
+        this.klineState = new Map();
     }
 
     async request(endpoint, options = {}) {
@@ -29,11 +46,83 @@ export class ApiClient {
         }
     }
 
+    // 获取访问令牌，之后的请求和推送订阅都使用该令牌
+    async authenticate(clientId) {
+        const response = await fetch(`${this.baseUrl}/token?client_id=${encodeURIComponent(clientId)}`, {
+            method: 'POST'
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        this.token = (await response.json()).access_token;
+        return this.token;
+    }
+
     async getSymbols() {
         return await this.request('/symbols');
     }
 
-    async getKlineData(symbol, timeframe) {
-        return await this.request(`/kline/${symbol}/${timeframe}`);
+    // options: { from, to, limit, maxPoints, indicators }，maxPoints 为屏幕可显示的K线数，
+    // 范围内K线更多时由服务端合并相邻K线；indicators 为指标数组（如 ['ma20', 'rsi14']），由服务端计算
+    async getKlineData(symbol, timeframe, options = {}) {
+        const params = new URLSearchParams();
+        if (options.from) params.set('from', options.from);
+        if (options.to) params.set('to', options.to);
+        if (options.limit) params.set('limit', options.limit);
+        if (options.maxPoints) params.set('max_points', options.maxPoints);
+        if (options.indicators && options.indicators.length) params.set('indicators', options.indicators.join(','));
+        const query = params.toString();
+        return await this.request(`/kline/${symbol}/${timeframe}${query ? `?${query}` : ''}`);
+    }
+
+    // 增量轮询K线：首次获取完整序列，之后只请求最后一根K线及之后的部分，
+    // 并带上ETag，数据未变化时服务端返回304。返回合并后的完整序列
+    async pollKlineData(symbol, timeframe, maxBars = 300) {
+        const key = `${symbol}/${timeframe}`;
+        const state = this.klineState.get(key);
+        const last = state && state.data.data.length ? state.data.data[state.data.data.length - 1] : null;
+        let url = `${this.baseUrl}/kline/${symbol}/${timeframe}`;
+        const headers = {
+            'Accept': 'application/json',
+            'Authorization': `Bearer ${this.token}`
+        };
+        if (last) {
+            url += `?since=${encodeURIComponent(last.time)}`;
+            headers['If-None-Match'] = state.etag;
+        }
+
+        const response = await fetch(url, { headers });
+        if (response.status === 304) return state.data;
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const result = await response.json();
+        const etag = response.headers.get('ETag');
+        if (!last) {
+            this.klineState.set(key, { etag, data: result });
+            return result;
+        }
+
+        mergeBars(state.data.data, result.data, maxBars);
+        state.etag = etag;
+        return state.data;
+    }
+
+    // 清除增量轮询的状态，下次轮询重新获取完整序列
+    resetKline(symbol, timeframe) {
+        this.klineState.delete(`${symbol}/${timeframe}`);
+    }
+
+    // 订阅K线实时推送：onSnapshot收到完整序列，onUpdate只收到发生变化的K线
+    subscribeKline(symbol, timeframe, { onSnapshot, onUpdate, onError } = {}) {
+        const url = `${this.baseUrl}/stream/${symbol}/${timeframe}?token=${encodeURIComponent(this.token)}`;
+        const source = new EventSource(url);
+        source.addEventListener('snapshot', event => onSnapshot && onSnapshot(JSON.parse(event.data)));
+        source.addEventListener('update', event => onUpdate && onUpdate(JSON.parse(event.data)));
+        source.onerror = error => {
+            console.error('K线推送连接异常:', error);
+            if (onError) onError(error, source);
+        };
+        return source;
     }
 } 
\ No newline at end of file
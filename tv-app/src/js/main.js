@@ -1 +1,136 @@
- 
\ No newline at end of file
+import { ApiClient, mergeBars } from './api-client.js';
+import { ChartManager } from './chart-manager.js';
+import { TVNavigation } from './tv-navigation.js';
+
+const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || '/api/v1';
+// 图表最多显示的K线数（与K线数量输入框的max一致）
+const MAX_BARS = 200;
+// 推送不可用时的轮询间隔，以及改为轮询后重新尝试推送的间隔（毫秒）
+const POLL_INTERVAL = 5000;
+const RESUBSCRIBE_INTERVAL = 60000;
+
+const api = new ApiClient({ baseUrl: API_BASE_URL, token: null });
+const chart = new ChartManager('chart-container');
+const navigation = new TVNavigation();
+
+const symbolSelect = document.getElementById('symbol-select');
+const timeframeSelect = document.getElementById('timeframe-select');
+const countInput = document.getElementById('kline-count');
+const randomCount = document.getElementById('random-count');
+
+// 当前订阅：推送连接、轮询定时器和已收到的K线
+const feed = { symbol: null, timeframe: null, data: null, source: null, pollTimer: null, retryTimer: null };
+
+function barCount() {
+    const min = Number(countInput.min);
+    const max = Number(countInput.max);
+    if (randomCount.checked) {
+        return min + Math.floor(Math.random() * (max - min + 1));
+    }
+    return Math.min(max, Math.max(min, Number(countInput.value) || max));
+}
+
+function render() {
+    if (!feed.data) return;
+    const count = barCount();
+    chart.updateChart(feed.data.slice(-count), { symbol: feed.symbol, timeframe: feed.timeframe, count });
+}
+
+function stopFeed() {
+    if (feed.source) feed.source.close();
+    clearInterval(feed.pollTimer);
+    clearTimeout(feed.retryTimer);
+    feed.source = null;
+    feed.pollTimer = null;
+    feed.retryTimer = null;
+}
+
+// 轮询：只请求最后一根K线及之后的部分，数据未变化时服务端返回304
+async function poll() {
+    const { symbol, timeframe } = feed;
+    try {
+        const result = await api.pollKlineData(symbol, timeframe, MAX_BARS);
+        if (symbol !== feed.symbol || timeframe !== feed.timeframe) return;
+        feed.data = result.data;
+        render();
+    } catch (error) {
+        console.error('轮询K线失败:', error);
+    }
+}
+
+function startPolling() {
+    stopFeed();
+    api.resetKline(feed.symbol, feed.timeframe);
+    poll();
+    feed.pollTimer = setInterval(poll, POLL_INTERVAL);
+    feed.retryTimer = setTimeout(subscribe, RESUBSCRIBE_INTERVAL);
+}
+
+// 实时推送：先收到完整快照，之后只收到发生变化的K线；连接被关闭（如令牌失效）时改为轮询
+function subscribe() {
+    stopFeed();
+    const source = api.subscribeKline(feed.symbol, feed.timeframe, {
+        onSnapshot: snapshot => {
+            feed.data = snapshot.data.slice(-MAX_BARS);
+            render();
+        },
+        onUpdate: update => {
+            if (!feed.data) return;
+            mergeBars(feed.data, update.data, MAX_BARS);
+            render();
+        },
+        onError: (error, eventSource) => {
+            // 网络中断时EventSource会自动重连
+            if (eventSource.readyState !== EventSource.CLOSED || feed.source !== eventSource) return;
+            api.authenticate('tv_app').catch(() => {}).finally(() => {
+                if (feed.source === eventSource) startPolling();
+            });
+        }
+    });
+    feed.source = source;
+}
+
+function showKline() {
+    stopFeed();
+    feed.symbol = symbolSelect.value;
+    feed.timeframe = timeframeSelect.value;
+    feed.data = null;
+    if (!feed.symbol) return;
+    if (window.EventSource) {
+        subscribe();
+    } else {
+        startPolling();
+    }
+}
+
+async function init() {
+    await api.authenticate('tv_app');
+    const symbols = await api.getSymbols();
+    for (const symbol of symbols.sort()) {
+        const option = document.createElement('option');
+        option.value = symbol;
+        option.textContent = symbol;
+        symbolSelect.appendChild(option);
+    }
+    if (symbols.length) symbolSelect.value = symbols[0];
+
+    symbolSelect.addEventListener('change', showKline);
+    timeframeSelect.addEventListener('change', showKline);
+    countInput.addEventListener('change', render);
+    randomCount.addEventListener('change', render);
+    document.addEventListener('keydown', event => {
+        // 下拉框和数字输入框中上下键用于调整取值，只用左右键切换焦点
+        const element = document.activeElement;
+        const adjustable = element.tagName === 'SELECT' || element.type === 'number';
+        const vertical = event.key === 'ArrowUp' || event.key === 'ArrowDown';
+        if (event.key.startsWith('Arrow') && !(adjustable && vertical)) {
+            event.preventDefault();
+            navigation.handleNavigation(event.key);
+        } else if (event.key === 'Enter') {
+            navigation.handleSelect();
+        }
+    });
+    showKline();
+}
+
+init().catch(error => console.error('初始化失败:', error));